@@ -1,71 +1,392 @@
 import asyncio
+import json
 import logging
 import os
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 
-from app.schemas.run import ModelsResponse, RunRequest, RunResponse, RunState, StepState
-from app.services.ollama_client import OllamaClient
-from app.services.pipeline import run_pipeline
-from app.services.run_store import add_run, get_run
+from app.schemas.run import (
+    BackendStats,
+    BatchRequest,
+    BatchResponse,
+    BatchState,
+    CacheStats,
+    ModelInfo,
+    ModelsResponse,
+    RunRequest,
+    RunResponse,
+    RunState,
+    SchedulerStats,
+    WarmRequest,
+)
+from app.services.metrics import RUNS_DEDUPLICATED
+from app.services.model_catalog import ModelCatalog
+from app.services.model_residency import ModelResidency
+from app.services.ollama_pool import OllamaPool
+from app.services.batch import create_batch, get_batch
+from app.services.pipeline import new_run_state
+from app.services.run_events import subscribe, unsubscribe
+from app.services.run_store import (
+    add_run,
+    get_run,
+    load_request,
+    poll_run_events,
+    save_request,
+)
+from app.services.run_tasks import (
+    RUN_MODE,
+    admit_run,
+    claim_run,
+    release_claim,
+    request_cancel,
+    run_in_progress,
+    start_run,
+)
+from app.services.scheduler import LLMScheduler, QueueFullError
+from app.storage.step_cache import get_step_cache
 
 router = APIRouter()
 logger = logging.getLogger("app.routes")
 
+STREAMED_STEPS = ("step4", "step5")
+TERMINAL_STATUSES = ("done", "failed", "canceled")
+STATE_EVENT_TYPES = ("snapshot", "run", "step", "end")
+SSE_KEEPALIVE_S = 15.0
+
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def get_ollama_client(http_request: Request) -> OllamaPool:
+    return http_request.app.state.ollama
+
+
+def get_model_catalog(http_request: Request) -> ModelCatalog:
+    return http_request.app.state.models
+
+
+def get_residency(http_request: Request) -> ModelResidency:
+    return http_request.app.state.residency
+
+
+def model_info(entry: dict, residency: ModelResidency) -> ModelInfo:
+    state = residency.state(entry["name"])
+    return ModelInfo(
+        **entry,
+        load_state=state.state,
+        expires_at=state.expires_at,
+        load_ms=state.load_ms,
+        load_error=state.error,
+    )
+
+
+def get_scheduler(http_request: Request) -> LLMScheduler:
+    return http_request.app.state.scheduler
+
 
 @router.post("/run", response_model=RunResponse)
-async def create_run(request: RunRequest) -> RunResponse:
+async def create_run(
+    request: RunRequest,
+    scheduler: LLMScheduler = Depends(get_scheduler),
+) -> RunResponse:
     run_id = str(uuid4())
-    steps = {
-        "step1": StepState(),
-        "step2": StepState(),
-        "step3": StepState(),
-        "step4": StepState(),
-        "step5": StepState(),
-        "step6": StepState(),
-    }
-    run_state = RunState(run_id=run_id, steps=steps)
-    await add_run(run_state)
+    existing_id = await claim_run(run_id, request)
+    if existing_id is not None:
+        RUNS_DEDUPLICATED.inc()
+        logger.info("run_deduplicated run_id=%s model=%s", existing_id, request.model)
+        return RunResponse(run_id=existing_id, deduplicated=True)
+    try:
+        await admit_run(run_id, request, scheduler)
+    except QueueFullError as exc:
+        release_claim(run_id, request)
+        raise HTTPException(
+            status_code=429,
+            detail=str(exc),
+            headers={"Retry-After": "5"},
+        ) from exc
+
+    await add_run(new_run_state(run_id))
+    await save_request(run_id, request)
 
     logger.info(
-        "run_created run_id=%s model=%s judge_strictness=%s max_retries=%s question_len=%s jd_len=%s resume_len=%s",
+        "run_created run_id=%s model=%s judge_strictness=%s max_retries=%s bypass_cache=%s question_len=%s jd_len=%s resume_len=%s",
         run_id,
         request.model,
         request.judge_strictness,
         request.max_retries,
+        request.bypass_cache,
         len(request.question),
         len(request.jd_text),
         len(request.resume_text),
     )
 
-    asyncio.create_task(run_pipeline(run_id, request))
+    await start_run(run_id, request, scheduler)
     return RunResponse(run_id=run_id)
 
 
-@router.get("/run/{run_id}", response_model=RunState)
-async def get_run_state(run_id: str) -> RunState:
+@router.post("/batch", response_model=BatchResponse)
+async def create_batch_run(
+    request: BatchRequest,
+    scheduler: LLMScheduler = Depends(get_scheduler),
+) -> BatchResponse:
+    # Batches run in the API process and keep their state there, which would
+    # bypass the workers and be invisible to other API replicas.
+    if RUN_MODE == "queue":
+        raise HTTPException(
+            status_code=409,
+            detail="Batches are not available with RUN_MODE=queue; submit each question to /api/run",
+        )
+    try:
+        record = await create_batch(request, scheduler)
+    except QueueFullError as exc:
+        raise HTTPException(
+            status_code=429,
+            detail=str(exc),
+            headers={"Retry-After": "5"},
+        ) from exc
+    return BatchResponse(
+        batch_id=record.batch_id,
+        analysis_run_id=record.analysis_run_id,
+        run_ids=record.run_ids,
+    )
+
+
+@router.get("/batch/{batch_id}", response_model=BatchState)
+async def get_batch_state(batch_id: str) -> BatchState:
+    batch = await get_batch(batch_id)
+    if not batch:
+        logger.info("batch_not_found batch_id=%s", batch_id)
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+
+@router.get("/run/{run_id}")
+async def get_run_state(
+    run_id: str,
+    fields: Optional[str] = Query(default=None),
+    include_history: bool = True,
+) -> Dict[str, Any]:
     run = await get_run(run_id)
     if not run:
         logger.info("run_not_found run_id=%s", run_id)
         raise HTTPException(status_code=404, detail="Run not found")
-    return run
+    include = None
+    if fields:
+        include = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = include - RunState.model_fields.keys()
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown run fields: {', '.join(sorted(unknown))}",
+            )
+        include.add("run_id")
+    exclude = None if include_history else {"attempt_history"}
+    return run.model_dump(mode="json", include=include, exclude=exclude)
+
+
+@router.post("/run/{run_id}/resume", response_model=RunResponse)
+async def resume_run(
+    run_id: str,
+    scheduler: LLMScheduler = Depends(get_scheduler),
+) -> RunResponse:
+    run = await get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.status == "done":
+        raise HTTPException(status_code=409, detail="Run already finished")
+    if await run_in_progress(run_id):
+        raise HTTPException(status_code=409, detail="Run is already in progress")
+    request = await load_request(run_id)
+    if request is None:
+        raise HTTPException(status_code=409, detail="Run request was not saved; cannot resume")
+    try:
+        await admit_run(run_id, request, scheduler)
+    except QueueFullError as exc:
+        raise HTTPException(
+            status_code=429,
+            detail=str(exc),
+            headers={"Retry-After": "5"},
+        ) from exc
+
+    logger.info("run_resume_requested run_id=%s status=%s", run_id, run.status)
+    await start_run(run_id, request, scheduler, resume=True)
+    return RunResponse(run_id=run_id)
+
+
+@router.post("/run/{run_id}/cancel", response_model=RunState)
+async def cancel_run_request(run_id: str) -> RunState:
+    run = await get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.status in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Run already {run.status}")
+    await request_cancel(run_id)
+    return await get_run(run_id)
+
+
+@router.get("/run/{run_id}/stream")
+async def stream_run_tokens(run_id: str) -> StreamingResponse:
+    run = await get_run(run_id)
+    if not run:
+        logger.info("run_not_found run_id=%s", run_id)
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    initial = [
+        {"type": "token", "step": name, "delta": run.steps[name].output_text}
+        for name in STREAMED_STEPS
+        if run.steps[name].status == "running" and run.steps[name].output_text
+    ]
+    finished = run.status in TERMINAL_STATUSES
+    if finished:
+        initial.append({"type": "end", "status": run.status})
+
+    async def poll():
+        for event in initial:
+            yield json.dumps(event) + "\n"
+        if finished:
+            return
+        async for event in poll_run_events(run, STREAMED_STEPS):
+            if event["type"] != "snapshot":
+                yield json.dumps(event) + "\n"
+
+    if RUN_MODE == "queue":
+        return StreamingResponse(poll(), media_type="application/x-ndjson")
+
+    queue = subscribe(run_id)
+
+    async def relay():
+        try:
+            for event in initial:
+                yield json.dumps(event) + "\n"
+            if finished:
+                return
+            while True:
+                event = await queue.get()
+                yield json.dumps(event) + "\n"
+                if event["type"] == "end":
+                    return
+        finally:
+            unsubscribe(run_id, queue)
+
+    return StreamingResponse(relay(), media_type="application/x-ndjson")
+
+
+@router.get("/run/{run_id}/events")
+async def stream_run_events(run_id: str) -> StreamingResponse:
+    run = await get_run(run_id)
+    if not run:
+        logger.info("run_not_found run_id=%s", run_id)
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    snapshot = {
+        "type": "snapshot",
+        "run": run.model_dump(mode="json", exclude={"attempt_history"}),
+    }
+    finished = run.status in TERMINAL_STATUSES
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    async def poll():
+        yield format_sse(snapshot)
+        if finished:
+            yield format_sse({"type": "end", "status": run.status})
+            return
+        async for event in poll_run_events(run, keepalive_s=SSE_KEEPALIVE_S):
+            if event["type"] == "keepalive":
+                yield ": keepalive\n\n"
+            elif event["type"] in STATE_EVENT_TYPES:
+                yield format_sse(event)
+
+    if RUN_MODE == "queue":
+        return StreamingResponse(poll(), media_type="text/event-stream", headers=headers)
+
+    queue = subscribe(run_id)
+
+    async def relay():
+        try:
+            yield format_sse(snapshot)
+            if finished:
+                yield format_sse({"type": "end", "status": run.status})
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event["type"] not in STATE_EVENT_TYPES:
+                    continue
+                yield format_sse(event)
+                if event["type"] == "end":
+                    return
+        finally:
+            unsubscribe(run_id, queue)
+
+    return StreamingResponse(relay(), media_type="text/event-stream", headers=headers)
 
 
 @router.get("/models", response_model=ModelsResponse)
-async def list_models() -> ModelsResponse:
+async def list_models(
+    refresh: bool = False,
+    catalog: ModelCatalog = Depends(get_model_catalog),
+    residency: ModelResidency = Depends(get_residency),
+) -> ModelsResponse:
     env_models = os.getenv("OLLAMA_MODELS")
     if env_models:
         models = [m.strip() for m in env_models.split(",") if m.strip()]
         logger.info("models_from_env count=%s", len(models))
-        return ModelsResponse(models=models)
+        return ModelsResponse(
+            models=models,
+            details=[model_info({"name": m}, residency) for m in models],
+        )
 
-    client = OllamaClient()
-    try:
-        models = await client.list_models()
-        logger.info("models_from_ollama count=%s", len(models))
-        return ModelsResponse(models=models)
-    except Exception as exc:
-        logger.exception("models_error error=%s", exc)
-        return ModelsResponse(models=[], error=str(exc))
+    listing = await catalog.get(force=refresh)
+    return ModelsResponse(
+        models=[entry["name"] for entry in listing.models],
+        details=[model_info(entry, residency) for entry in listing.models],
+        fetched_at=listing.fetched_at,
+        stale=listing.stale,
+        error=listing.error,
+    )
+
+
+@router.post("/models/warm", response_model=ModelInfo)
+async def warm_model_request(
+    request: WarmRequest,
+    catalog: ModelCatalog = Depends(get_model_catalog),
+    residency: ModelResidency = Depends(get_residency),
+) -> ModelInfo:
+    listing = await catalog.get()
+    entry = next((entry for entry in listing.models if entry["name"] == request.model), None)
+    if entry is None:
+        if not listing.models and listing.error:
+            raise HTTPException(status_code=503, detail=f"Model list unavailable: {listing.error}")
+        raise HTTPException(status_code=404, detail="Model not found")
+    residency.warm(request.model)
+    logger.info("model_warm_requested model=%s", request.model)
+    return model_info(entry, residency)
+
+
+@router.get("/cache/stats", response_model=CacheStats)
+async def cache_stats() -> CacheStats:
+    cache = get_step_cache()
+    if cache is None:
+        return CacheStats(enabled=False)
+    return CacheStats(**cache.stats())
+
+
+@router.get("/scheduler/stats", response_model=SchedulerStats)
+async def scheduler_stats(
+    scheduler: LLMScheduler = Depends(get_scheduler),
+) -> SchedulerStats:
+    return SchedulerStats(**scheduler.stats())
+
+
+@router.get("/backends", response_model=List[BackendStats])
+async def backend_stats(
+    client: OllamaPool = Depends(get_ollama_client),
+) -> List[BackendStats]:
+    return [BackendStats(**entry) for entry in client.stats()]
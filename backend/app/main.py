@@ -1,12 +1,23 @@
 import logging
 import os
 import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.staticfiles import StaticFiles
 
 from app.api.routes import router as api_router
+from app.services.metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, REGISTRY
+from app.services.model_catalog import ModelCatalog
+from app.services.model_residency import ModelResidency
+from app.services.ollama_pool import OllamaPool
+from app.services.prompt_loader import load_prompts
+from app.services.run_store import close_run_store, open_run_store
+from app.services.run_tasks import RUN_MODE, resume_unfinished_runs, suspend_runs
+from app.services.scheduler import LLMScheduler
+from app.storage.job_queue import close_job_queue, open_job_queue
+from app.storage.step_cache import close_step_cache, open_step_cache
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(
@@ -15,7 +26,43 @@ logging.basicConfig(
 )
 logger = logging.getLogger("app")
 
-app = FastAPI(title="LocalForge Coach API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    queue_mode = RUN_MODE == "queue"
+    if queue_mode and os.getenv("RUN_STORE_BACKEND") != "sqlite":
+        raise RuntimeError("RUN_MODE=queue requires RUN_STORE_BACKEND=sqlite")
+    load_prompts()
+    app.state.ollama = OllamaPool.from_env()
+    await app.state.ollama.start()
+    logger.info("ollama_client_started base_urls=%s", ",".join(app.state.ollama.base_urls))
+    app.state.scheduler = LLMScheduler.from_env(app.state.ollama)
+    app.state.models = ModelCatalog.from_env(app.state.ollama)
+    app.state.models.start()
+    app.state.residency = ModelResidency.from_env(app.state.ollama)
+    app.state.residency.start()
+    app.state.scheduler.residency = app.state.residency
+    open_step_cache()
+    await open_run_store(read_through=queue_mode)
+    if queue_mode:
+        open_job_queue()
+    else:
+        await resume_unfinished_runs(app.state.scheduler)
+    logger.info("run_mode mode=%s", RUN_MODE)
+    try:
+        yield
+    finally:
+        await suspend_runs()
+        await app.state.models.aclose()
+        await app.state.residency.aclose()
+        await close_run_store()
+        close_job_queue()
+        close_step_cache()
+        await app.state.ollama.aclose()
+        logger.info("ollama_client_closed")
+
+
+app = FastAPI(title="LocalForge Coach API", lifespan=lifespan)
 app.include_router(api_router, prefix="/api")
 
 
@@ -34,6 +81,12 @@ async def log_requests(request: Request, call_next):
         )
         raise
     duration_ms = (time.monotonic() - start) * 1000
+    HTTP_REQUEST_SECONDS.observe(
+        duration_ms / 1000,
+        method=request.method,
+        route=getattr(request.scope.get("route"), "path", None) or "unmatched",
+        status=response.status_code,
+    )
     logger.info(
         "request method=%s path=%s status=%s duration_ms=%.2f",
         request.method,
@@ -49,6 +102,11 @@ async def healthz() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics() -> Response:
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 ROOT_DIR = Path(__file__).resolve().parents[2]
 FRONTEND_DIR = ROOT_DIR / "frontend"
 if FRONTEND_DIR.exists():
@@ -13,6 +13,29 @@ class RunRequest(BaseModel):
     model: str
     judge_strictness: int = Field(default=3, ge=1, le=5)
     max_retries: int = Field(default=2, ge=0, le=5)
+    bypass_cache: bool = False
+    priority: int = Field(default=0, ge=0, le=9)
+    candidates: int = Field(default=1, ge=1, le=8)
+
+
+class StepMetrics(BaseModel):
+    calls: int = 0
+    prompt_tokens_est: int = 0
+    prompt_tokens_saved: int = 0
+    prompt_eval_count: int = 0
+    prompt_eval_ms: float = 0.0
+    eval_count: int = 0
+    eval_ms: float = 0.0
+    load_ms: float = 0.0
+    prompt_tokens_reused_est: int = 0
+    prefill_ms_saved_est: float = 0.0
+    queue_ms: float = 0.0
+    duration_ms: float = 0.0
+    coalesced_calls: int = 0
+    timeout_s: float = 0.0
+    retries: int = 0
+    hedged_calls: int = 0
+    hedge_wins: int = 0
 
 
 class StepState(BaseModel):
@@ -20,6 +43,7 @@ class StepState(BaseModel):
     output_json: Optional[Dict[str, Any]] = None
     output_text: Optional[str] = None
     error: Optional[str] = None
+    metrics: Optional[StepMetrics] = None
 
 
 class JudgeReport(BaseModel):
@@ -27,31 +51,145 @@ class JudgeReport(BaseModel):
     reasons: List[str] = Field(default_factory=list)
     fixes: List[str] = Field(default_factory=list)
     raw_text: Optional[str] = None
+    prejudge: Optional[Dict[str, Any]] = None
 
 
 class AttemptSummary(BaseModel):
     attempt: int
     steps: Dict[str, StepState]
+    reused_steps: List[str] = Field(default_factory=list)
     final_output: Optional[str] = None
     judge_report: Optional[JudgeReport] = None
 
 
+class CandidateSummary(BaseModel):
+    index: int
+    temperature: float
+    seed: int
+    status: Literal["running", "done", "failed"] = "running"
+    score: Optional[float] = None
+    selected: bool = False
+    final_output: Optional[str] = None
+    error: Optional[str] = None
+
+
 class RunState(BaseModel):
     run_id: str
     status: Literal["queued", "running", "done", "failed", "canceled"] = "queued"
     current_step: Optional[int] = None
+    queue_position: Optional[int] = None
     attempt: int = 1
     steps: Dict[str, StepState]
     final_output: Optional[str] = None
     judge_report: Optional[JudgeReport] = None
     attempt_history: List[AttemptSummary] = Field(default_factory=list)
+    candidates: List[CandidateSummary] = Field(default_factory=list)
     error: Optional[str] = None
 
 
 class RunResponse(BaseModel):
     run_id: str
+    deduplicated: bool = False
+
+
+class ModelInfo(BaseModel):
+    name: str
+    size: Optional[int] = None
+    modified_at: Optional[str] = None
+    family: Optional[str] = None
+    parameter_size: Optional[str] = None
+    quantization_level: Optional[str] = None
+    backends: List[str] = Field(default_factory=list)
+    load_state: Literal["cold", "loading", "loaded"] = "cold"
+    expires_at: Optional[str] = None
+    load_ms: Optional[float] = None
+    load_error: Optional[str] = None
+
+
+class WarmRequest(BaseModel):
+    model: str
 
 
 class ModelsResponse(BaseModel):
     models: List[str]
+    details: List[ModelInfo] = Field(default_factory=list)
+    fetched_at: Optional[float] = None
+    stale: bool = False
+    error: Optional[str] = None
+
+
+class CacheStats(BaseModel):
+    enabled: bool
+    hits: int = 0
+    misses: int = 0
+    hit_ratio: float = 0.0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+    max_entries: Optional[int] = None
+    max_bytes: Optional[int] = None
+    ttl_s: Optional[float] = None
+
+
+class ModelQueueStats(BaseModel):
+    in_flight: int
+    limit: int
+    waiting: int
+
+
+class SchedulerStats(BaseModel):
+    active_runs: int
+    max_queued_runs: int
+    models: Dict[str, ModelQueueStats] = Field(default_factory=dict)
+
+
+class BackendStats(BaseModel):
+    url: str
+    healthy: bool
+    available: bool
+    outstanding: int
+    requests: int
+    failures: int
+    circuit: Literal["closed", "open", "half_open"] = "closed"
+    circuit_opens: int = 0
+    models: List[str] = Field(default_factory=list)
+
+
+class BatchRequest(BaseModel):
+    questions: List[str] = Field(min_length=1, max_length=100)
+    jd_text: str
+    resume_text: str
+    custom_prompt_text: Optional[str] = None
+    model: str
+    judge_strictness: int = Field(default=3, ge=1, le=5)
+    max_retries: int = Field(default=2, ge=0, le=5)
+    bypass_cache: bool = False
+    priority: int = Field(default=0, ge=0, le=9)
+    candidates: int = Field(default=1, ge=1, le=8)
+    concurrency: int = Field(default=4, ge=1, le=16)
+
+
+class BatchItem(BaseModel):
+    question: str
+    run_id: str
+    status: str
+    final_output: Optional[str] = None
+    score: Optional[float] = None
     error: Optional[str] = None
+
+
+class BatchState(BaseModel):
+    batch_id: str
+    status: Literal["queued", "running", "done", "failed"] = "queued"
+    analysis_run_id: str
+    total: int
+    completed: int = 0
+    failed: int = 0
+    items: List[BatchItem] = Field(default_factory=list)
+    error: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    batch_id: str
+    analysis_run_id: str
+    run_ids: List[str]
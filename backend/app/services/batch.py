@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from app.schemas.run import BatchItem, BatchRequest, BatchState, RunRequest, StepState
+from app.services.pipeline import finish_run, new_run_state, run_pipeline, run_steps
+from app.services.run_store import (
+    TERMINAL_STATUSES,
+    add_run,
+    get_run,
+    save_request,
+    update_run,
+    update_step,
+)
+from app.services.run_tasks import hold_runs, is_active, release_held, track_run, warm_model
+from app.services.scheduler import LLMScheduler
+
+logger = logging.getLogger("app.batch")
+
+SHARED_STEPS = ("step2", "step3")
+
+
+@dataclass
+class BatchRecord:
+    batch_id: str
+    analysis_run_id: str
+    questions: List[str]
+    run_ids: List[str]
+    status: str = "queued"
+    error: Optional[str] = None
+    task: Optional[asyncio.Task] = None
+
+
+BATCHES: "OrderedDict[str, BatchRecord]" = OrderedDict()
+BATCH_HISTORY_SIZE = int(os.getenv("BATCH_HISTORY_SIZE", "100"))
+
+
+def trim_batches() -> None:
+    finished = [key for key, record in BATCHES.items() if record.status in ("done", "failed")]
+    for batch_id in finished[: max(0, len(finished) - BATCH_HISTORY_SIZE)]:
+        BATCHES.pop(batch_id)
+
+
+def item_request(req: BatchRequest, question: str) -> RunRequest:
+    return RunRequest(question=question, **req.model_dump(exclude={"questions", "concurrency"}))
+
+
+async def create_batch(req: BatchRequest, scheduler: LLMScheduler) -> BatchRecord:
+    batch_id = str(uuid4())
+    scheduler.admit_run(batch_id, req.priority)
+    warm_model(scheduler, req.model)
+    record = BatchRecord(
+        batch_id=batch_id,
+        analysis_run_id=str(uuid4()),
+        questions=list(req.questions),
+        run_ids=[str(uuid4()) for _ in req.questions],
+    )
+
+    analysis = new_run_state(record.analysis_run_id)
+    for name in analysis.steps:
+        if name not in SHARED_STEPS:
+            analysis.steps[name] = StepState(status="skipped")
+    await add_run(analysis)
+    for run_id, question in zip(record.run_ids, record.questions):
+        await add_run(new_run_state(run_id))
+        await save_request(run_id, item_request(req, question))
+    BATCHES[batch_id] = record
+    hold_runs(record.run_ids)
+
+    logger.info(
+        "batch_created batch_id=%s model=%s questions=%s concurrency=%s jd_len=%s resume_len=%s",
+        batch_id,
+        req.model,
+        len(req.questions),
+        req.concurrency,
+        len(req.jd_text),
+        len(req.resume_text),
+    )
+    record.task = asyncio.create_task(run_batch(record, req, scheduler))
+    record.task.add_done_callback(lambda _: scheduler.release_run(batch_id))
+    record.task.add_done_callback(lambda _: release_held(record.run_ids))
+    return record
+
+
+async def run_shared_analysis(
+    record: BatchRecord,
+    req: BatchRequest,
+    scheduler: LLMScheduler,
+) -> Dict[str, StepState]:
+    run_id = record.analysis_run_id
+    scheduler.attach_run(run_id, record.batch_id)
+    client = scheduler.for_run(run_id)
+    base_request = item_request(req, record.questions[0])
+    try:
+        await update_run(run_id, status="running", current_step=2)
+        await run_steps(run_id, base_request, client, list(SHARED_STEPS))
+        await finish_run(run_id, status="done")
+    finally:
+        scheduler.release_run(run_id)
+    analysis = await get_run(run_id)
+    return {name: analysis.steps[name] for name in SHARED_STEPS}
+
+
+async def run_batch(record: BatchRecord, req: BatchRequest, scheduler: LLMScheduler) -> None:
+    record.status = "running"
+    try:
+        shared_steps = await run_shared_analysis(record, req, scheduler)
+    except Exception as exc:
+        logger.exception("batch_analysis_failed batch_id=%s error=%s", record.batch_id, exc)
+        record.status = "failed"
+        record.error = f"Shared analysis failed: {exc}"
+        await finish_run(record.analysis_run_id, status="failed", error=str(exc))
+        for run_id in record.run_ids:
+            for name in SHARED_STEPS:
+                await update_step(run_id, name, status="failed", error=record.error)
+            await finish_run(run_id, status="failed", error=record.error)
+        trim_batches()
+        return
+
+    semaphore = asyncio.Semaphore(req.concurrency)
+
+    async def run_item(run_id: str, question: str) -> None:
+        async with semaphore:
+            release_held([run_id])
+            run = await get_run(run_id)
+            # The item may have been canceled, or resumed on its own, while it
+            # waited for a slot.
+            if run is None or run.status in TERMINAL_STATUSES or is_active(run_id):
+                logger.info(
+                    "batch_item_skipped batch_id=%s run_id=%s status=%s",
+                    record.batch_id,
+                    run_id,
+                    run.status if run else None,
+                )
+                return
+            scheduler.attach_run(run_id, record.batch_id)
+            try:
+                task = track_run(
+                    run_id,
+                    run_pipeline(
+                        run_id,
+                        item_request(req, question),
+                        scheduler.for_run(run_id),
+                        shared_steps=shared_steps,
+                    ),
+                )
+                await asyncio.wait([task])
+            finally:
+                scheduler.release_run(run_id)
+
+    await asyncio.gather(
+        *(run_item(run_id, question) for run_id, question in zip(record.run_ids, record.questions))
+    )
+    record.status = "done"
+    trim_batches()
+    logger.info("batch_done batch_id=%s items=%s", record.batch_id, len(record.run_ids))
+
+
+async def get_batch(batch_id: str) -> Optional[BatchState]:
+    record = BATCHES.get(batch_id)
+    if record is None:
+        return None
+    items: List[BatchItem] = []
+    completed = failed = 0
+    for run_id, question in zip(record.run_ids, record.questions):
+        run = await get_run(run_id)
+        if run is None:
+            items.append(BatchItem(question=question, run_id=run_id, status="evicted"))
+            continue
+        if run.status in TERMINAL_STATUSES:
+            completed += 1
+            if run.status == "failed":
+                failed += 1
+        items.append(
+            BatchItem(
+                question=question,
+                run_id=run_id,
+                status=run.status,
+                final_output=run.final_output,
+                score=run.judge_report.score if run.judge_report else None,
+                error=run.error,
+            )
+        )
+    return BatchState(
+        batch_id=batch_id,
+        status=record.status,
+        analysis_run_id=record.analysis_run_id,
+        total=len(record.run_ids),
+        completed=completed,
+        failed=failed,
+        items=items,
+        error=record.error,
+    )
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from typing import Dict
+
+
+def parse_model_limits(raw: str) -> Dict[str, int]:
+    limits: Dict[str, int] = {}
+    for item in raw.split(","):
+        name, sep, value = item.strip().rpartition("=")
+        if sep and name:
+            limits[name] = int(value)
+    return limits
+
+
+def parse_keep_alive(raw: str) -> Dict[str, str]:
+    values: Dict[str, str] = {}
+    for item in raw.split(","):
+        name, sep, value = item.strip().rpartition("=")
+        if sep and name and value:
+            values[name] = value
+    return values
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("app.dag")
+
+
+@dataclass(frozen=True)
+class StepSpec:
+    name: str
+    deps: Tuple[str, ...]
+    prompt_file: str
+    temperature: float
+    json_mode: bool = True
+    schema: Optional[Dict[str, Any]] = None
+    cacheable: bool = False
+    stream: bool = False
+    context_prefix: bool = False
+    seed: Optional[int] = None
+    values: Callable[..., Dict[str, str]] = field(default=lambda req, outputs, context: {})
+    skip_if: Optional[Callable[..., bool]] = None
+    skip_output: Optional[Callable[..., Any]] = None
+    finalize: Optional[Callable[[Any, str], Any]] = None
+    precheck: Optional[Callable[..., Any]] = None
+    retry: Optional["StepSpec"] = None
+
+
+class StepGraph:
+    def __init__(self, specs: Iterable[StepSpec]) -> None:
+        self.specs: Dict[str, StepSpec] = {}
+        for spec in specs:
+            if spec.name in self.specs:
+                raise ValueError(f"Duplicate step: {spec.name}")
+            self.specs[spec.name] = spec
+        for spec in self.specs.values():
+            for variant in (spec, spec.retry):
+                if variant is None:
+                    continue
+                unknown = set(variant.deps) - self.specs.keys()
+                if unknown:
+                    raise ValueError(f"Step {spec.name} depends on unknown steps: {sorted(unknown)}")
+        self.order = self._topological_order()
+        self.dependents: Dict[str, Set[str]] = {name: set() for name in self.specs}
+        for spec in self.specs.values():
+            for dep in spec.deps:
+                self.dependents[dep].add(spec.name)
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        visiting: Set[str] = set()
+        done: Set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Step graph has a cycle through {name}")
+            visiting.add(name)
+            for dep in self.specs[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.specs:
+            visit(name)
+        return order
+
+    def downstream(self, name: str) -> Set[str]:
+        found: Set[str] = set()
+        stack = [name]
+        while stack:
+            for dependent in self.dependents[stack.pop()]:
+                if dependent not in found:
+                    found.add(dependent)
+                    stack.append(dependent)
+        return found
+
+
+StepRunner = Callable[[StepSpec, "DagRun"], Awaitable[Any]]
+
+
+class DagRun:
+    def __init__(
+        self,
+        graph: StepGraph,
+        runner: StepRunner,
+        outputs: Optional[Dict[str, Any]] = None,
+        context: Optional[Dict[str, Any]] = None,
+        on_running: Optional[Callable[[List[str]], Awaitable[None]]] = None,
+    ) -> None:
+        self.graph = graph
+        self.runner = runner
+        self.outputs: Dict[str, Any] = dict(outputs or {})
+        self.context: Dict[str, Any] = dict(context or {})
+        self.on_running = on_running
+        self.retry_nodes: Set[str] = set()
+
+    def spec_for(self, name: str) -> StepSpec:
+        spec = self.graph.specs[name]
+        if name in self.retry_nodes and spec.retry is not None:
+            return spec.retry
+        return spec
+
+    def invalidate(self, name: str, retry: bool = True) -> Set[str]:
+        invalidated = {name} | self.graph.downstream(name)
+        for node in invalidated:
+            self.outputs.pop(node, None)
+        if retry:
+            self.retry_nodes.add(name)
+        logger.info("dag_invalidated root=%s steps=%s", name, ",".join(sorted(invalidated)))
+        return invalidated
+
+    def required(self, targets: Iterable[str]) -> Set[str]:
+        needed: Set[str] = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name in needed or name in self.outputs:
+                continue
+            needed.add(name)
+            stack.extend(self.spec_for(name).deps)
+        return needed
+
+    async def execute(self, targets: Iterable[str]) -> Dict[str, Any]:
+        pending = self.required(targets)
+        running: Dict[asyncio.Task, str] = {}
+        try:
+            while pending or running:
+                ready = [
+                    name
+                    for name in self.graph.order
+                    if name in pending
+                    and all(dep in self.outputs for dep in self.spec_for(name).deps)
+                ]
+                for name in ready:
+                    pending.discard(name)
+                    running[asyncio.create_task(self.runner(self.spec_for(name), self))] = name
+                if ready and self.on_running is not None:
+                    await self.on_running(sorted(running.values()))
+                if not running:
+                    raise RuntimeError(f"Steps cannot be scheduled: {sorted(pending)}")
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    self.outputs[name] = task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        return self.outputs
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+FENCE_RE = re.compile(r"```[a-zA-Z0-9_-]*\s*\n?(.*?)(?:```|$)", re.DOTALL)
+TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+NUMBER_RE = re.compile(r"^\s*-?\d+(\.\d+)?\s*(/\s*\d+)?\s*$")
+JSON_TYPES = {
+    "object": (dict,),
+    "array": (list,),
+    "string": (str,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "null": (type(None),),
+}
+
+
+class JsonRepairError(ValueError):
+    pass
+
+
+def strip_fences(text: str) -> str:
+    match = FENCE_RE.search(text)
+    return match.group(1) if match else text
+
+
+def extract_value(text: str) -> str:
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    if not starts:
+        return text
+    return text[min(starts):]
+
+
+def scan(text: str) -> Tuple[str, List[str], Optional[str]]:
+    out: List[str] = []
+    stack: List[str] = []
+    quote: Optional[str] = None
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if quote is not None:
+            if char == "\\" and index + 1 < len(text):
+                escaped = text[index + 1]
+                out.append("'" if escaped == "'" else text[index : index + 2])
+                index += 2
+                continue
+            if char == quote:
+                out.append('"')
+                quote = None
+            elif char == '"':
+                out.append('\\"')
+            elif char == "\n":
+                out.append("\\n")
+            else:
+                out.append(char)
+            index += 1
+            continue
+        if char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            out.append(char)
+        elif char in "}]":
+            if stack and stack[-1] == char:
+                stack.pop()
+            out.append(char)
+            if not stack:
+                return "".join(out), stack, None
+        elif char.isalpha():
+            end = index
+            while end < len(text) and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[index:end]
+            if word in PYTHON_LITERALS:
+                word = PYTHON_LITERALS[word]
+            elif text[end:].lstrip().startswith(":"):
+                word = f'"{word}"'
+            out.append(word)
+            index = end
+            continue
+        else:
+            out.append(char)
+        index += 1
+    return "".join(out), stack, quote
+
+
+def repair_json(raw: str) -> Any:
+    text = extract_value(strip_fences(raw.translate(SMART_QUOTES)).strip())
+    text, stack, quote = scan(text)
+    if quote is not None:
+        text += '"'
+    text = text.rstrip().rstrip(",").rstrip()
+    if text.endswith(":"):
+        text += " null"
+    text += "".join(reversed(stack))
+    text = TRAILING_COMMA_RE.sub(r"\1", text)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as exc:
+        raise JsonRepairError(f"Unrepairable JSON: {exc.msg} at char {exc.pos}") from exc
+
+
+def is_type(value: Any, kind: str) -> bool:
+    if isinstance(value, bool) and kind != "boolean":
+        return False
+    return isinstance(value, JSON_TYPES.get(kind, ()))
+
+
+def conform(value: Any, schema: Dict[str, Any], path: str = "$") -> Tuple[Any, List[str]]:
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        # A union is matched on the value's actual type, without coercion.
+        for option in kind:
+            if is_type(value, option):
+                return conform(value, {**schema, "type": option}, path)
+        return value, [f"{path} must be {' or '.join(kind)}"]
+    if kind == "null":
+        return value, [] if value is None else [f"{path} must be null"]
+    if kind == "object":
+        if not isinstance(value, dict):
+            return value, [f"{path} must be an object"]
+        errors: List[str] = []
+        result = dict(value)
+        properties = schema.get("properties", {})
+        for name, child in properties.items():
+            if name in result:
+                result[name], child_errors = conform(result[name], child, f"{path}.{name}")
+                errors.extend(child_errors)
+        for name in schema.get("required", ()):
+            if name not in result:
+                errors.append(f"{path}.{name} is required")
+        return result, errors
+    if kind == "array":
+        if value is None:
+            return [], []
+        if not isinstance(value, list):
+            value = [value]
+        items = schema.get("items")
+        if items is None:
+            return value, []
+        errors = []
+        result = []
+        for index, item in enumerate(value):
+            item, item_errors = conform(item, items, f"{path}[{index}]")
+            result.append(item)
+            errors.extend(item_errors)
+        return result, errors
+    if kind == "number":
+        if isinstance(value, str) and NUMBER_RE.match(value):
+            value = float(value.split("/")[0])
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return value, [f"{path} must be a number"]
+        return value, []
+    if kind == "string":
+        # Numbers and booleans are spelled out; a missing value stays an error
+        # rather than becoming the text "null".
+        if isinstance(value, (int, float)):
+            return json.dumps(value), []
+        if not isinstance(value, str):
+            return value, [f"{path} must be a string"]
+        return value, []
+    return value, []
+
+
+def parse_json(raw: str, schema: Optional[Dict[str, Any]] = None) -> Tuple[Any, bool]:
+    try:
+        value = json.loads(raw)
+        repaired = False
+    except json.JSONDecodeError:
+        value = repair_json(raw)
+        repaired = True
+    if schema is None:
+        return value, repaired
+    conformed, errors = conform(value, schema)
+    if errors:
+        raise JsonRepairError("JSON does not match schema: " + "; ".join(errors))
+    return conformed, repaired or conformed != value
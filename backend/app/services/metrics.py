@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.schemas.run import StepMetrics
+
+logger = logging.getLogger("app.metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+SCORE_BUCKETS = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10)
+ATTEMPT_BUCKETS = (1, 2, 3, 4, 5, 6)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + value
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = SECONDS_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = ([0] * (len(self.buckets) + 1), [0.0])
+            self._values[key] = entry
+        counts, total = entry
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, f'le="{format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(round(total[0], 6))}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[object] = []
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = SECONDS_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STEPS_TOTAL = REGISTRY.counter(
+    "localforge_steps_total",
+    "Pipeline steps finished, by outcome.",
+    ("step", "model", "status"),
+)
+STEP_QUEUE_SECONDS = REGISTRY.histogram(
+    "localforge_step_queue_seconds",
+    "Time a step waited in the LLM scheduler.",
+    ("step", "model"),
+)
+STEP_DURATION_SECONDS = REGISTRY.histogram(
+    "localforge_step_duration_seconds",
+    "Wall-clock time of a step, including queueing.",
+    ("step", "model"),
+)
+STEP_PREFILL_SECONDS = REGISTRY.histogram(
+    "localforge_step_prefill_seconds",
+    "Ollama prompt evaluation time of a step.",
+    ("step", "model"),
+)
+STEP_EVAL_SECONDS = REGISTRY.histogram(
+    "localforge_step_eval_seconds",
+    "Ollama generation time of a step.",
+    ("step", "model"),
+)
+STEP_PROMPT_TOKENS = REGISTRY.histogram(
+    "localforge_step_prompt_tokens",
+    "Prompt tokens evaluated by Ollama for a step.",
+    ("step", "model"),
+    TOKEN_BUCKETS,
+)
+STEP_EVAL_TOKENS = REGISTRY.histogram(
+    "localforge_step_eval_tokens",
+    "Tokens generated by Ollama for a step.",
+    ("step", "model"),
+    TOKEN_BUCKETS,
+)
+PROMPT_TOKENS_SAVED = REGISTRY.counter(
+    "localforge_prompt_tokens_saved_total",
+    "Estimated prompt tokens removed by prompt compaction.",
+    ("step", "model"),
+)
+JSON_PARSE_RETRIES = REGISTRY.counter(
+    "localforge_json_parse_retries_total",
+    "JSON steps that had to be regenerated, by outcome.",
+    ("model", "outcome"),
+)
+JSON_REPAIRS = REGISTRY.counter(
+    "localforge_json_repairs_total",
+    "JSON outputs that were repaired locally instead of regenerated.",
+    ("model",),
+)
+JUDGE_SCORE = REGISTRY.histogram(
+    "localforge_judge_score",
+    "Judge score of every attempt.",
+    ("model",),
+    SCORE_BUCKETS,
+)
+RUN_ATTEMPTS = REGISTRY.histogram(
+    "localforge_run_attempts",
+    "Attempts used by finished runs.",
+    ("model", "outcome"),
+    ATTEMPT_BUCKETS,
+)
+RUNS_TOTAL = REGISTRY.counter(
+    "localforge_runs_total",
+    "Runs finished, by outcome.",
+    ("model", "outcome"),
+)
+GENERATE_COALESCED = REGISTRY.counter(
+    "localforge_generate_coalesced_total",
+    "Generate calls served by an identical call already in flight.",
+    ("model",),
+)
+RUNS_DEDUPLICATED = REGISTRY.counter(
+    "localforge_runs_deduplicated_total",
+    "Run submissions answered with an identical recent run.",
+)
+PREJUDGE_VERDICTS = REGISTRY.counter(
+    "localforge_prejudge_verdicts_total",
+    "Answers checked before the LLM judge, by verdict.",
+    ("model", "verdict"),
+)
+OLLAMA_RETRIES = REGISTRY.counter(
+    "localforge_ollama_retries_total",
+    "Ollama calls retried after a transport error, timeout or 5xx.",
+    ("model", "reason"),
+)
+OLLAMA_HEDGES = REGISTRY.counter(
+    "localforge_ollama_hedges_total",
+    "Hedged Ollama calls, by which request answered first.",
+    ("model", "winner"),
+)
+OLLAMA_CIRCUIT_OPENS = REGISTRY.counter(
+    "localforge_ollama_circuit_opens_total",
+    "Times the circuit breaker of an Ollama host opened.",
+    ("backend",),
+)
+OLLAMA_FAST_FAILS = REGISTRY.counter(
+    "localforge_ollama_fast_fails_total",
+    "Ollama calls refused because the host's circuit was open.",
+    ("backend",),
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "localforge_http_request_seconds",
+    "API request latency.",
+    ("method", "route", "status"),
+)
+
+
+def observe_step(step: str, model: str, status: str, metrics: Optional[StepMetrics]) -> None:
+    STEPS_TOTAL.inc(step=step, model=model, status=status)
+    if metrics is None or status != "done":
+        return
+    if metrics.prompt_tokens_saved:
+        PROMPT_TOKENS_SAVED.inc(metrics.prompt_tokens_saved, step=step, model=model)
+    STEP_QUEUE_SECONDS.observe(metrics.queue_ms / 1000, step=step, model=model)
+    STEP_DURATION_SECONDS.observe(metrics.duration_ms / 1000, step=step, model=model)
+    if metrics.calls:
+        STEP_PREFILL_SECONDS.observe(metrics.prompt_eval_ms / 1000, step=step, model=model)
+        STEP_EVAL_SECONDS.observe(metrics.eval_ms / 1000, step=step, model=model)
+        STEP_PROMPT_TOKENS.observe(metrics.prompt_eval_count, step=step, model=model)
+        STEP_EVAL_TOKENS.observe(metrics.eval_count, step=step, model=model)
+
+
+def observe_run(model: str, outcome: str, attempts: int) -> None:
+    RUNS_TOTAL.inc(model=model, outcome=outcome)
+    RUN_ATTEMPTS.observe(attempts, model=model, outcome=outcome)
+
+
+async def serve_metrics(port: int) -> asyncio.AbstractServer:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = REGISTRY.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                + f"Content-Type: {CONTENT_TYPE}\r\n".encode()
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "0.0.0.0", port)
+    logger.info("metrics_server_started port=%s", port)
+    return server
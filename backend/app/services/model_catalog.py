@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.services.ollama_pool import OllamaPool
+
+logger = logging.getLogger("app.model_catalog")
+
+
+@dataclass
+class ModelListing:
+    models: List[Dict[str, Any]] = field(default_factory=list)
+    fetched_at: Optional[float] = None
+    error: Optional[str] = None
+    stale: bool = False
+
+
+class ModelCatalog:
+    def __init__(
+        self,
+        client: OllamaPool,
+        ttl_s: float = 30.0,
+        max_stale_s: float = 600.0,
+        timeout_s: float = 10.0,
+    ) -> None:
+        self.client = client
+        self.ttl_s = ttl_s
+        self.max_stale_s = max_stale_s
+        self.timeout_s = timeout_s
+        self._models: List[Dict[str, Any]] = []
+        self._fetched_at: Optional[float] = None
+        self._fetched_wall: Optional[float] = None
+        self._error: Optional[str] = None
+        self._refresh: Optional[asyncio.Task] = None
+        self.refreshes = 0
+
+    @classmethod
+    def from_env(cls, client: OllamaPool) -> "ModelCatalog":
+        return cls(
+            client,
+            ttl_s=float(os.getenv("MODELS_CACHE_TTL_S", "30")),
+            max_stale_s=float(os.getenv("MODELS_CACHE_MAX_STALE_S", "600")),
+            timeout_s=float(os.getenv("MODELS_FETCH_TIMEOUT_S", "10")),
+        )
+
+    def start(self) -> None:
+        self.refresh()
+
+    async def aclose(self) -> None:
+        task = self._refresh
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def _age(self) -> Optional[float]:
+        if self._fetched_at is None:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    def _listing(self, stale: bool) -> ModelListing:
+        return ModelListing(
+            models=self._models,
+            fetched_at=self._fetched_wall,
+            error=self._error,
+            stale=stale,
+        )
+
+    def refresh(self) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._fetch())
+        return self._refresh
+
+    async def _fetch(self) -> None:
+        self.refreshes += 1
+        try:
+            models = await self.client.list_model_info(timeout_s=self.timeout_s)
+        except Exception as exc:
+            self._error = str(exc) or type(exc).__name__
+            logger.warning("models_refresh_failed error=%s", self._error)
+            return
+        self._models = models
+        self._fetched_at = time.monotonic()
+        self._fetched_wall = time.time()
+        self._error = None
+        logger.info("models_refreshed count=%s", len(models))
+
+    async def get(self, force: bool = False) -> ModelListing:
+        age = self._age()
+        if not force and age is not None and age < self.ttl_s:
+            return self._listing(stale=False)
+        if not force and age is not None and age < self.ttl_s + self.max_stale_s:
+            self.refresh()
+            return self._listing(stale=True)
+        await asyncio.shield(self.refresh())
+        age = self._age()
+        return self._listing(stale=age is None or age >= self.ttl_s)
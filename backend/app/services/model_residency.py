@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.services.ollama_pool import OllamaPool
+
+logger = logging.getLogger("app.model_residency")
+
+
+@dataclass
+class Residency:
+    state: str = "cold"
+    expires_at: Optional[str] = None
+    load_ms: Optional[float] = None
+    error: Optional[str] = None
+    failures: int = 0
+    retry_at: float = 0.0
+
+
+class ModelResidency:
+    def __init__(
+        self,
+        client: OllamaPool,
+        poll_interval_s: float = 15.0,
+        load_timeout_s: float = 600.0,
+        preload: Optional[List[str]] = None,
+        retry_s: float = 30.0,
+        max_retry_s: float = 600.0,
+    ) -> None:
+        self.client = client
+        self.poll_interval_s = poll_interval_s
+        self.load_timeout_s = load_timeout_s
+        self.retry_s = retry_s
+        self.max_retry_s = max_retry_s
+        self.preload = preload or []
+        self.models: Dict[str, Residency] = {}
+        self._loads: Dict[str, asyncio.Task] = {}
+        self._poll_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, client: OllamaPool) -> "ModelResidency":
+        preload = os.getenv("OLLAMA_PRELOAD_MODELS", "")
+        return cls(
+            client,
+            poll_interval_s=float(os.getenv("OLLAMA_PS_INTERVAL_S", "15")),
+            load_timeout_s=float(os.getenv("OLLAMA_LOAD_TIMEOUT_S", "600")),
+            preload=[model.strip() for model in preload.split(",") if model.strip()],
+            retry_s=float(os.getenv("OLLAMA_LOAD_RETRY_S", "30")),
+            max_retry_s=float(os.getenv("OLLAMA_LOAD_MAX_RETRY_S", "600")),
+        )
+
+    def start(self) -> None:
+        if self.poll_interval_s > 0:
+            self._poll_task = asyncio.create_task(self._poll_loop())
+        for model in self.preload:
+            self.warm(model)
+
+    async def aclose(self) -> None:
+        tasks = [task for task in (self._poll_task, *self._loads.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._poll_task = None
+
+    async def _poll_loop(self) -> None:
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.poll_interval_s)
+
+    async def refresh(self) -> None:
+        try:
+            running = await self.client.list_running()
+        except Exception as exc:
+            logger.warning("ollama_ps_failed error=%s", exc)
+            return
+        loaded = {entry["name"]: entry for entry in running}
+        for name, entry in loaded.items():
+            residency = self.models.setdefault(name, Residency())
+            residency.expires_at = entry.get("expires_at")
+            if residency.state != "loading":
+                residency.state = "loaded"
+        now = time.monotonic()
+        for name, residency in list(self.models.items()):
+            if name not in loaded and residency.state == "loaded":
+                residency.state = "cold"
+                residency.expires_at = None
+            # Cold entries are dropped once their retry back-off is over, so
+            # requests for arbitrary model names do not accumulate here.
+            if (
+                residency.state == "cold"
+                and name not in self.preload
+                and now >= residency.retry_at
+                and name not in self._loads
+            ):
+                del self.models[name]
+        # Preloaded models are loaded again whenever Ollama has unloaded them.
+        for model in self.preload:
+            if model not in loaded:
+                self.warm(model)
+
+    def state(self, model: str) -> Residency:
+        return self.models.get(model) or Residency()
+
+    def warm(self, model: str) -> Optional[asyncio.Task]:
+        task = self._loads.get(model)
+        if task is not None:
+            return task
+        residency = self.models.get(model)
+        if residency is not None and (
+            residency.state == "loaded" or time.monotonic() < residency.retry_at
+        ):
+            return None
+        task = self._loads[model] = asyncio.create_task(self._load(model))
+        task.add_done_callback(lambda _: self._loads.pop(model, None))
+        return task
+
+    async def ready(self, model: str) -> None:
+        # Calls wait for a first load instead of queueing behind it in Ollama
+        # with their own (shorter) timeout. Once a load has failed, later
+        # attempts run in the background and calls go ahead without waiting;
+        # the call itself will surface any error.
+        task = self._loads.get(model)
+        residency = self.models.get(model)
+        if task is None or (residency is not None and residency.failures):
+            return
+        await asyncio.shield(task)
+
+    async def _load(self, model: str) -> None:
+        residency = self.models.setdefault(model, Residency())
+        residency.state = "loading"
+        residency.error = None
+        start = time.monotonic()
+        try:
+            load_ms = await self.client.load_model(model, timeout_s=self.load_timeout_s)
+        except Exception as exc:
+            residency.state = "cold"
+            residency.error = str(exc) or type(exc).__name__
+            residency.failures += 1
+            delay = min(self.max_retry_s, self.retry_s * 2 ** (residency.failures - 1))
+            residency.retry_at = time.monotonic() + delay
+            logger.warning(
+                "model_warm_failed model=%s failures=%s retry_s=%.0f error=%s",
+                model,
+                residency.failures,
+                delay,
+                residency.error,
+            )
+            return
+        residency.state = "loaded"
+        residency.load_ms = round(load_ms, 2)
+        residency.failures = 0
+        residency.retry_at = 0.0
+        logger.info(
+            "model_warmed model=%s load_ms=%.2f duration_ms=%.2f",
+            model,
+            load_ms,
+            (time.monotonic() - start) * 1000,
+        )
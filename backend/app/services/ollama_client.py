@@ -1,17 +1,233 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
+import os
 import time
-from typing import Any, Dict, Optional
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Optional
 
 import httpx
 
+from app.services.config import parse_keep_alive
+from app.services.metrics import (
+    OLLAMA_CIRCUIT_OPENS,
+    OLLAMA_FAST_FAILS,
+    OLLAMA_HEDGES,
+    OLLAMA_RETRIES,
+)
+from app.services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    backoff_s,
+    is_retryable,
+    retry_reason,
+)
+
 logger = logging.getLogger("app.ollama")
 
+DEFAULT_BASE_URL = "http://localhost:11434"
+
+# Called before a hedge is sent. Returns a release callback for the slot the
+# hedge occupies, or None when no slot is free and the hedge is skipped.
+HedgeSlot = Callable[[], Optional[Callable[[], None]]]
+
+
+@dataclass
+class GenerateStats:
+    calls: int = 0
+    prompt_eval_count: int = 0
+    prompt_eval_ms: float = 0.0
+    eval_count: int = 0
+    eval_ms: float = 0.0
+    load_ms: float = 0.0
+    total_ms: float = 0.0
+    # Measured by the client for the request that answered, so it includes
+    # time queued inside Ollama and on the network, unlike total_ms.
+    request_ms: float = 0.0
+    queue_ms: float = 0.0
+    coalesced: int = 0
+    retries: int = 0
+    hedged: int = 0
+    hedge_wins: int = 0
+
+    def record(self, data: Dict[str, Any], request_ms: float = 0.0) -> None:
+        self.calls += 1
+        self.request_ms += request_ms
+        self.prompt_eval_count += data.get("prompt_eval_count") or 0
+        self.prompt_eval_ms += (data.get("prompt_eval_duration") or 0) / 1e6
+        self.eval_count += data.get("eval_count") or 0
+        self.eval_ms += (data.get("eval_duration") or 0) / 1e6
+        self.load_ms += (data.get("load_duration") or 0) / 1e6
+        self.total_ms += (data.get("total_duration") or 0) / 1e6
+
+
+def last_json_object(text: str) -> Dict[str, Any]:
+    # A load is answered with one object, but servers that ignore "stream"
+    # send NDJSON; the final line carries the timings.
+    for line in reversed(text.strip().splitlines()):
+        if line.strip():
+            return json.loads(line)
+    return {}
+
 
 class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434") -> None:
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        max_connections: int = 32,
+        max_keepalive_connections: int = 16,
+        keepalive_expiry_s: float = 60.0,
+        keep_alive: Optional[str] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+        model_keep_alive: Optional[Dict[str, str]] = None,
+        max_retries: int = 2,
+        retry_base_s: float = 0.5,
+        retry_max_s: float = 5.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
         self.base_url = base_url.rstrip("/")
+        self.keep_alive = keep_alive
+        self.model_keep_alive = model_keep_alive or {}
+        self.max_retries = max_retries
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        self.breaker = breaker or CircuitBreaker()
+        self._http = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry_s,
+            ),
+        )
+
+    @classmethod
+    def from_env(cls) -> "OllamaClient":
+        return cls(
+            base_url=os.getenv("OLLAMA_BASE_URL", DEFAULT_BASE_URL),
+            max_connections=int(os.getenv("OLLAMA_MAX_CONNECTIONS", "32")),
+            max_keepalive_connections=int(os.getenv("OLLAMA_MAX_KEEPALIVE", "16")),
+            keepalive_expiry_s=float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY_S", "60")),
+            keep_alive=os.getenv("OLLAMA_KEEP_ALIVE") or None,
+            model_keep_alive=parse_keep_alive(os.getenv("OLLAMA_MODEL_KEEP_ALIVE", "")),
+            max_retries=int(os.getenv("OLLAMA_RETRIES", "2")),
+            retry_base_s=float(os.getenv("OLLAMA_RETRY_BASE_S", "0.5")),
+            retry_max_s=float(os.getenv("OLLAMA_RETRY_MAX_S", "5")),
+            breaker=CircuitBreaker.from_env(),
+        )
+
+    def keep_alive_for(self, model: str) -> Optional[str]:
+        return self.model_keep_alive.get(model, self.keep_alive)
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    def _admit(self) -> bool:
+        if not self.breaker.allow():
+            OLLAMA_FAST_FAILS.inc(backend=self.base_url)
+            raise CircuitOpenError(f"Ollama circuit open for {self.base_url}")
+        return self.breaker.probing
+
+    def _record(self, exc: Optional[BaseException], probing: bool) -> None:
+        if exc is None or not is_retryable(exc):
+            # Any answer, even a 4xx, shows the host is up.
+            self.breaker.record_success()
+            return
+        if self.breaker.record_failure(probing):
+            OLLAMA_CIRCUIT_OPENS.inc(backend=self.base_url)
+            logger.warning(
+                "ollama_circuit_open backend=%s failures=%s reset_s=%s error=%s",
+                self.base_url,
+                self.breaker.failures,
+                self.breaker.reset_s,
+                exc,
+            )
+
+    async def _backoff(
+        self,
+        model: str,
+        attempt: int,
+        exc: BaseException,
+        stats: Optional[GenerateStats],
+    ) -> None:
+        delay = backoff_s(attempt, self.retry_base_s, self.retry_max_s)
+        if stats is not None:
+            stats.retries += 1
+        OLLAMA_RETRIES.inc(model=model, reason=retry_reason(exc))
+        logger.warning(
+            "ollama_retry model=%s attempt=%s delay_s=%.2f error=%s",
+            model,
+            attempt,
+            delay,
+            exc,
+        )
+        await asyncio.sleep(delay)
+
+    async def _post(self, url: str, payload: Dict[str, Any], timeout_s: float) -> Dict[str, Any]:
+        probing = self._admit()
+        try:
+            response = await self._http.post(url, json=payload, timeout=timeout_s)
+            response.raise_for_status()
+            data = response.json()
+        except asyncio.CancelledError:
+            if probing:
+                self.breaker.release()
+            raise
+        except Exception as exc:
+            self._record(exc, probing)
+            raise
+        self._record(None, probing)
+        return data
+
+    async def _hedged_post(
+        self,
+        url: str,
+        payload: Dict[str, Any],
+        timeout_s: float,
+        hedge_after_s: float,
+        stats: Optional[GenerateStats],
+        hedge_slot: Optional[HedgeSlot] = None,
+    ) -> Dict[str, Any]:
+        # If the first request is slower than the step usually is, a second
+        # identical one is sent; whichever answers first wins and the other is
+        # cancelled.
+        primary = asyncio.create_task(self._post(url, payload, timeout_s))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_after_s)
+            if done:
+                return primary.result()
+            release_slot = hedge_slot() if hedge_slot is not None else None
+            if hedge_slot is not None and release_slot is None:
+                logger.info("ollama_hedge_skipped model=%s reason=at_limit", payload["model"])
+                return await primary
+            hedge = asyncio.create_task(self._post(url, payload, timeout_s))
+            if release_slot is not None:
+                hedge.add_done_callback(lambda _: release_slot())
+            pending.add(hedge)
+            if stats is not None:
+                stats.hedged += 1
+            logger.info("ollama_hedge model=%s after_s=%.2f", payload["model"], hedge_after_s)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if stats is not None and task is hedge:
+                            stats.hedge_wins += 1
+                        OLLAMA_HEDGES.inc(
+                            model=payload["model"],
+                            winner="hedge" if task is hedge else "primary",
+                        )
+                        return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
 
     async def generate(
         self,
@@ -20,6 +236,11 @@ class OllamaClient:
         temperature: float = 0.2,
         format_json: bool = False,
         timeout_s: float = 120.0,
+        stats: Optional[GenerateStats] = None,
+        seed: Optional[int] = None,
+        format_schema: Optional[Dict[str, Any]] = None,
+        hedge_after_s: Optional[float] = None,
+        hedge_slot: Optional[HedgeSlot] = None,
     ) -> str:
         url = f"{self.base_url}/api/generate"
         payload: Dict[str, Any] = {
@@ -28,53 +249,221 @@ class OllamaClient:
             "stream": False,
             "options": {"temperature": temperature},
         }
+        if seed is not None:
+            payload["options"]["seed"] = seed
         if format_json:
-            payload["format"] = "json"
+            payload["format"] = format_schema if format_schema is not None else "json"
+        keep_alive = self.keep_alive_for(model)
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
 
         start = time.monotonic()
-        async with httpx.AsyncClient(timeout=timeout_s) as client:
+        attempt = 0
+        while True:
+            attempt_start = time.monotonic()
             try:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-                data = response.json()
+                if hedge_after_s is None:
+                    data = await self._post(url, payload, timeout_s)
+                else:
+                    data = await self._hedged_post(
+                        url,
+                        payload,
+                        timeout_s,
+                        hedge_after_s,
+                        stats,
+                        hedge_slot,
+                    )
+                break
             except Exception as exc:
+                if is_retryable(exc) and attempt < self.max_retries:
+                    attempt += 1
+                    await self._backoff(model, attempt, exc, stats)
+                    continue
                 logger.exception(
-                    "ollama_generate_failed model=%s error=%s",
+                    "ollama_generate_failed model=%s attempts=%s error=%s",
                     model,
+                    attempt + 1,
                     exc,
                 )
                 raise
 
         if "response" not in data:
             raise RuntimeError("Ollama response missing 'response' field")
+        if stats is not None:
+            stats.record(data, (time.monotonic() - attempt_start) * 1000)
         duration_ms = (time.monotonic() - start) * 1000
         logger.info(
-            "ollama_generate model=%s prompt_chars=%s temp=%.2f json=%s duration_ms=%.2f",
+            "ollama_generate model=%s prompt_chars=%s prompt_eval_count=%s eval_count=%s temp=%.2f json=%s duration_ms=%.2f",
             model,
             len(prompt),
+            data.get("prompt_eval_count"),
+            data.get("eval_count"),
             temperature,
             format_json,
             duration_ms,
         )
         return data["response"]
 
-    async def list_models(self, timeout_s: float = 10.0) -> list[str]:
-        url = f"{self.base_url}/api/tags"
+    async def generate_stream(
+        self,
+        model: str,
+        prompt: str,
+        temperature: float = 0.2,
+        format_json: bool = False,
+        timeout_s: float = 120.0,
+        stats: Optional[GenerateStats] = None,
+        seed: Optional[int] = None,
+        format_schema: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        url = f"{self.base_url}/api/generate"
+        payload: Dict[str, Any] = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {"temperature": temperature},
+        }
+        if seed is not None:
+            payload["options"]["seed"] = seed
+        if format_json:
+            payload["format"] = format_schema if format_schema is not None else "json"
+        keep_alive = self.keep_alive_for(model)
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+
         start = time.monotonic()
-        async with httpx.AsyncClient(timeout=timeout_s) as client:
+        first_token_ms: Optional[float] = None
+        chunks = 0
+        attempt = 0
+        while True:
+            attempt_start = time.monotonic()
+            probing = self._admit()
             try:
-                response = await client.get(url)
-                response.raise_for_status()
-                data = response.json()
+                async with self._http.stream(
+                    "POST",
+                    url,
+                    json=payload,
+                    timeout=timeout_s,
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        data = json.loads(line)
+                        if "error" in data:
+                            raise RuntimeError(f"Ollama stream error: {data['error']}")
+                        token = data.get("response", "")
+                        if token:
+                            if first_token_ms is None:
+                                first_token_ms = (time.monotonic() - start) * 1000
+                            chunks += 1
+                            yield token
+                        if data.get("done"):
+                            if stats is not None:
+                                stats.record(data, (time.monotonic() - attempt_start) * 1000)
+                            break
+            except (asyncio.CancelledError, GeneratorExit):
+                if probing:
+                    self.breaker.release()
+                raise
             except Exception as exc:
-                logger.exception("ollama_list_models_failed error=%s", exc)
+                self._record(exc, probing)
+                # Tokens already sent cannot be taken back, so a stream is only
+                # retried if none has arrived yet.
+                if is_retryable(exc) and not chunks and attempt < self.max_retries:
+                    attempt += 1
+                    await self._backoff(model, attempt, exc, stats)
+                    continue
+                logger.exception(
+                    "ollama_generate_stream_failed model=%s attempts=%s error=%s",
+                    model,
+                    attempt + 1,
+                    exc,
+                )
                 raise
+            self._record(None, probing)
+            break
+
+        duration_ms = (time.monotonic() - start) * 1000
+        logger.info(
+            "ollama_generate_stream model=%s prompt_chars=%s temp=%.2f json=%s chunks=%s first_token_ms=%.2f duration_ms=%.2f",
+            model,
+            len(prompt),
+            temperature,
+            format_json,
+            chunks,
+            first_token_ms or duration_ms,
+            duration_ms,
+        )
+
+    async def load_model(self, model: str, timeout_s: float = 600.0) -> float:
+        url = f"{self.base_url}/api/generate"
+        payload: Dict[str, Any] = {"model": model, "stream": False}
+        keep_alive = self.keep_alive_for(model)
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+        start = time.monotonic()
+        try:
+            response = await self._http.post(url, json=payload, timeout=timeout_s)
+            response.raise_for_status()
+            data = last_json_object(response.text)
+        except Exception as exc:
+            logger.exception("ollama_load_failed model=%s error=%s", model, exc)
+            raise
+        duration_ms = (time.monotonic() - start) * 1000
+        load_ms = (data.get("load_duration") or 0) / 1e6
+        logger.info(
+            "ollama_load model=%s keep_alive=%s load_ms=%.2f duration_ms=%.2f",
+            model,
+            keep_alive,
+            load_ms,
+            duration_ms,
+        )
+        return load_ms
+
+    async def list_running(self, timeout_s: float = 5.0) -> list[Dict[str, Any]]:
+        url = f"{self.base_url}/api/ps"
+        response = await self._http.get(url, timeout=timeout_s)
+        response.raise_for_status()
+        return [
+            {
+                "name": entry["name"],
+                "size_vram": entry.get("size_vram"),
+                "expires_at": entry.get("expires_at"),
+            }
+            for entry in response.json().get("models", [])
+            if entry.get("name")
+        ]
+
+    async def list_models(self, timeout_s: float = 10.0) -> list[str]:
+        return [entry["name"] for entry in await self.list_model_info(timeout_s=timeout_s)]
+
+    async def list_model_info(self, timeout_s: float = 10.0) -> list[Dict[str, Any]]:
+        url = f"{self.base_url}/api/tags"
+        start = time.monotonic()
+        try:
+            response = await self._http.get(url, timeout=timeout_s)
+            response.raise_for_status()
+            data = response.json()
+        except Exception as exc:
+            logger.exception("ollama_list_models_failed error=%s", exc)
+            raise
 
         models = []
         for entry in data.get("models", []):
             name = entry.get("name")
-            if name:
-                models.append(name)
+            if not name:
+                continue
+            details = entry.get("details") or {}
+            models.append(
+                {
+                    "name": name,
+                    "size": entry.get("size"),
+                    "modified_at": entry.get("modified_at"),
+                    "family": details.get("family"),
+                    "parameter_size": details.get("parameter_size"),
+                    "quantization_level": details.get("quantization_level"),
+                }
+            )
         duration_ms = (time.monotonic() - start) * 1000
         logger.info("ollama_list_models count=%s duration_ms=%.2f", len(models), duration_ms)
         return models
@@ -0,0 +1,328 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+import httpx
+
+from app.services.config import parse_keep_alive
+from app.services.ollama_client import DEFAULT_BASE_URL, OllamaClient
+from app.services.resilience import CircuitBreaker, CircuitOpenError, is_retryable
+
+logger = logging.getLogger("app.ollama_pool")
+
+ROUTING_STRATEGIES = ("affinity", "least_outstanding")
+
+
+class NoBackendError(RuntimeError):
+    pass
+
+
+@dataclass
+class Backend:
+    url: str
+    client: OllamaClient
+    outstanding: int = 0
+    healthy: bool = True
+    ejected_until: float = 0.0
+    failures: int = 0
+    requests: int = 0
+    models: List[str] = field(default_factory=list)
+    running: List[Dict[str, Any]] = field(default_factory=list)
+
+    def available(self, now: float) -> bool:
+        if self.client.breaker.state == "open":
+            return False
+        return self.healthy or now >= self.ejected_until
+
+
+def parse_base_urls(raw: str) -> List[str]:
+    return [url.strip().rstrip("/") for url in raw.split(",") if url.strip()]
+
+
+def can_fail_over(exc: Exception) -> bool:
+    return is_retryable(exc) or isinstance(exc, CircuitOpenError)
+
+
+class OllamaPool:
+    def __init__(
+        self,
+        base_urls: List[str],
+        routing: str = "affinity",
+        affinity_slack: int = 2,
+        eject_s: float = 30.0,
+        health_interval_s: float = 15.0,
+        max_connections: int = 32,
+        max_keepalive_connections: int = 16,
+        keepalive_expiry_s: float = 60.0,
+        keep_alive: Optional[str] = None,
+        model_keep_alive: Optional[Dict[str, str]] = None,
+        max_retries: int = 2,
+        retry_base_s: float = 0.5,
+        retry_max_s: float = 5.0,
+        breaker_failures: int = 5,
+        breaker_reset_s: float = 30.0,
+    ) -> None:
+        if not base_urls:
+            raise ValueError("At least one Ollama base URL is required")
+        if routing not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown Ollama routing strategy: {routing}")
+        self.routing = routing
+        self.affinity_slack = affinity_slack
+        self.eject_s = eject_s
+        self.health_interval_s = health_interval_s
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections * len(base_urls),
+                max_keepalive_connections=max_keepalive_connections * len(base_urls),
+                keepalive_expiry=keepalive_expiry_s,
+            ),
+        )
+        urls = list(dict.fromkeys(base_urls))
+        # With several hosts a failed call moves to the next host right away,
+        # so the per-host retries with backoff are only used for a single host.
+        self.backends = [
+            Backend(
+                url,
+                OllamaClient(
+                    url,
+                    keep_alive=keep_alive,
+                    http_client=self._http,
+                    model_keep_alive=model_keep_alive,
+                    max_retries=max_retries if len(urls) == 1 else 0,
+                    retry_base_s=retry_base_s,
+                    retry_max_s=retry_max_s,
+                    breaker=CircuitBreaker(breaker_failures, breaker_reset_s),
+                ),
+            )
+            for url in urls
+        ]
+        self._affinity: Dict[str, str] = {}
+        self._health_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "OllamaPool":
+        raw = os.getenv("OLLAMA_BASE_URLS") or os.getenv("OLLAMA_BASE_URL", DEFAULT_BASE_URL)
+        return cls(
+            parse_base_urls(raw),
+            routing=os.getenv("OLLAMA_ROUTING", "affinity"),
+            affinity_slack=int(os.getenv("OLLAMA_AFFINITY_SLACK", "2")),
+            eject_s=float(os.getenv("OLLAMA_EJECT_S", "30")),
+            health_interval_s=float(os.getenv("OLLAMA_HEALTH_INTERVAL_S", "15")),
+            max_connections=int(os.getenv("OLLAMA_MAX_CONNECTIONS", "32")),
+            max_keepalive_connections=int(os.getenv("OLLAMA_MAX_KEEPALIVE", "16")),
+            keepalive_expiry_s=float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY_S", "60")),
+            keep_alive=os.getenv("OLLAMA_KEEP_ALIVE") or None,
+            model_keep_alive=parse_keep_alive(os.getenv("OLLAMA_MODEL_KEEP_ALIVE", "")),
+            max_retries=int(os.getenv("OLLAMA_RETRIES", "2")),
+            retry_base_s=float(os.getenv("OLLAMA_RETRY_BASE_S", "0.5")),
+            retry_max_s=float(os.getenv("OLLAMA_RETRY_MAX_S", "5")),
+            breaker_failures=int(os.getenv("OLLAMA_BREAKER_FAILURES", "5")),
+            breaker_reset_s=float(os.getenv("OLLAMA_BREAKER_RESET_S", "30")),
+        )
+
+    @property
+    def base_urls(self) -> List[str]:
+        return [backend.url for backend in self.backends]
+
+    async def start(self) -> None:
+        await self.check_health()
+        if self.health_interval_s > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await self._http.aclose()
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval_s)
+            await self.check_health()
+
+    async def check_health(self) -> None:
+        await asyncio.gather(*(self._probe(backend) for backend in self.backends))
+
+    async def _probe(self, backend: Backend) -> None:
+        try:
+            backend.models = await backend.client.list_models(timeout_s=5.0)
+        except Exception as exc:
+            if backend.healthy:
+                logger.warning("ollama_backend_unhealthy backend=%s error=%s", backend.url, exc)
+            self._eject(backend)
+            return
+        if not backend.healthy:
+            logger.info("ollama_backend_recovered backend=%s", backend.url)
+        backend.healthy = True
+
+    def _eject(self, backend: Backend) -> None:
+        backend.healthy = False
+        backend.ejected_until = time.monotonic() + self.eject_s
+
+    def _failed(self, backend: Backend, model: str, exc: Exception) -> None:
+        backend.failures += 1
+        self._eject(backend)
+        if self._affinity.get(model) == backend.url:
+            self._affinity.pop(model)
+        logger.warning(
+            "ollama_backend_ejected backend=%s model=%s eject_s=%s error=%s",
+            backend.url,
+            model,
+            self.eject_s,
+            exc,
+        )
+
+    def _succeeded(self, backend: Backend, model: str) -> None:
+        if not backend.healthy:
+            logger.info("ollama_backend_recovered backend=%s", backend.url)
+        backend.healthy = True
+        self._affinity[model] = backend.url
+
+    def pick(self, model: str, exclude: Set[str]) -> Backend:
+        now = time.monotonic()
+        remaining = [backend for backend in self.backends if backend.url not in exclude]
+        candidates = [backend for backend in remaining if backend.available(now)] or remaining
+        if not candidates:
+            raise NoBackendError("No Ollama backend available")
+        serving = [backend for backend in candidates if model in backend.models]
+        if serving:
+            candidates = serving
+
+        least = min(candidates, key=lambda backend: backend.outstanding)
+        if self.routing == "affinity":
+            preferred = self._affinity.get(model)
+            for backend in candidates:
+                if (
+                    backend.url == preferred
+                    and backend.outstanding <= least.outstanding + self.affinity_slack
+                ):
+                    return backend
+        return least
+
+    async def generate(self, model: str, prompt: str, **kwargs) -> str:
+        tried: Set[str] = set()
+        while True:
+            backend = self.pick(model, tried)
+            backend.outstanding += 1
+            backend.requests += 1
+            try:
+                result = await backend.client.generate(model=model, prompt=prompt, **kwargs)
+            except Exception as exc:
+                if not can_fail_over(exc):
+                    raise
+                self._failed(backend, model, exc)
+                tried.add(backend.url)
+                if len(tried) == len(self.backends):
+                    raise
+                logger.info("ollama_retry_elsewhere model=%s failed_backend=%s", model, backend.url)
+                continue
+            finally:
+                backend.outstanding -= 1
+            self._succeeded(backend, model)
+            return result
+
+    async def generate_stream(self, model: str, prompt: str, **kwargs) -> AsyncIterator[str]:
+        tried: Set[str] = set()
+        while True:
+            backend = self.pick(model, tried)
+            backend.outstanding += 1
+            backend.requests += 1
+            started = False
+            try:
+                async for token in backend.client.generate_stream(
+                    model=model,
+                    prompt=prompt,
+                    **kwargs,
+                ):
+                    started = True
+                    yield token
+            except Exception as exc:
+                if not can_fail_over(exc):
+                    raise
+                self._failed(backend, model, exc)
+                tried.add(backend.url)
+                if started or len(tried) == len(self.backends):
+                    raise
+                logger.info("ollama_retry_elsewhere model=%s failed_backend=%s", model, backend.url)
+                continue
+            finally:
+                backend.outstanding -= 1
+            self._succeeded(backend, model)
+            return
+
+    async def load_model(self, model: str, timeout_s: float = 600.0) -> float:
+        backend = self.pick(model, set())
+        backend.outstanding += 1
+        try:
+            load_ms = await backend.client.load_model(model, timeout_s=timeout_s)
+        except Exception as exc:
+            if is_retryable(exc):
+                self._failed(backend, model, exc)
+            raise
+        finally:
+            backend.outstanding -= 1
+        self._succeeded(backend, model)
+        return load_ms
+
+    async def list_running(self, timeout_s: float = 5.0) -> List[Dict[str, Any]]:
+        results = await asyncio.gather(
+            *(backend.client.list_running(timeout_s=timeout_s) for backend in self.backends),
+            return_exceptions=True,
+        )
+        merged: Dict[str, Dict[str, Any]] = {}
+        for backend, result in zip(self.backends, results):
+            if isinstance(result, BaseException):
+                continue
+            backend.running = result
+            for entry in result:
+                info = merged.setdefault(entry["name"], {**entry, "backends": []})
+                info["backends"].append(backend.url)
+        return list(merged.values())
+
+    async def list_models(self, timeout_s: float = 10.0) -> List[str]:
+        return [entry["name"] for entry in await self.list_model_info(timeout_s=timeout_s)]
+
+    async def list_model_info(self, timeout_s: float = 10.0) -> List[Dict[str, Any]]:
+        results = await asyncio.gather(
+            *(backend.client.list_model_info(timeout_s=timeout_s) for backend in self.backends),
+            return_exceptions=True,
+        )
+        merged: Dict[str, Dict[str, Any]] = {}
+        errors: List[BaseException] = []
+        for backend, result in zip(self.backends, results):
+            if isinstance(result, BaseException):
+                errors.append(result)
+                continue
+            backend.models = [entry["name"] for entry in result]
+            for entry in result:
+                info = merged.setdefault(entry["name"], {**entry, "backends": []})
+                info["backends"].append(backend.url)
+        if errors and len(errors) == len(self.backends):
+            raise errors[0]
+        return list(merged.values())
+
+    def stats(self) -> List[Dict[str, object]]:
+        now = time.monotonic()
+        return [
+            {
+                "url": backend.url,
+                "healthy": backend.healthy,
+                "available": backend.available(now),
+                "outstanding": backend.outstanding,
+                "requests": backend.requests,
+                "failures": backend.failures,
+                "circuit": backend.client.breaker.state,
+                "circuit_opens": backend.client.breaker.opens,
+                "models": backend.models,
+            }
+            for backend in self.backends
+        ]
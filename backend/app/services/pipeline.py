@@ -1,99 +1,815 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
-from typing import Any, Dict, Tuple
-
-from app.schemas.run import AttemptSummary, JudgeReport, RunRequest, StepState
-from app.services.ollama_client import OllamaClient
-from app.services.prompt_loader import load_prompt
-from app.services.run_store import update_run, update_step
+import os
+import random
+import time
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.schemas.run import (
+    AttemptSummary,
+    CandidateSummary,
+    JudgeReport,
+    RunRequest,
+    RunState,
+    StepMetrics,
+    StepState,
+)
+from app.services.dag import DagRun, StepGraph, StepSpec
+from app.services.json_repair import JsonRepairError, parse_json
+from app.services.metrics import (
+    JSON_PARSE_RETRIES,
+    JSON_REPAIRS,
+    JUDGE_SCORE,
+    PREJUDGE_VERDICTS,
+    observe_run,
+    observe_step,
+)
+from app.services.ollama_client import GenerateStats
+from app.services.prejudge import BORDERLINE_MODEL, PREJUDGE_ENABLED, prejudge
+from app.services.prompt_compaction import (
+    DEDUPE_JD,
+    JD_REFERENCE,
+    VERBOSE_JSON,
+    estimate_tokens,
+    keywords,
+    prompt_json,
+    token_budget,
+    truncate_by_relevance,
+)
+from app.services.prompt_context import (
+    build_context_prefix,
+    render_with_context,
+    step_metrics,
+)
+from app.services.resilience import (
+    STEP_LATENCY,
+    TIMEOUT_MAX_S,
+    hedge_after_s,
+    step_timeout_s,
+)
+from app.services.run_events import publish
+from app.services.run_store import get_run, update_run, update_step
+from app.services.scheduler import ScheduledClient
+from app.storage.step_cache import get_step_cache, make_cache_key
 
 JSON_NUDGE = "\n\nReturn valid JSON only. Do not wrap in code fences."
+STEP_NAMES = ("step1", "step2", "step3", "step4", "step5", "step6")
+CANDIDATE_SHARED_STEPS = ("step1", "step2", "step3")
+CANDIDATE_STEPS = ("step4", "step5", "step6")
+CANDIDATE_TEMPERATURE_STEP = float(os.getenv("CANDIDATE_TEMPERATURE_STEP", "0.15"))
+STRUCTURED_OUTPUT = os.getenv("OLLAMA_STRUCTURED_OUTPUT", "1") != "0"
+HISTORY_KEEP_RAW = os.getenv("RUN_HISTORY_KEEP_RAW", "0") == "1"
+STREAM_STORE_INTERVAL_S = float(os.getenv("STREAM_STORE_INTERVAL_S", "0.25"))
+STREAM_STORE_TOKENS = int(os.getenv("STREAM_STORE_TOKENS", "64"))
+OBJECT_SCHEMA: Dict[str, Any] = {"type": "object"}
+ANSWER_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "answer": {"type": "string"},
+        # Any shape prejudge.evidence_entries reads: a claim-to-evidence
+        # object, a list of evidence, or nothing.
+        "evidence_map": {"type": ["object", "array", "null"]},
+    },
+    "required": ["answer"],
+}
+JUDGE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "number"},
+        "reasons": {"type": "array", "items": {"type": "string"}},
+        "fixes": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["score"],
+}
 logger = logging.getLogger("app.pipeline")
 
 
-def format_prompt(template: str, **values: str) -> str:
-    try:
-        return template.format(**values)
-    except KeyError as exc:
-        missing = exc.args[0]
-        raise RuntimeError(f"Prompt missing placeholder: {missing}") from exc
+async def generate_text(
+    client: ScheduledClient,
+    model: str,
+    prompt: str,
+    temperature: float,
+    format_json: bool,
+    run_id: Optional[str] = None,
+    step_name: Optional[str] = None,
+    stats: Optional[GenerateStats] = None,
+    seed: Optional[int] = None,
+    format_schema: Optional[Dict[str, Any]] = None,
+    timeout_s: float = TIMEOUT_MAX_S,
+    hedge_s: Optional[float] = None,
+) -> str:
+    if step_name is None:
+        return await client.generate(
+            model=model,
+            prompt=prompt,
+            temperature=temperature,
+            format_json=format_json,
+            stats=stats,
+            seed=seed,
+            format_schema=format_schema,
+            timeout_s=timeout_s,
+            hedge_after_s=hedge_s,
+        )
+
+    # Subscribers get every token through publish(); the stored text only
+    # needs to be fresh enough for polling readers, so it is written every
+    # STREAM_STORE_TOKENS tokens or STREAM_STORE_INTERVAL_S seconds, and once
+    # in full at the end.
+    text = ""
+    parts: List[str] = []
+    last_write = time.monotonic()
+    async for token in client.generate_stream(
+        model=model,
+        prompt=prompt,
+        temperature=temperature,
+        format_json=format_json,
+        stats=stats,
+        seed=seed,
+        format_schema=format_schema,
+        timeout_s=timeout_s,
+    ):
+        parts.append(token)
+        publish(run_id, {"type": "token", "step": step_name, "delta": token})
+        now = time.monotonic()
+        if len(parts) >= STREAM_STORE_TOKENS or now - last_write >= STREAM_STORE_INTERVAL_S:
+            text += "".join(parts)
+            parts.clear()
+            last_write = now
+            await update_step(run_id, step_name, output_text=text)
+    text += "".join(parts)
+    await update_step(run_id, step_name, output_text=text)
+    return text
 
 
 async def run_json_step(
-    client: OllamaClient,
+    client: ScheduledClient,
     model: str,
     prompt: str,
     temperature: float,
+    run_id: Optional[str] = None,
+    stream_step: Optional[str] = None,
+    use_cache: bool = False,
+    read_cache: bool = True,
+    stats: Optional[GenerateStats] = None,
+    seed: Optional[int] = None,
+    schema: Optional[Dict[str, Any]] = None,
+    timeout_s: float = TIMEOUT_MAX_S,
+    hedge_s: Optional[float] = None,
 ) -> Tuple[Dict[str, Any], str]:
-    raw = await client.generate(
-        model=model,
-        prompt=prompt,
-        temperature=temperature,
+    cache = get_step_cache() if use_cache else None
+    cache_key = None
+    if cache is not None:
+        cache_key = make_cache_key(
+            model,
+            prompt,
+            {"temperature": temperature, "format": format_for(schema)},
+        )
+        if read_cache:
+            cached = await cache.get(cache_key)
+            if cached is not None:
+                logger.info("step_cache_hit model=%s key=%s", model, cache_key[:12])
+                return parse_json(cached, schema)[0], cached
+
+    output, raw = await generate_json(
+        client,
+        model,
+        prompt,
+        temperature,
+        run_id=run_id,
+        stream_step=stream_step,
+        stats=stats,
+        seed=seed,
+        schema=schema,
+        timeout_s=timeout_s,
+        hedge_s=hedge_s,
+    )
+    if cache is not None:
+        await cache.put(cache_key, model, raw)
+    return output, raw
+
+
+def format_for(schema: Optional[Dict[str, Any]]) -> Any:
+    return schema if STRUCTURED_OUTPUT and schema is not None else "json"
+
+
+async def generate_json(
+    client: ScheduledClient,
+    model: str,
+    prompt: str,
+    temperature: float,
+    run_id: Optional[str] = None,
+    stream_step: Optional[str] = None,
+    stats: Optional[GenerateStats] = None,
+    seed: Optional[int] = None,
+    schema: Optional[Dict[str, Any]] = None,
+    timeout_s: float = TIMEOUT_MAX_S,
+    hedge_s: Optional[float] = None,
+) -> Tuple[Dict[str, Any], str]:
+    format_schema = schema if STRUCTURED_OUTPUT else None
+    raw = await generate_text(
+        client,
+        model,
+        prompt,
+        temperature,
         format_json=True,
+        run_id=run_id,
+        step_name=stream_step,
+        stats=stats,
+        seed=seed,
+        format_schema=format_schema,
+        timeout_s=timeout_s,
+        hedge_s=hedge_s,
     )
     try:
-        return json.loads(raw), raw
-    except json.JSONDecodeError:
-        logger.warning("json_parse_failed model=%s retry=true", model)
-        raw = await client.generate(
-            model=model,
-            prompt=prompt + JSON_NUDGE,
-            temperature=temperature,
+        output, repaired = parse_json(raw, schema)
+    except JsonRepairError as exc:
+        logger.warning("json_parse_failed model=%s retry=true error=%s", model, exc)
+        if stream_step is not None:
+            publish(run_id, {"type": "reset", "step": stream_step})
+        raw = await generate_text(
+            client,
+            model,
+            prompt + JSON_NUDGE,
+            temperature,
             format_json=True,
+            run_id=run_id,
+            step_name=stream_step,
+            stats=stats,
+            seed=seed,
+            format_schema=format_schema,
+            timeout_s=timeout_s,
+            hedge_s=hedge_s,
         )
         try:
-            return json.loads(raw), raw
-        except json.JSONDecodeError as exc:
-            logger.error("json_parse_failed model=%s retry=false", model)
-            raise ValueError("Invalid JSON returned by model") from exc
+            output, repaired = parse_json(raw, schema)
+        except JsonRepairError as exc:
+            logger.error("json_parse_failed model=%s retry=false error=%s", model, exc)
+            JSON_PARSE_RETRIES.inc(model=model, outcome="failed")
+            raise ValueError(f"Invalid JSON returned by model: {exc}") from exc
+        JSON_PARSE_RETRIES.inc(model=model, outcome="recovered")
+    if repaired:
+        logger.info("json_repaired model=%s", model)
+        JSON_REPAIRS.inc(model=model)
+    return output, raw
+
+
+async def finish_run(run_id: str, **updates) -> None:
+    await update_run(run_id, current_step=None, **updates)
+    publish(run_id, {"type": "end", "status": updates.get("status")})
+
+
+def new_run_state(run_id: str) -> RunState:
+    return RunState(run_id=run_id, steps={name: StepState() for name in STEP_NAMES})
 
 
-def clone_step(step: StepState) -> StepState:
-    return StepState(**step.model_dump())
+def history_step(step: StepState) -> StepState:
+    if HISTORY_KEEP_RAW or step.output_json is None or step.output_text is None:
+        return step
+    return step.model_copy(update={"output_text": None})
+
+
+def judge_report_from(output: Dict[str, Any], raw: str) -> JudgeReport:
+    return JudgeReport(
+        score=output.get("score"),
+        reasons=output.get("reasons", []),
+        fixes=output.get("fixes", []),
+        raw_text=raw or None,
+        prejudge=output.get("prejudge"),
+    )
+
+
+STEP1 = StepSpec(
+    name="step1",
+    deps=(),
+    prompt_file="step1_question_analysis.txt",
+    temperature=0.2,
+    cacheable=True,
+    schema=OBJECT_SCHEMA,
+    values=lambda req, outputs, context: {"question": req.question},
+)
+STEP2 = StepSpec(
+    name="step2",
+    deps=(),
+    prompt_file="step2_jd_analysis.txt",
+    temperature=0.2,
+    cacheable=True,
+    schema=OBJECT_SCHEMA,
+    values=lambda req, outputs, context: {"jd_text": req.jd_text},
+    retry=StepSpec(
+        name="step2",
+        deps=("step1", "step3"),
+        prompt_file="step2_jd_analysis_retry.txt",
+        temperature=0.2,
+        context_prefix=True,
+        schema=OBJECT_SCHEMA,
+        values=lambda req, outputs, context: {
+            "jd_text": req.jd_text,
+            "critique": context["critique"],
+        },
+    ),
+)
+STEP3 = StepSpec(
+    name="step3",
+    deps=(),
+    prompt_file="step3_resume_analysis.txt",
+    temperature=0.2,
+    cacheable=True,
+    schema=OBJECT_SCHEMA,
+    values=lambda req, outputs, context: {"resume_text": req.resume_text},
+)
+STEP4 = StepSpec(
+    name="step4",
+    deps=("step1", "step2", "step3"),
+    prompt_file="step4_answer.txt",
+    temperature=0.5,
+    stream=True,
+    context_prefix=True,
+    schema=ANSWER_SCHEMA,
+    values=lambda req, outputs, context: {
+        "question": req.question,
+        "jd_text": req.jd_text,
+        "resume_text": req.resume_text,
+        "step1_json": prompt_json(outputs["step1"]),
+        "step2_json": prompt_json(outputs["step2"]),
+        "step3_json": prompt_json(outputs["step3"]),
+    },
+)
+STEP5 = StepSpec(
+    name="step5",
+    deps=("step4",),
+    prompt_file="step5_custom_transform.txt",
+    temperature=0.4,
+    json_mode=False,
+    stream=True,
+    values=lambda req, outputs, context: {
+        "custom_prompt_text": req.custom_prompt_text,
+        "draft_answer": outputs["step4"].get("answer", ""),
+        "evidence_map": prompt_json(outputs["step4"].get("evidence_map", {})),
+    },
+    skip_if=lambda req: not req.custom_prompt_text,
+    skip_output=lambda outputs: outputs["step4"].get("answer", ""),
+)
+STEP6 = StepSpec(
+    name="step6",
+    deps=("step1", "step2", "step3", "step5"),
+    prompt_file="step6_judge.txt",
+    temperature=0.1,
+    context_prefix=True,
+    schema=JUDGE_SCHEMA,
+    values=lambda req, outputs, context: {
+        "question": req.question,
+        "jd_text": req.jd_text,
+        "resume_text": req.resume_text,
+        "final_output": outputs["step5"],
+        "step1_json": prompt_json(outputs["step1"]),
+        "step2_json": prompt_json(outputs["step2"]),
+        "step3_json": prompt_json(outputs["step3"]),
+        "judge_strictness": str(req.judge_strictness),
+    },
+    finalize=judge_report_from,
+    precheck=lambda req, outputs, context: (
+        prejudge(
+            outputs["step5"],
+            outputs,
+            context,
+            req.resume_text,
+            custom_prompt=bool(req.custom_prompt_text),
+        )
+        if PREJUDGE_ENABLED
+        else None
+    ),
+)
+PIPELINE_GRAPH = StepGraph([STEP1, STEP2, STEP3, STEP4, STEP5, STEP6])
+
+
+async def record_step(dag: DagRun, name: str, **changes) -> None:
+    states = dag.context.get("step_states")
+    if states is None:
+        await update_step(dag.context["run_id"], name, **changes)
+        return
+    states[name] = states.get(name, StepState()).model_copy(update=changes)
+
+
+def render_step_prompt(spec: StepSpec, dag: DagRun, req: RunRequest) -> Tuple[str, int]:
+    outputs = dag.outputs
+
+    def render(request: RunRequest) -> str:
+        prefix = None
+        if spec.context_prefix:
+            prefix = build_context_prefix(
+                request,
+                outputs["step1"],
+                outputs["step3"],
+                outputs["step2"] if "step2" in spec.deps else None,
+            )
+        return render_with_context(
+            spec.prompt_file,
+            prefix,
+            **spec.values(request, outputs, dag.context),
+        )
+
+    token = VERBOSE_JSON.set(True)
+    try:
+        baseline = render(req)
+    finally:
+        VERBOSE_JSON.reset(token)
+
+    # Once a step had to cut the resume, later steps of the run use the same
+    # cut so the shared context prefix stays identical.
+    fields = spec.values(req, outputs, dag.context).keys()
+    compact = req
+    if DEDUPE_JD and "step2" in spec.deps:
+        compact = compact.model_copy(update={"jd_text": JD_REFERENCE})
+    resume_tokens = dag.context.get("resume_tokens")
+    if resume_tokens is not None and "resume_text" in fields:
+        compact = compact.model_copy(
+            update={"resume_text": truncate_resume(req, outputs, resume_tokens)}
+        )
+    prompt = render(compact)
+
+    budget = token_budget(req.model)
+    overflow = estimate_tokens(prompt) - budget if budget else 0
+    if overflow > 0 and "step2" in spec.deps and compact.jd_text != JD_REFERENCE:
+        compact = compact.model_copy(update={"jd_text": JD_REFERENCE})
+        prompt = render(compact)
+        overflow = estimate_tokens(prompt) - budget
+    if overflow > 0 and "resume_text" in fields:
+        resume_tokens = estimate_tokens(compact.resume_text) - overflow
+        dag.context["resume_tokens"] = resume_tokens
+        compact = compact.model_copy(
+            update={"resume_text": truncate_resume(req, outputs, resume_tokens)}
+        )
+        prompt = render(compact)
+        overflow = estimate_tokens(prompt) - budget
+    if overflow > 0:
+        logger.warning(
+            "prompt_over_budget run_id=%s step=%s model=%s budget=%s overflow=%s",
+            dag.context["run_id"],
+            spec.name,
+            req.model,
+            budget,
+            overflow,
+        )
+    return prompt, max(0, estimate_tokens(baseline) - estimate_tokens(prompt))
 
 
-async def run_pipeline(run_id: str, req: RunRequest) -> None:
-    client = OllamaClient()
+def truncate_resume(req: RunRequest, outputs: Dict[str, Any], max_tokens: int) -> str:
+    relevant = keywords(
+        req.question,
+        req.jd_text,
+        *(prompt_json(outputs[name]) for name in ("step1", "step2") if name in outputs),
+    )
+    return truncate_by_relevance(req.resume_text, relevant, max(0, max_tokens))
+
+
+async def execute_step(
+    spec: StepSpec,
+    dag: DagRun,
+) -> Any:
+    run_id = dag.context["run_id"]
+    req: RunRequest = dag.context["request"]
+    client: ScheduledClient = dag.context["client"]
+    outputs = dag.outputs
+
+    if spec.skip_if is not None and spec.skip_if(req):
+        await record_step(dag, spec.name, status="skipped")
+        observe_step(spec.name, req.model, "skipped", None)
+        logger.info("step_skipped run_id=%s step=%s", run_id, spec.name)
+        return spec.skip_output(outputs)
+
+    retrying = spec.name in dag.retry_nodes
+    start = time.monotonic()
+    model = req.model
+    verdict = spec.precheck(req, outputs, dag.context) if spec.precheck else None
+    if verdict is not None:
+        PREJUDGE_VERDICTS.inc(model=req.model, verdict=verdict.status)
+        # A clearly failing answer goes back to the retry path with the
+        # synthesized critique, without an LLM call. The last attempt is
+        # always scored by the judge, so a run never finishes on a made-up
+        # score.
+        if verdict.status == "fail" and not dag.context.get("final_attempt"):
+            output = verdict.report()
+            metrics = StepMetrics(duration_ms=round((time.monotonic() - start) * 1000, 2))
+            await record_step(
+                dag,
+                spec.name,
+                status="done",
+                error=None,
+                output_json=output,
+                output_text=None,
+                metrics=metrics,
+            )
+            observe_step(spec.name, req.model, "done", metrics)
+            logger.info(
+                "step_prejudged run_id=%s step=%s reasons=%s",
+                run_id,
+                spec.name,
+                len(verdict.reasons),
+            )
+            return spec.finalize(output, "") if spec.finalize else output
+        if verdict.status == "borderline" and BORDERLINE_MODEL:
+            model = BORDERLINE_MODEL
+        verdict.checks["judge_model"] = model
+
+    stats = GenerateStats()
+    prompt = ""
+    timeout_s = step_timeout_s(model, spec.name)
+    hedge_s = hedge_after_s(model, spec.name)
+    await record_step(dag, spec.name, status="running", error=None)
     try:
         logger.info(
-            "run_start run_id=%s model=%s judge_strictness=%s max_retries=%s",
+            "%s run_id=%s step=%s timeout_s=%s",
+            "step_retry_start" if retrying else "step_start",
             run_id,
-            req.model,
-            req.judge_strictness,
-            req.max_retries,
+            spec.name,
+            timeout_s,
         )
-        await update_run(run_id, status="running", current_step=1, attempt=1)
+        prompt, tokens_saved = render_step_prompt(spec, dag, req)
+        stream_step = spec.name if spec.stream else None
+        if spec.json_mode:
+            output, raw = await run_json_step(
+                client,
+                model,
+                prompt,
+                temperature=spec.temperature,
+                run_id=run_id,
+                stream_step=stream_step,
+                use_cache=spec.cacheable,
+                read_cache=not req.bypass_cache,
+                stats=stats,
+                seed=spec.seed,
+                schema=spec.schema,
+                timeout_s=timeout_s,
+                hedge_s=hedge_s,
+            )
+            metrics = step_metrics(
+                prompt,
+                stats,
+                (time.monotonic() - start) * 1000,
+                tokens_saved,
+                timeout_s,
+            )
+            if verdict is not None:
+                output = {**output, "prejudge": verdict.checks}
+            await record_step(
+                dag,
+                spec.name,
+                status="done",
+                output_json=output,
+                output_text=raw,
+                metrics=metrics,
+            )
+        else:
+            output = raw = await generate_text(
+                client,
+                model,
+                prompt,
+                temperature=spec.temperature,
+                format_json=False,
+                run_id=run_id,
+                step_name=stream_step,
+                stats=stats,
+                seed=spec.seed,
+                timeout_s=timeout_s,
+                hedge_s=hedge_s,
+            )
+            metrics = step_metrics(
+                prompt,
+                stats,
+                (time.monotonic() - start) * 1000,
+                tokens_saved,
+                timeout_s,
+            )
+            await record_step(
+                dag,
+                spec.name,
+                status="done",
+                output_text=output,
+                metrics=metrics,
+            )
+        if stats.calls:
+            STEP_LATENCY.observe(model, spec.name, stats.request_ms / stats.calls / 1000)
+        observe_step(spec.name, model, "done", metrics)
+        result = spec.finalize(output, raw) if spec.finalize else output
+        logger.info("step_done run_id=%s step=%s", run_id, spec.name)
+        return result
+    except Exception as exc:
+        logger.exception("step_failed run_id=%s step=%s error=%s", run_id, spec.name, exc)
+        # Metrics are kept on failure too, so retries and hedges that did not
+        # save the step are still visible.
+        metrics = step_metrics(prompt, stats, (time.monotonic() - start) * 1000, 0, timeout_s)
+        await record_step(dag, spec.name, status="failed", error=str(exc), metrics=metrics)
+        observe_step(spec.name, model, "failed", metrics)
+        raise
+
+
+def new_dag(
+    run_id: str,
+    req: RunRequest,
+    client: ScheduledClient,
+    outputs: Optional[Dict[str, Any]] = None,
+) -> DagRun:
+    async def on_running(names: List[str]) -> None:
+        await update_run(run_id, current_step=int(min(names)[len("step"):]))
+
+    return DagRun(
+        PIPELINE_GRAPH,
+        execute_step,
+        outputs=outputs,
+        context={"run_id": run_id, "request": req, "client": client},
+        on_running=on_running,
+    )
+
+
+def candidate_graph(temperature: float, seed: int) -> StepGraph:
+    return StepGraph(
+        [
+            STEP1,
+            STEP2,
+            STEP3,
+            replace(STEP4, temperature=temperature, seed=seed, stream=False),
+            replace(STEP5, stream=False),
+            STEP6,
+        ]
+    )
 
-        step1_task = asyncio.create_task(run_step1(run_id, client, req))
-        step2_task = asyncio.create_task(run_step2(run_id, client, req))
-        step3_task = asyncio.create_task(run_step3(run_id, client, req))
 
-        step1_result, step2_result, step3_result = await asyncio.gather(
-            step1_task,
-            step2_task,
-            step3_task,
+async def run_candidates(dag: DagRun) -> None:
+    run_id = dag.context["run_id"]
+    req: RunRequest = dag.context["request"]
+    await dag.execute(CANDIDATE_SHARED_STEPS)
+    shared = {name: dag.outputs[name] for name in CANDIDATE_SHARED_STEPS}
+    summaries = [
+        CandidateSummary(
+            index=index,
+            temperature=min(1.0, STEP4.temperature + index * CANDIDATE_TEMPERATURE_STEP),
+            seed=random.randrange(2**31),
+        )
+        for index in range(req.candidates)
+    ]
+    await update_run(run_id, current_step=4, candidates=list(summaries))
+    for name in CANDIDATE_STEPS:
+        await update_step(run_id, name, status="running", error=None)
+    logger.info("candidates_start run_id=%s count=%s", run_id, req.candidates)
+
+    async def run_one(summary: CandidateSummary) -> Tuple[DagRun, Dict[str, StepState]]:
+        states: Dict[str, StepState] = {}
+        branch = DagRun(
+            candidate_graph(summary.temperature, summary.seed),
+            execute_step,
+            outputs=shared,
+            context={**dag.context, "step_states": states},
+        )
+        try:
+            await branch.execute(["step6"])
+            report: JudgeReport = branch.outputs["step6"]
+            summaries[summary.index] = summary.model_copy(
+                update={
+                    "status": "done",
+                    "score": report.score,
+                    "final_output": branch.outputs["step5"],
+                }
+            )
+        except Exception as exc:
+            summaries[summary.index] = summary.model_copy(
+                update={"status": "failed", "error": str(exc)}
+            )
+        logger.info(
+            "candidate_done run_id=%s candidate=%s temp=%.2f status=%s score=%s",
+            run_id,
+            summary.index,
+            summary.temperature,
+            summaries[summary.index].status,
+            summaries[summary.index].score,
+        )
+        await update_run(run_id, candidates=list(summaries))
+        return branch, states
+
+    results = await asyncio.gather(*(run_one(summary) for summary in summaries))
+    finished = [summary for summary in summaries if summary.score is not None]
+    if not finished:
+        errors = "; ".join(summary.error or "missing score" for summary in summaries)
+        raise RuntimeError(f"All {len(summaries)} answer candidates failed: {errors}")
+
+    best = max(finished, key=lambda summary: (summary.score, -summary.index))
+    branch, states = results[best.index]
+    summaries[best.index] = best.model_copy(update={"selected": True})
+    await update_run(run_id, candidates=list(summaries))
+    for name in CANDIDATE_STEPS:
+        state = states[name]
+        await update_step(
+            run_id,
+            name,
+            status=state.status,
+            output_json=state.output_json,
+            output_text=state.output_text,
+            metrics=state.metrics,
+        )
+        dag.outputs[name] = branch.outputs[name]
+    logger.info(
+        "candidate_selected run_id=%s candidate=%s score=%s",
+        run_id,
+        best.index,
+        best.score,
+    )
+
+
+async def adopt_steps(run_id: str, shared_steps: Dict[str, StepState]) -> Dict[str, Any]:
+    outputs: Dict[str, Any] = {}
+    for name, step in shared_steps.items():
+        await update_step(
+            run_id,
+            name,
+            status="done",
+            output_json=step.output_json,
+            output_text=step.output_text,
+            metrics=step.metrics,
+        )
+        outputs[name] = step.output_json
+        logger.info("step_shared run_id=%s step=%s", run_id, name)
+    return outputs
+
+
+async def restore_dag(
+    run_id: str,
+    req: RunRequest,
+    client: ScheduledClient,
+) -> Tuple[DagRun, int]:
+    run = await get_run(run_id)
+    if run is None:
+        raise RuntimeError("Run not found")
+    outputs: Dict[str, Any] = {}
+    for name, spec in PIPELINE_GRAPH.specs.items():
+        step = run.steps.get(name)
+        if step is None:
+            continue
+        if step.status != "done":
+            if step.status != "pending":
+                await update_step(run_id, name, status="pending", error=None)
+            continue
+        value = step.output_json if spec.json_mode else step.output_text
+        outputs[name] = spec.finalize(value, step.output_text or "") if spec.finalize else value
+
+    dag = new_dag(run_id, req, client, outputs)
+    attempt = len(run.attempt_history) + 1
+    last_report = run.attempt_history[-1].judge_report if run.attempt_history else None
+    if last_report is not None:
+        dag.retry_nodes.add("step2")
+        dag.context["critique"] = prompt_json(last_report.model_dump())
+    await update_run(run_id, status="running", attempt=attempt, error=None)
+    logger.info(
+        "run_resumed run_id=%s attempt=%s checkpointed=%s",
+        run_id,
+        attempt,
+        ",".join(sorted(outputs)),
+    )
+    return dag, attempt
+
+
+async def run_pipeline(
+    run_id: str,
+    req: RunRequest,
+    client: ScheduledClient,
+    shared_steps: Optional[Dict[str, StepState]] = None,
+    resume: bool = False,
+) -> None:
+    attempt = 1
+    try:
+        logger.info(
+            "run_start run_id=%s model=%s judge_strictness=%s max_retries=%s resume=%s",
+            run_id,
+            req.model,
+            req.judge_strictness,
+            req.max_retries,
+            resume,
         )
-        step1_json, _ = step1_result
-        step2_json, _ = step2_result
-        step3_json, _ = step3_result
+        if resume:
+            dag, attempt = await restore_dag(run_id, req, client)
+        else:
+            await update_run(run_id, status="running", current_step=1, attempt=1)
+            dag = new_dag(run_id, req, client, await adopt_steps(run_id, shared_steps or {}))
+            attempt = 1
 
-        attempt = 1
         while True:
-            await update_run(run_id, current_step=4, attempt=attempt)
-            final_output, judge_report = await run_answer_attempt(
+            dag.context["final_attempt"] = attempt > req.max_retries
+            if attempt == 1 and req.candidates > 1:
+                await run_candidates(dag)
+            await dag.execute(["step6"])
+            final_output = dag.outputs["step5"]
+            judge_report = dag.outputs["step6"]
+            logger.info(
+                "attempt_done run_id=%s attempt_score=%s",
                 run_id,
-                client,
-                req,
-                step1_json,
-                step2_json,
-                step3_json,
+                judge_report.score,
             )
+            await update_run(run_id, final_output=final_output, judge_report=judge_report)
 
             if judge_report.score is None:
                 raise RuntimeError("Judge report missing score")
+            JUDGE_SCORE.observe(judge_report.score, model=req.model)
 
             if judge_report.score >= req.judge_strictness:
                 logger.info(
@@ -102,10 +818,10 @@ async def run_pipeline(run_id: str, req: RunRequest) -> None:
                     attempt,
                     judge_report.score,
                 )
-                await update_run(
+                observe_run(req.model, "passed", attempt)
+                await finish_run(
                     run_id,
                     status="done",
-                    current_step=None,
                     final_output=final_output,
                     judge_report=judge_report,
                 )
@@ -118,300 +834,36 @@ async def run_pipeline(run_id: str, req: RunRequest) -> None:
                     attempt,
                     judge_report.score,
                 )
-                await update_run(
+                observe_run(req.model, "max_retries", attempt)
+                await finish_run(
                     run_id,
                     status="done",
-                    current_step=None,
                     final_output=final_output,
                     judge_report=judge_report,
                 )
                 return
 
-            await snapshot_attempt(run_id, attempt, final_output, judge_report)
+            invalidated = dag.invalidate("step2")
+            await snapshot_attempt(run_id, attempt, final_output, judge_report, invalidated)
 
             attempt += 1
             logger.info("run_retry run_id=%s next_attempt=%s", run_id, attempt)
-            await update_run(run_id, attempt=attempt, current_step=2)
-            step2_json, _ = await run_step2_retry(
-                run_id,
-                client,
-                req,
-                critique=json.dumps(judge_report.model_dump(), indent=2),
-            )
+            await update_run(run_id, attempt=attempt)
+            dag.context["critique"] = prompt_json(judge_report.model_dump())
 
     except Exception as exc:
         logger.exception("run_failed run_id=%s error=%s", run_id, exc)
-        await update_run(run_id, status="failed", current_step=None, error=str(exc))
-
-
-async def run_step1(
-    run_id: str,
-    client: OllamaClient,
-    req: RunRequest,
-) -> Tuple[Dict[str, Any], str]:
-    await update_step(run_id, "step1", status="running")
-    try:
-        logger.info("step_start run_id=%s step=step1", run_id)
-        prompt = format_prompt(
-            load_prompt("step1_question_analysis.txt"),
-            question=req.question,
-        )
-        output, raw = await run_json_step(client, req.model, prompt, temperature=0.2)
-        await update_step(
-            run_id,
-            "step1",
-            status="done",
-            output_json=output,
-            output_text=raw,
-        )
-        logger.info("step_done run_id=%s step=step1", run_id)
-        return output, raw
-    except Exception as exc:
-        logger.exception("step_failed run_id=%s step=step1 error=%s", run_id, exc)
-        await update_step(run_id, "step1", status="failed", error=str(exc))
-        raise
-
-
-async def run_step2(
-    run_id: str,
-    client: OllamaClient,
-    req: RunRequest,
-) -> Tuple[Dict[str, Any], str]:
-    await update_step(run_id, "step2", status="running")
-    try:
-        logger.info("step_start run_id=%s step=step2", run_id)
-        prompt = format_prompt(
-            load_prompt("step2_jd_analysis.txt"),
-            jd_text=req.jd_text,
-        )
-        output, raw = await run_json_step(client, req.model, prompt, temperature=0.2)
-        await update_step(
-            run_id,
-            "step2",
-            status="done",
-            output_json=output,
-            output_text=raw,
-        )
-        logger.info("step_done run_id=%s step=step2", run_id)
-        return output, raw
-    except Exception as exc:
-        logger.exception("step_failed run_id=%s step=step2 error=%s", run_id, exc)
-        await update_step(run_id, "step2", status="failed", error=str(exc))
-        raise
-
-
-async def run_step2_retry(
-    run_id: str,
-    client: OllamaClient,
-    req: RunRequest,
-    critique: str,
-) -> Tuple[Dict[str, Any], str]:
-    await update_step(run_id, "step2", status="running", error=None)
-    try:
-        logger.info("step_retry_start run_id=%s step=step2", run_id)
-        prompt = format_prompt(
-            load_prompt("step2_jd_analysis_retry.txt"),
-            jd_text=req.jd_text,
-            critique=critique,
-        )
-        output, raw = await run_json_step(client, req.model, prompt, temperature=0.2)
-        await update_step(
-            run_id,
-            "step2",
-            status="done",
-            output_json=output,
-            output_text=raw,
-        )
-        logger.info("step_done run_id=%s step=step2", run_id)
-        return output, raw
-    except Exception as exc:
-        logger.exception("step_failed run_id=%s step=step2 error=%s", run_id, exc)
-        await update_step(run_id, "step2", status="failed", error=str(exc))
-        raise
+        observe_run(req.model, "failed", attempt)
+        await finish_run(run_id, status="failed", error=str(exc))
 
 
-async def run_step3(
+async def run_steps(
     run_id: str,
-    client: OllamaClient,
     req: RunRequest,
-) -> Tuple[Dict[str, Any], str]:
-    await update_step(run_id, "step3", status="running")
-    try:
-        logger.info("step_start run_id=%s step=step3", run_id)
-        prompt = format_prompt(
-            load_prompt("step3_resume_analysis.txt"),
-            resume_text=req.resume_text,
-        )
-        output, raw = await run_json_step(client, req.model, prompt, temperature=0.2)
-        await update_step(
-            run_id,
-            "step3",
-            status="done",
-            output_json=output,
-            output_text=raw,
-        )
-        logger.info("step_done run_id=%s step=step3", run_id)
-        return output, raw
-    except Exception as exc:
-        logger.exception("step_failed run_id=%s step=step3 error=%s", run_id, exc)
-        await update_step(run_id, "step3", status="failed", error=str(exc))
-        raise
-
-
-async def run_step4(
-    run_id: str,
-    client: OllamaClient,
-    req: RunRequest,
-    step1_json: Dict[str, Any],
-    step2_json: Dict[str, Any],
-    step3_json: Dict[str, Any],
-) -> Tuple[Dict[str, Any], str]:
-    await update_step(run_id, "step4", status="running")
-    try:
-        logger.info("step_start run_id=%s step=step4", run_id)
-        prompt = format_prompt(
-            load_prompt("step4_answer.txt"),
-            question=req.question,
-            jd_text=req.jd_text,
-            resume_text=req.resume_text,
-            step1_json=json.dumps(step1_json, indent=2),
-            step2_json=json.dumps(step2_json, indent=2),
-            step3_json=json.dumps(step3_json, indent=2),
-        )
-        output, raw = await run_json_step(client, req.model, prompt, temperature=0.5)
-        await update_step(
-            run_id,
-            "step4",
-            status="done",
-            output_json=output,
-            output_text=raw,
-        )
-        logger.info("step_done run_id=%s step=step4", run_id)
-        return output, raw
-    except Exception as exc:
-        logger.exception("step_failed run_id=%s step=step4 error=%s", run_id, exc)
-        await update_step(run_id, "step4", status="failed", error=str(exc))
-        raise
-
-
-async def run_step5(
-    run_id: str,
-    client: OllamaClient,
-    req: RunRequest,
-    answer_json: Dict[str, Any],
-) -> Tuple[str, str]:
-    if not req.custom_prompt_text:
-        await update_step(run_id, "step5", status="skipped")
-        logger.info("step_skipped run_id=%s step=step5", run_id)
-        return answer_json.get("answer", ""), json.dumps(answer_json, indent=2)
-
-    await update_step(run_id, "step5", status="running")
-    try:
-        logger.info("step_start run_id=%s step=step5", run_id)
-        prompt = format_prompt(
-            load_prompt("step5_custom_transform.txt"),
-            custom_prompt_text=req.custom_prompt_text,
-            draft_answer=answer_json.get("answer", ""),
-            evidence_map=json.dumps(answer_json.get("evidence_map", {}), indent=2),
-        )
-        output = await client.generate(
-            model=req.model,
-            prompt=prompt,
-            temperature=0.4,
-            format_json=False,
-        )
-        await update_step(
-            run_id,
-            "step5",
-            status="done",
-            output_text=output,
-        )
-        logger.info("step_done run_id=%s step=step5", run_id)
-        return output, output
-    except Exception as exc:
-        logger.exception("step_failed run_id=%s step=step5 error=%s", run_id, exc)
-        await update_step(run_id, "step5", status="failed", error=str(exc))
-        raise
-
-
-async def run_step6(
-    run_id: str,
-    client: OllamaClient,
-    req: RunRequest,
-    final_output: str,
-    step1_json: Dict[str, Any],
-    step2_json: Dict[str, Any],
-    step3_json: Dict[str, Any],
-) -> Tuple[JudgeReport, str]:
-    await update_step(run_id, "step6", status="running")
-    try:
-        logger.info("step_start run_id=%s step=step6", run_id)
-        prompt = format_prompt(
-            load_prompt("step6_judge.txt"),
-            question=req.question,
-            jd_text=req.jd_text,
-            resume_text=req.resume_text,
-            final_output=final_output,
-            step1_json=json.dumps(step1_json, indent=2),
-            step2_json=json.dumps(step2_json, indent=2),
-            step3_json=json.dumps(step3_json, indent=2),
-            judge_strictness=str(req.judge_strictness),
-        )
-        output, raw = await run_json_step(client, req.model, prompt, temperature=0.1)
-        report = JudgeReport(
-            score=output.get("score"),
-            reasons=output.get("reasons", []),
-            fixes=output.get("fixes", []),
-            raw_text=raw,
-        )
-        await update_step(
-            run_id,
-            "step6",
-            status="done",
-            output_json=output,
-            output_text=raw,
-        )
-        logger.info("step_done run_id=%s step=step6 score=%s", run_id, report.score)
-        return report, raw
-    except Exception as exc:
-        logger.exception("step_failed run_id=%s step=step6 error=%s", run_id, exc)
-        await update_step(run_id, "step6", status="failed", error=str(exc))
-        raise
-
-
-async def run_answer_attempt(
-    run_id: str,
-    client: OllamaClient,
-    req: RunRequest,
-    step1_json: Dict[str, Any],
-    step2_json: Dict[str, Any],
-    step3_json: Dict[str, Any],
-) -> Tuple[str, JudgeReport]:
-    step4_json, _ = await run_step4(
-        run_id,
-        client,
-        req,
-        step1_json,
-        step2_json,
-        step3_json,
-    )
-    final_output, _ = await run_step5(run_id, client, req, step4_json)
-    judge_report, _ = await run_step6(
-        run_id,
-        client,
-        req,
-        final_output,
-        step1_json,
-        step2_json,
-        step3_json,
-    )
-    logger.info(
-        "attempt_done run_id=%s attempt_score=%s",
-        run_id,
-        judge_report.score,
-    )
-    await update_run(run_id, final_output=final_output, judge_report=judge_report)
-    return final_output, judge_report
+    client: ScheduledClient,
+    targets: List[str],
+) -> Dict[str, Any]:
+    return await new_dag(run_id, req, client).execute(targets)
 
 
 async def snapshot_attempt(
@@ -419,25 +871,35 @@ async def snapshot_attempt(
     attempt: int,
     final_output: str,
     judge_report: JudgeReport,
+    invalidated: Set[str],
 ) -> None:
     from app.services.run_store import mutate_run
 
+    # Only the steps that are about to be re-run are kept in the attempt; the
+    # others stay in run.steps unchanged. StepState objects are never modified
+    # in place, so they are shared rather than copied.
     def _mutate(run) -> None:
         snapshot = AttemptSummary(
             attempt=attempt,
-            steps={name: clone_step(step) for name, step in run.steps.items()},
+            steps={
+                name: history_step(step)
+                for name, step in run.steps.items()
+                if name in invalidated
+            },
+            reused_steps=sorted(set(run.steps) - invalidated),
             final_output=final_output,
             judge_report=judge_report,
         )
         run.attempt_history.append(snapshot)
-        logger.info("attempt_snapshot run_id=%s attempt=%s", run_id, attempt)
+        logger.info(
+            "attempt_snapshot run_id=%s attempt=%s steps=%s",
+            run_id,
+            attempt,
+            ",".join(sorted(snapshot.steps)),
+        )
         run.steps = {
-            "step1": clone_step(run.steps["step1"]),
-            "step2": StepState(),
-            "step3": clone_step(run.steps["step3"]),
-            "step4": StepState(),
-            "step5": StepState(),
-            "step6": StepState(),
+            name: StepState() if name in invalidated else step
+            for name, step in run.steps.items()
         }
 
     await mutate_run(run_id, _mutate)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.services.prompt_compaction import keywords
+
+PREJUDGE_ENABLED = os.getenv("PREJUDGE_ENABLED", "0") == "1"
+MIN_WORDS = int(os.getenv("PREJUDGE_MIN_WORDS", "10"))
+MAX_WORDS = int(os.getenv("PREJUDGE_MAX_WORDS", "800"))
+MIN_INDEX_TERMS = int(os.getenv("PREJUDGE_MIN_INDEX_TERMS", "5"))
+GOOD_TERMS = int(os.getenv("PREJUDGE_GOOD_TERMS", "3"))
+GOOD_EVIDENCE = float(os.getenv("PREJUDGE_GOOD_EVIDENCE", "0.5"))
+BORDERLINE_MODEL = os.getenv("PREJUDGE_BORDERLINE_MODEL") or None
+FAIL_SCORE = 1.0
+SUGGESTED_TERMS = 5
+
+
+@dataclass
+class TermIndex:
+    # Terms that appear in both the JD analysis and the resume analysis,
+    # weighted by how often the JD analysis uses them.
+    shared: Set[str]
+    weights: Counter
+    resume: Set[str]
+
+    def top(self, terms: Set[str], limit: int) -> List[str]:
+        return sorted(terms, key=lambda term: (-self.weights[term], term))[:limit]
+
+
+@dataclass
+class Verdict:
+    status: str
+    checks: Dict[str, Any] = field(default_factory=dict)
+    reasons: List[str] = field(default_factory=list)
+    fixes: List[str] = field(default_factory=list)
+
+    def fail(self, reason: str, fix: str) -> None:
+        self.status = "fail"
+        self.reasons.append(reason)
+        self.fixes.append(fix)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "score": FAIL_SCORE,
+            "reasons": self.reasons,
+            "fixes": self.fixes,
+            "prejudge": self.checks,
+        }
+
+
+def strings(value: Any) -> Iterator[str]:
+    # Keys of the analysis JSON are field names, not content.
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from strings(item)
+
+
+def build_index(jd_analysis: Any, resume_analysis: Any, resume_text: str) -> TermIndex:
+    weights: Counter = Counter()
+    for text in strings(jd_analysis):
+        weights.update(keywords(text))
+    resume_terms = keywords(*strings(resume_analysis))
+    return TermIndex(
+        shared=set(weights) & resume_terms,
+        weights=weights,
+        resume=resume_terms | keywords(resume_text),
+    )
+
+
+def term_index(outputs: Dict[str, Any], context: Dict[str, Any], resume_text: str) -> TermIndex:
+    # Built once per step 2/3 result; a retry re-runs step 2, which replaces
+    # its output object and so the index.
+    key = (id(outputs["step2"]), id(outputs["step3"]))
+    cached: Optional[Tuple[Tuple[int, int], TermIndex]] = context.get("term_index")
+    if cached is None or cached[0] != key:
+        cached = (key, build_index(outputs["step2"], outputs["step3"], resume_text))
+        context["term_index"] = cached
+    return cached[1]
+
+
+def evidence_entries(evidence_map: Any) -> List[Tuple[Set[str], Set[str]]]:
+    if isinstance(evidence_map, dict):
+        items = list(evidence_map.items())
+    elif isinstance(evidence_map, list):
+        items = [(None, item) for item in evidence_map]
+    else:
+        return []
+    entries = []
+    for claim, evidence in items:
+        evidence_terms = keywords(*strings(evidence))
+        claim_terms = keywords(str(claim)) if claim is not None else set()
+        if evidence_terms or claim_terms:
+            entries.append((claim_terms | evidence_terms, evidence_terms))
+    return entries
+
+
+def prejudge(
+    answer: str,
+    outputs: Dict[str, Any],
+    context: Dict[str, Any],
+    resume_text: str,
+    custom_prompt: bool = False,
+) -> Verdict:
+    verdict = Verdict(status="pass")
+    words = len(answer.split())
+    verdict.checks["word_count"] = words
+    if not words:
+        verdict.fail("The answer is empty.", "Write a complete answer to the question.")
+        verdict.checks["verdict"] = verdict.status
+        return verdict
+    answer_terms = keywords(answer)
+    index = term_index(outputs, context, resume_text)
+    step4 = outputs.get("step4")
+    entries = evidence_entries(step4.get("evidence_map") if isinstance(step4, dict) else None)
+    grounded = sum(1 for _, evidence in entries if evidence & index.resume)
+    if entries:
+        verdict.checks["evidence_entries"] = len(entries)
+        verdict.checks["evidence_grounded"] = grounded
+        if not grounded and any(evidence for _, evidence in entries):
+            verdict.fail(
+                "None of the evidence in the evidence map can be found in the resume.",
+                "Only cite experience that appears in the resume.",
+            )
+    if custom_prompt:
+        # A custom transform may legitimately change the length, wording and
+        # language of the answer, so only the checks above apply.
+        verdict.checks["verdict"] = verdict.status
+        return verdict
+
+    if words < MIN_WORDS:
+        verdict.fail(
+            f"The answer has {words} words; at least {MIN_WORDS} are expected.",
+            "Expand the answer with a concrete example from the resume.",
+        )
+    if words > MAX_WORDS:
+        verdict.fail(
+            f"The answer has {words} words; at most {MAX_WORDS} are expected.",
+            f"Cut the answer to under {MAX_WORDS} words, keeping the strongest evidence.",
+        )
+
+    # Skill coverage only makes an answer borderline: behavioral questions can
+    # be answered well without naming any of the role's skills.
+    covered = index.shared & answer_terms
+    verdict.checks["terms_indexed"] = len(index.shared)
+    verdict.checks["terms_covered"] = len(covered)
+    if (
+        len(index.shared) >= MIN_INDEX_TERMS
+        and len(covered) < GOOD_TERMS
+        and verdict.status == "pass"
+    ):
+        verdict.status = "borderline"
+
+    if entries:
+        used = sum(1 for terms, _ in entries if terms & answer_terms)
+        verdict.checks["evidence_used"] = used
+        if not used:
+            verdict.fail(
+                "The answer uses none of the evidence from the evidence map.",
+                "Support each claim with the evidence listed in the evidence map.",
+            )
+        elif used / len(entries) < GOOD_EVIDENCE and verdict.status == "pass":
+            verdict.status = "borderline"
+    verdict.checks["verdict"] = verdict.status
+    return verdict
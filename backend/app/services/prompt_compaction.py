@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import re
+from contextvars import ContextVar
+from typing import Any, List, Set
+
+from app.services.config import parse_model_limits
+
+logger = logging.getLogger("app.prompt_compaction")
+
+JSON_MINIFY = os.getenv("PROMPT_JSON_MINIFY", "1") == "1"
+DEDUPE_JD = os.getenv("PROMPT_DEDUPE_JD", "0") == "1"
+DEFAULT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))
+TOKEN_BUDGETS = parse_model_limits(os.getenv("PROMPT_TOKEN_BUDGETS", ""))
+JD_REFERENCE = "[Summarized in the JOB DESCRIPTION ANALYSIS.]"
+OMITTED_MARKER = "[...]"
+
+# Rough BPE behaviour: common words are one token and long ones split every
+# ~6 characters, numbers split every 3 digits, punctuation is a token of its
+# own and a newline with its indentation is a single token.
+TOKEN_RE = re.compile(r"[A-Za-z]+|\d+|\n[ \t]*|[^\sA-Za-z\d]")
+WORD_RE = re.compile(r"[a-z][a-z0-9+#.-]{2,}")
+SECTION_RE = re.compile(r"\n\s*\n|\n(?=[A-Z][A-Z &/-]{2,}:?\s*\n)")
+STOPWORDS = frozenset(
+    "and are but can for from has have her his how its not our out that the their them "
+    "then there they this was were what when where which who why will with you your "
+    "about into over also been more most such than very".split()
+)
+
+# Set while rendering the uncompacted baseline, so tokens saved by JSON
+# minification are counted too.
+VERBOSE_JSON: ContextVar[bool] = ContextVar("verbose_json", default=False)
+
+
+def estimate_tokens(text: str) -> int:
+    total = 0
+    for match in TOKEN_RE.findall(text):
+        if match[0].isalpha():
+            total += math.ceil(len(match) / 6)
+        elif match[0].isdigit():
+            total += math.ceil(len(match) / 3)
+        else:
+            total += 1
+    return total
+
+
+def prompt_json(value: Any) -> str:
+    if VERBOSE_JSON.get() or not JSON_MINIFY:
+        return json.dumps(value, indent=2)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def token_budget(model: str) -> int:
+    return TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+
+def keywords(*texts: str) -> Set[str]:
+    words: Set[str] = set()
+    for text in texts:
+        words.update(word.strip(".-") for word in WORD_RE.findall(text.lower()))
+    return words - STOPWORDS
+
+
+def split_sections(text: str) -> List[str]:
+    return [section for section in SECTION_RE.split(text) if section.strip()]
+
+
+def truncate_by_relevance(text: str, relevant: Set[str], max_tokens: int) -> str:
+    sections = split_sections(text)
+    if len(sections) < 2 or estimate_tokens(text) <= max_tokens:
+        return text
+    costs = [estimate_tokens(section) for section in sections]
+    # The first section is usually the name and headline; it is always kept.
+    keep = {0}
+    used = costs[0]
+    ranked = sorted(
+        range(1, len(sections)),
+        key=lambda index: (
+            -len(keywords(sections[index]) & relevant) / math.sqrt(costs[index] or 1),
+            index,
+        ),
+    )
+    for index in ranked:
+        if used + costs[index] <= max_tokens:
+            keep.add(index)
+            used += costs[index]
+
+    parts: List[str] = []
+    for index, section in enumerate(sections):
+        if index in keep:
+            parts.append(section.strip("\n"))
+        elif not parts or parts[-1] != OMITTED_MARKER:
+            parts.append(OMITTED_MARKER)
+    logger.info(
+        "resume_truncated sections=%s kept=%s max_tokens=%s",
+        len(sections),
+        len(keep),
+        max_tokens,
+    )
+    return "\n\n".join(parts)
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Optional
+
+from app.schemas.run import RunRequest, StepMetrics
+from app.services.ollama_client import GenerateStats
+from app.services.prompt_compaction import estimate_tokens, prompt_json
+from app.services.prompt_loader import render_prompt
+
+# Ollama keeps the KV cache of the previous prompt per slot and only
+# prefills the part after the longest common prefix. Steps 4, 6 and the
+# step2 retry therefore start with one shared context block, ordered from
+# most to least stable, and the templates get short references instead of
+# a second copy of the same text. This is an opt-in experiment: the
+# response `context` is not passed back, so a hit depends on the next call
+# landing on the same slot, which concurrent runs and several hosts make
+# unlikely.
+PREFIX_REUSE = os.getenv("PROMPT_PREFIX_REUSE", "0") == "1"
+
+CONTEXT_REFERENCES = {
+    "resume_text": "[See RESUME in the shared context above.]",
+    "jd_text": "[See JOB DESCRIPTION in the shared context above.]",
+    "step1_json": "[See QUESTION ANALYSIS in the shared context above.]",
+    "step3_json": "[See RESUME ANALYSIS in the shared context above.]",
+    "step2_json": "[See JOB DESCRIPTION ANALYSIS in the shared context above.]",
+}
+
+
+def build_context_prefix(
+    req: RunRequest,
+    step1_json: Dict[str, Any],
+    step3_json: Dict[str, Any],
+    step2_json: Optional[Dict[str, Any]] = None,
+) -> Optional[str]:
+    if not PREFIX_REUSE:
+        return None
+    sections = [
+        ("RESUME", req.resume_text),
+        ("JOB DESCRIPTION", req.jd_text),
+        ("QUESTION ANALYSIS", prompt_json(step1_json)),
+        ("RESUME ANALYSIS", prompt_json(step3_json)),
+    ]
+    if step2_json is not None:
+        sections.append(("JOB DESCRIPTION ANALYSIS", prompt_json(step2_json)))
+    body = "\n\n".join(f"{title}:\n{text}" for title, text in sections)
+    return f"### SHARED CONTEXT\n{body}\n### END SHARED CONTEXT\n\n"
+
+
+def render_with_context(filename: str, prefix: Optional[str], **values: str) -> str:
+    if prefix is None:
+        return render_prompt(filename, **values)
+    for key in values.keys() & CONTEXT_REFERENCES.keys():
+        values[key] = CONTEXT_REFERENCES[key]
+    return prefix + render_prompt(filename, **values)
+
+
+def step_metrics(
+    prompt: str,
+    stats: GenerateStats,
+    duration_ms: float = 0.0,
+    tokens_saved: int = 0,
+    timeout_s: float = 0.0,
+) -> StepMetrics:
+    metrics = StepMetrics(
+        calls=stats.calls,
+        prompt_tokens_est=estimate_tokens(prompt),
+        prompt_tokens_saved=tokens_saved,
+        prompt_eval_count=stats.prompt_eval_count,
+        prompt_eval_ms=round(stats.prompt_eval_ms, 2),
+        eval_count=stats.eval_count,
+        eval_ms=round(stats.eval_ms, 2),
+        load_ms=round(stats.load_ms, 2),
+        queue_ms=round(stats.queue_ms, 2),
+        coalesced_calls=stats.coalesced,
+        retries=stats.retries,
+        hedged_calls=stats.hedged,
+        hedge_wins=stats.hedge_wins,
+        duration_ms=round(duration_ms, 2),
+        timeout_s=timeout_s,
+    )
+    # An estimate: the expected count comes from estimate_tokens, not the
+    # model's tokenizer, so a gap can be tokenizer drift rather than reuse.
+    if stats.calls and stats.prompt_eval_count:
+        expected = metrics.prompt_tokens_est * stats.calls
+        reused = max(0, expected - stats.prompt_eval_count)
+        metrics.prompt_tokens_reused_est = reused
+        metrics.prefill_ms_saved_est = round(
+            reused * stats.prompt_eval_ms / stats.prompt_eval_count, 2
+        )
+    return metrics
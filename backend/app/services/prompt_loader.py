@@ -1,5 +1,70 @@
+import logging
 import os
+import time
 from pathlib import Path
+from string import Formatter
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+logger = logging.getLogger("app.prompts")
+
+PROMPT_PLACEHOLDERS: Dict[str, FrozenSet[str]] = {
+    "step1_question_analysis.txt": frozenset({"question"}),
+    "step2_jd_analysis.txt": frozenset({"jd_text"}),
+    "step2_jd_analysis_retry.txt": frozenset({"jd_text", "critique"}),
+    "step3_resume_analysis.txt": frozenset({"resume_text"}),
+    "step4_answer.txt": frozenset(
+        {"question", "jd_text", "resume_text", "step1_json", "step2_json", "step3_json"}
+    ),
+    "step5_custom_transform.txt": frozenset(
+        {"custom_prompt_text", "draft_answer", "evidence_map"}
+    ),
+    "step6_judge.txt": frozenset(
+        {
+            "question",
+            "jd_text",
+            "resume_text",
+            "final_output",
+            "step1_json",
+            "step2_json",
+            "step3_json",
+            "judge_strictness",
+        }
+    ),
+}
+RELOAD_INTERVAL_S = float(os.getenv("PROMPT_RELOAD_INTERVAL_S", "2.0"))
+
+
+class PromptTemplate:
+    def __init__(self, name: str, text: str, mtime: float) -> None:
+        self.name = name
+        self.text = text
+        self.mtime = mtime
+        self.segments: List[Tuple[str, Optional[str]]] = []
+        self.simple = True
+        for literal, field, spec, conversion in Formatter().parse(text):
+            if field is not None and (spec or conversion or not field.isidentifier()):
+                self.simple = False
+            self.segments.append((literal, field))
+        self.fields = frozenset(field for _, field in self.segments if field is not None)
+
+    def render(self, **values: str) -> str:
+        try:
+            if not self.simple:
+                return self.text.format(**values)
+            parts: List[str] = []
+            for literal, field in self.segments:
+                parts.append(literal)
+                if field is not None:
+                    parts.append(str(values[field]))
+            return "".join(parts)
+        except KeyError as exc:
+            missing = exc.args[0]
+            raise RuntimeError(f"Prompt missing placeholder: {missing}") from exc
+
+
+PROMPTS: Dict[str, PromptTemplate] = {}
+PROMPTS_PATH: Optional[Path] = None
+LAST_CHECKED: Dict[str, float] = {}
 
 
 def get_prompts_dir() -> Path:
@@ -12,8 +77,82 @@ def get_prompts_dir() -> Path:
     return path
 
 
-def load_prompt(filename: str) -> str:
-    path = get_prompts_dir() / filename
+def read_template(path: Path, name: str) -> PromptTemplate:
     if not path.exists():
         raise FileNotFoundError(f"Prompt file not found: {path}")
-    return path.read_text(encoding="utf-8")
+    template = PromptTemplate(name, path.read_text(encoding="utf-8"), path.stat().st_mtime)
+    unknown = template.fields - PROMPT_PLACEHOLDERS.get(name, template.fields)
+    if unknown:
+        raise RuntimeError(
+            f"Prompt {name} uses unknown placeholders: {', '.join(sorted(unknown))}"
+        )
+    missing = PROMPT_PLACEHOLDERS.get(name, frozenset()) - template.fields
+    if missing:
+        logger.warning(
+            "prompt_placeholders_unused file=%s placeholders=%s",
+            name,
+            ",".join(sorted(missing)),
+        )
+    return template
+
+
+def load_prompts() -> Dict[str, PromptTemplate]:
+    global PROMPTS_PATH
+    prompts_dir = get_prompts_dir()
+    loaded: Dict[str, PromptTemplate] = {}
+    errors: List[str] = []
+    for name in PROMPT_PLACEHOLDERS:
+        try:
+            loaded[name] = read_template(prompts_dir / name, name)
+        except (OSError, RuntimeError) as exc:
+            errors.append(str(exc))
+    if errors:
+        raise RuntimeError("Invalid prompt files:\n" + "\n".join(errors))
+    PROMPTS.clear()
+    PROMPTS.update(loaded)
+    PROMPTS_PATH = prompts_dir
+    now = time.monotonic()
+    for name in loaded:
+        LAST_CHECKED[name] = now
+    logger.info("prompts_loaded dir=%s count=%s", prompts_dir, len(loaded))
+    return PROMPTS
+
+
+def get_template(filename: str) -> PromptTemplate:
+    if PROMPTS_PATH is None:
+        load_prompts()
+    template = PROMPTS.get(filename)
+    now = time.monotonic()
+    if template is not None and now - LAST_CHECKED.get(filename, 0.0) < RELOAD_INTERVAL_S:
+        return template
+
+    LAST_CHECKED[filename] = now
+    path = PROMPTS_PATH / filename
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        if template is None:
+            raise FileNotFoundError(f"Prompt file not found: {path}")
+        logger.error("prompt_missing_keeping_cached file=%s", filename)
+        return template
+    if template is not None and mtime == template.mtime:
+        return template
+
+    try:
+        fresh = read_template(path, filename)
+    except (OSError, RuntimeError) as exc:
+        if template is None:
+            raise
+        logger.error("prompt_reload_failed file=%s error=%s", filename, exc)
+        return template
+    PROMPTS[filename] = fresh
+    logger.info("prompt_reloaded file=%s", filename)
+    return fresh
+
+
+def load_prompt(filename: str) -> str:
+    return get_template(filename).text
+
+
+def render_prompt(filename: str, **values: str) -> str:
+    return get_template(filename).render(**values)
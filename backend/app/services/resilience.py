@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, FrozenSet, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger("app.resilience")
+
+TIMEOUT_MAX_S = float(os.getenv("OLLAMA_TIMEOUT_S", "120"))
+TIMEOUT_MIN_S = float(os.getenv("OLLAMA_TIMEOUT_MIN_S", "30"))
+TIMEOUT_MULTIPLIER = float(os.getenv("OLLAMA_TIMEOUT_MULTIPLIER", "3"))
+LATENCY_WINDOW = int(os.getenv("OLLAMA_LATENCY_WINDOW", "200"))
+LATENCY_MIN_SAMPLES = int(os.getenv("OLLAMA_LATENCY_MIN_SAMPLES", "20"))
+HEDGE_STEPS: FrozenSet[str] = frozenset(
+    step.strip() for step in os.getenv("OLLAMA_HEDGE_STEPS", "").split(",") if step.strip()
+)
+HEDGE_QUANTILE = float(os.getenv("OLLAMA_HEDGE_QUANTILE", "0.95"))
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return False
+
+
+def retry_reason(exc: BaseException) -> str:
+    if isinstance(exc, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(exc, httpx.HTTPStatusError):
+        return "http_5xx"
+    return "transport"
+
+
+def backoff_s(attempt: int, base_s: float, max_s: float) -> float:
+    # Full jitter, so calls that failed together do not retry in lockstep.
+    return random.uniform(0, min(max_s, base_s * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_s: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self.failures = 0
+        self.opens = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        return cls(
+            failure_threshold=int(os.getenv("OLLAMA_BREAKER_FAILURES", "5")),
+            reset_s=float(os.getenv("OLLAMA_BREAKER_RESET_S", "30")),
+        )
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_s:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        # Once the reset period is over, a single call is let through to probe
+        # the host; everything else keeps failing fast until it succeeds.
+        if self.failure_threshold <= 0 or self.opened_at is None:
+            return True
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self, probe: bool = False) -> bool:
+        self.failures += 1
+        if probe:
+            self.probing = False
+        if probe or (
+            self.opened_at is None
+            and self.failure_threshold > 0
+            and self.failures >= self.failure_threshold
+        ):
+            self.opened_at = time.monotonic()
+            self.opens += 1
+            return True
+        return False
+
+    def release(self) -> None:
+        self.probing = False
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+
+    def observe(self, model: str, step: str, seconds: float) -> None:
+        samples = self._samples.get((model, step))
+        if samples is None:
+            samples = self._samples[(model, step)] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def quantile(self, model: str, step: str, q: float) -> Optional[float]:
+        samples = self._samples.get((model, step))
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+STEP_LATENCY = LatencyTracker(LATENCY_WINDOW, LATENCY_MIN_SAMPLES)
+
+
+def step_timeout_s(model: str, step: str) -> float:
+    # Until enough calls have been seen, the fixed OLLAMA_TIMEOUT_S applies.
+    p99 = STEP_LATENCY.quantile(model, step, 0.99)
+    if p99 is None:
+        return TIMEOUT_MAX_S
+    return round(min(TIMEOUT_MAX_S, max(TIMEOUT_MIN_S, p99 * TIMEOUT_MULTIPLIER)), 2)
+
+
+def hedge_after_s(model: str, step: str) -> Optional[float]:
+    if step not in HEDGE_STEPS:
+        return None
+    return STEP_LATENCY.quantile(model, step, HEDGE_QUANTILE)
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, Set
+
+SUBSCRIBERS: Dict[str, Set[asyncio.Queue]] = {}
+
+
+def subscribe(run_id: str) -> asyncio.Queue:
+    queue: asyncio.Queue = asyncio.Queue()
+    SUBSCRIBERS.setdefault(run_id, set()).add(queue)
+    return queue
+
+
+def unsubscribe(run_id: str, queue: asyncio.Queue) -> None:
+    queues = SUBSCRIBERS.get(run_id)
+    if not queues:
+        return
+    queues.discard(queue)
+    if not queues:
+        SUBSCRIBERS.pop(run_id, None)
+
+
+def publish(run_id: str, event: Dict[str, Any]) -> None:
+    for queue in SUBSCRIBERS.get(run_id, ()):
+        queue.put_nowait(event)
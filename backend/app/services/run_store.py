@@ -1,46 +1,408 @@
 import asyncio
-from typing import Dict, Optional
+import itertools
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set
 
-from app.schemas.run import RunState
+from pydantic import BaseModel
 
-RUNS: Dict[str, RunState] = {}
-RUNS_LOCK = asyncio.Lock()
+from app.schemas.run import RunRequest, RunState
+from app.services.run_events import publish
+
+logger = logging.getLogger("app.run_store")
+
+TERMINAL_STATUSES = ("done", "failed", "canceled")
+
+
+@dataclass
+class RunRecord:
+    run_id: str
+    status: str
+    run: RunState
+    # When the run last reached a terminal status; None while it is active.
+    finished_at: Optional[float] = None
+
+
+class RunStoreBackend(ABC):
+    name = "base"
+    # Whether a run evicted from memory can be loaded back.
+    persistent = False
+
+    @abstractmethod
+    async def load(self, run_id: str) -> Optional[RunState]:
+        ...
+
+    @abstractmethod
+    async def save_many(self, records: List[RunRecord]) -> None:
+        ...
+
+    @abstractmethod
+    async def purge(self, finished_before: float) -> int:
+        ...
+
+    @abstractmethod
+    async def save_request(self, run_id: str, request: RunRequest) -> None:
+        ...
+
+    @abstractmethod
+    async def load_request(self, run_id: str) -> Optional[RunRequest]:
+        ...
+
+    @abstractmethod
+    async def list_unfinished(self) -> List[str]:
+        ...
+
+    async def close(self) -> None:
+        return None
+
+
+class MemoryRunStore(RunStoreBackend):
+    name = "memory"
+
+    async def load(self, run_id: str) -> Optional[RunState]:
+        return None
+
+    async def save_many(self, records: List[RunRecord]) -> None:
+        return None
+
+    async def purge(self, finished_before: float) -> int:
+        return 0
+
+    async def save_request(self, run_id: str, request: RunRequest) -> None:
+        return None
+
+    async def load_request(self, run_id: str) -> Optional[RunRequest]:
+        return None
+
+    async def list_unfinished(self) -> List[str]:
+        return []
+
+
+RUNS: "OrderedDict[str, RunState]" = OrderedDict()
+REQUESTS: Dict[str, RunRequest] = {}
+RUN_LOCKS: Dict[str, asyncio.Lock] = {}
+DIRTY: Set[str] = set()
+FINISHED_AT: "OrderedDict[str, float]" = OrderedDict()
+BACKEND: RunStoreBackend = MemoryRunStore()
+HOT_SIZE = int(os.getenv("RUN_STORE_HOT_SIZE", "200"))
+FINISHED_TTL_S = float(os.getenv("RUN_STORE_TTL_S", "3600"))
+MEMORY_EVICT = os.getenv("RUN_STORE_MEMORY_EVICT", "0") == "1"
+FLUSH_INTERVAL_S = float(os.getenv("RUN_STORE_FLUSH_INTERVAL_S", "1.0"))
+RETENTION_S = float(os.getenv("RUN_STORE_RETENTION_S", str(30 * 24 * 3600)))
+POLL_INTERVAL_S = float(os.getenv("RUN_EVENTS_POLL_INTERVAL_S", "0.5"))
+FLUSH_TASK: Optional[asyncio.Task] = None
+READ_THROUGH = False
+
+# RunState and StepState objects held in RUNS are never modified in place.
+# Writers build a shallow copy with the changed fields and swap it in, so
+# readers get a consistent snapshot without taking any lock. Per-run locks
+# only serialize writers of the same run across the backend load.
+#
+# With READ_THROUGH (queue mode), other processes write most runs, so reads
+# go to the backend unless this process is driving the run itself.
+
+
+def to_jsonable(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, list):
+        return [to_jsonable(item) for item in value]
+    return value
+
+
+def create_backend() -> RunStoreBackend:
+    kind = os.getenv("RUN_STORE_BACKEND", "memory")
+    if kind == "memory":
+        return MemoryRunStore()
+    if kind == "sqlite":
+        from app.storage.sqlite_run_store import SqliteRunStore
+
+        return SqliteRunStore.from_env()
+    raise RuntimeError(f"Unknown RUN_STORE_BACKEND: {kind}")
+
+
+async def open_run_store(
+    backend: Optional[RunStoreBackend] = None,
+    read_through: bool = False,
+) -> None:
+    global BACKEND, FLUSH_TASK, READ_THROUGH
+    BACKEND = backend or create_backend()
+    READ_THROUGH = read_through
+    FLUSH_TASK = asyncio.create_task(flush_loop())
+    logger.info(
+        "run_store_opened backend=%s hot_size=%s read_through=%s",
+        BACKEND.name,
+        HOT_SIZE,
+        read_through,
+    )
+
+
+async def close_run_store() -> None:
+    global FLUSH_TASK
+    if FLUSH_TASK is not None:
+        FLUSH_TASK.cancel()
+        try:
+            await FLUSH_TASK
+        except asyncio.CancelledError:
+            pass
+        FLUSH_TASK = None
+    await flush()
+    await BACKEND.close()
+    logger.info("run_store_closed backend=%s", BACKEND.name)
+
+
+async def flush_loop() -> None:
+    last_purge = 0.0
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL_S)
+        try:
+            await flush()
+            evict_finished()
+            now = time.time()
+            if now - last_purge > 3600:
+                last_purge = now
+                purged = await BACKEND.purge(now - RETENTION_S)
+                if purged:
+                    logger.info("run_store_purged count=%s", purged)
+        except Exception as exc:
+            logger.exception("run_store_flush_failed error=%s", exc)
+
+
+async def flush(run_ids: Optional[Set[str]] = None) -> None:
+    targets = set(DIRTY) if run_ids is None else DIRTY & run_ids
+    records = [
+        RunRecord(run_id, RUNS[run_id].status, RUNS[run_id], FINISHED_AT.get(run_id))
+        for run_id in targets
+        if run_id in RUNS
+    ]
+    DIRTY.difference_update(targets)
+    if records:
+        await BACKEND.save_many(records)
+
+
+def forget(run_id: str) -> None:
+    RUNS.pop(run_id, None)
+    REQUESTS.pop(run_id, None)
+    FINISHED_AT.pop(run_id, None)
+    lock = RUN_LOCKS.get(run_id)
+    if lock is not None and not lock.locked():
+        RUN_LOCKS.pop(run_id)
+
+
+def can_evict() -> bool:
+    # With the memory backend an evicted run is gone for good, so finished
+    # runs are only dropped there when explicitly asked for.
+    return BACKEND.persistent or MEMORY_EVICT
+
+
+def evict_finished() -> None:
+    if not can_evict():
+        return
+    now = time.time()
+    expired = [
+        run_id
+        for run_id, finished_at in FINISHED_AT.items()
+        if now - finished_at > FINISHED_TTL_S and run_id not in DIRTY
+    ]
+    for run_id in expired:
+        forget(run_id)
+    trim_hot_cache()
+    if expired:
+        logger.info("run_store_evicted count=%s", len(expired))
+
+
+def trim_hot_cache() -> None:
+    # FINISHED_AT is kept in least-recently-used order, so only its head is
+    # looked at; dirty runs are skipped until they have been flushed.
+    overflow = len(FINISHED_AT) - HOT_SIZE
+    if overflow <= 0 or not can_evict():
+        return
+    for run_id in list(itertools.islice(FINISHED_AT, overflow + len(DIRTY))):
+        if overflow <= 0:
+            break
+        if run_id not in DIRTY:
+            forget(run_id)
+            overflow -= 1
+
+
+def run_lock(run_id: str) -> asyncio.Lock:
+    lock = RUN_LOCKS.get(run_id)
+    if lock is None:
+        lock = RUN_LOCKS[run_id] = asyncio.Lock()
+    return lock
+
+
+def touch(run: RunState) -> None:
+    RUNS[run.run_id] = run
+    RUNS.move_to_end(run.run_id)
+    if run.status in TERMINAL_STATUSES:
+        if run.run_id in FINISHED_AT:
+            FINISHED_AT.move_to_end(run.run_id)
+        else:
+            FINISHED_AT[run.run_id] = time.time()
+        trim_hot_cache()
+    else:
+        FINISHED_AT.pop(run.run_id, None)
+
+
+def store(run: RunState) -> None:
+    DIRTY.add(run.run_id)
+    touch(run)
+
+
+async def resolve(run_id: str) -> Optional[RunState]:
+    run = RUNS.get(run_id)
+    if run is None:
+        run = await BACKEND.load(run_id)
+        if run is None:
+            return None
+    touch(run)
+    return run
 
 
 async def add_run(run: RunState) -> None:
-    async with RUNS_LOCK:
-        RUNS[run.run_id] = run
+    if READ_THROUGH:
+        await BACKEND.save_many([RunRecord(run.run_id, run.status, run)])
+        return
+    store(run)
+
+
+async def save_request(run_id: str, request: RunRequest) -> None:
+    REQUESTS[run_id] = request
+    await BACKEND.save_request(run_id, request)
+
+
+async def load_request(run_id: str) -> Optional[RunRequest]:
+    request = REQUESTS.get(run_id)
+    if request is None:
+        request = await BACKEND.load_request(run_id)
+        if request is not None:
+            REQUESTS[run_id] = request
+    return request
+
+
+async def list_unfinished_runs() -> List[str]:
+    await flush()
+    return await BACKEND.list_unfinished()
 
 
 async def get_run(run_id: str) -> Optional[RunState]:
-    async with RUNS_LOCK:
-        return RUNS.get(run_id)
+    run = RUNS.get(run_id)
+    if READ_THROUGH and (run is None or run.status in TERMINAL_STATUSES):
+        return await BACKEND.load(run_id)
+    if run is not None:
+        RUNS.move_to_end(run_id)
+        return run
+    async with run_lock(run_id):
+        return await resolve(run_id)
 
 
 async def update_run(run_id: str, **updates) -> None:
-    async with RUNS_LOCK:
-        run = RUNS.get(run_id)
+    async with run_lock(run_id):
+        run = await resolve(run_id)
         if not run:
             return
-        for key, value in updates.items():
-            setattr(run, key, value)
+        changed = {key: value for key, value in updates.items() if getattr(run, key) != value}
+        if not changed:
+            return
+        store(run.model_copy(update=changed))
+        finished = changed.get("status") in TERMINAL_STATUSES
+        if finished:
+            FINISHED_AT[run_id] = time.time()
+    publish(
+        run_id,
+        {"type": "run", "changes": {key: to_jsonable(value) for key, value in changed.items()}},
+    )
+    if finished:
+        await flush({run_id})
 
 
 async def update_step(run_id: str, step_name: str, **updates) -> None:
-    async with RUNS_LOCK:
-        run = RUNS.get(run_id)
+    async with run_lock(run_id):
+        run = await resolve(run_id)
         if not run:
             return
         step = run.steps.get(step_name)
         if not step:
             return
+        changed: Dict[str, Any] = {}
+        changes: Dict[str, Any] = {}
+        appends: Dict[str, str] = {}
         for key, value in updates.items():
-            setattr(step, key, value)
+            previous = getattr(step, key)
+            if previous == value:
+                continue
+            changed[key] = value
+            if isinstance(previous, str) and isinstance(value, str) and value.startswith(previous):
+                appends[key] = value[len(previous):]
+            else:
+                changes[key] = to_jsonable(value)
+        if not changed:
+            return
+        steps = dict(run.steps)
+        steps[step_name] = step.model_copy(update=changed)
+        store(run.model_copy(update={"steps": steps}))
+    publish(
+        run_id,
+        {"type": "step", "step": step_name, "changes": changes, "append": appends},
+    )
+    if changed.get("status") == "done":
+        await flush({run_id})
 
 
 async def mutate_run(run_id: str, mutator) -> None:
-    async with RUNS_LOCK:
-        run = RUNS.get(run_id)
+    # The mutator gets a private copy with its own steps dict and history
+    # list; it must replace StepState objects rather than modify them.
+    async with run_lock(run_id):
+        run = await resolve(run_id)
         if not run:
             return
+        run = run.model_copy(
+            update={"steps": dict(run.steps), "attempt_history": list(run.attempt_history)}
+        )
         mutator(run)
+        store(run)
+        snapshot = run.model_dump(mode="json", exclude={"attempt_history"})
+    publish(run_id, {"type": "snapshot", "run": snapshot})
+
+
+async def poll_run_events(
+    run: RunState,
+    token_steps: Iterable[str] = (),
+    keepalive_s: Optional[float] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    # Rebuilds the published event stream from stored snapshots, for runs
+    # executed by another process.
+    previous = run
+    last_event = time.monotonic()
+    while previous.status not in TERMINAL_STATUSES:
+        await asyncio.sleep(POLL_INTERVAL_S)
+        current = await get_run(run.run_id)
+        if current is None:
+            return
+        if current == previous:
+            if keepalive_s is not None and time.monotonic() - last_event > keepalive_s:
+                last_event = time.monotonic()
+                yield {"type": "keepalive"}
+            continue
+        last_event = time.monotonic()
+        for name in token_steps:
+            before = previous.steps[name].output_text or ""
+            after = current.steps[name].output_text or ""
+            if after == before:
+                continue
+            if not after.startswith(before):
+                yield {"type": "reset", "step": name}
+                before = ""
+            if after[len(before):]:
+                yield {"type": "token", "step": name, "delta": after[len(before):]}
+        yield {
+            "type": "snapshot",
+            "run": current.model_dump(mode="json", exclude={"attempt_history"}),
+        }
+        previous = current
+    yield {"type": "end", "status": previous.status}
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Dict, Iterable, Optional, Set, Tuple
+
+from app.schemas.run import RunRequest
+from app.services.pipeline import finish_run, run_pipeline
+from app.services.run_store import (
+    TERMINAL_STATUSES,
+    get_run,
+    list_unfinished_runs,
+    load_request,
+    update_step,
+)
+from app.services.scheduler import LLMScheduler, QueueFullError
+from app.storage.job_queue import get_job_queue
+
+logger = logging.getLogger("app.run_tasks")
+
+RUN_MODE = os.getenv("RUN_MODE", "inline")
+RUN_TASKS: Dict[str, asyncio.Task] = {}
+# Batch items waiting for a batch slot. They have no task yet but will get
+# one, so they count as in progress.
+PENDING_RUNS: Set[str] = set()
+DEDUP_WINDOW_S = float(os.getenv("RUN_DEDUP_WINDOW_S", "0"))
+RECENT_RUNS: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+
+def is_active(run_id: str) -> bool:
+    if run_id in PENDING_RUNS:
+        return True
+    task = RUN_TASKS.get(run_id)
+    return task is not None and not task.done()
+
+
+def hold_runs(run_ids: Iterable[str]) -> None:
+    PENDING_RUNS.update(run_ids)
+
+
+def release_held(run_ids: Iterable[str]) -> None:
+    PENDING_RUNS.difference_update(run_ids)
+
+
+def request_fingerprint(req: RunRequest) -> str:
+    material = req.model_dump_json(exclude={"priority"})
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+async def claim_run(run_id: str, req: RunRequest) -> Optional[str]:
+    # Returns the id of an identical run submitted within the window, or
+    # registers run_id as the one later duplicates map to. The lookup and the
+    # registration happen without awaiting in between, so concurrent
+    # submissions cannot both start a run.
+    if DEDUP_WINDOW_S <= 0:
+        return None
+    now = time.monotonic()
+    while RECENT_RUNS:
+        _, (_, created_at) = next(iter(RECENT_RUNS.items()))
+        if now - created_at <= DEDUP_WINDOW_S:
+            break
+        RECENT_RUNS.popitem(last=False)
+    fingerprint = request_fingerprint(req)
+    recent = RECENT_RUNS.get(fingerprint)
+    if recent is None:
+        RECENT_RUNS[fingerprint] = (run_id, now)
+        return None
+    existing_id = recent[0]
+    run = await get_run(existing_id)
+    if run is not None and run.status in ("failed", "canceled"):
+        if RECENT_RUNS.get(fingerprint) == recent:
+            RECENT_RUNS[fingerprint] = (run_id, now)
+            RECENT_RUNS.move_to_end(fingerprint)
+            return None
+        return await claim_run(run_id, req)
+    return existing_id
+
+
+def release_claim(run_id: str, req: RunRequest) -> None:
+    fingerprint = request_fingerprint(req)
+    recent = RECENT_RUNS.get(fingerprint)
+    if recent is not None and recent[0] == run_id:
+        RECENT_RUNS.pop(fingerprint)
+
+
+def track_run(run_id: str, coro: Awaitable[None]) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    RUN_TASKS[run_id] = task
+
+    def _done(_: asyncio.Task) -> None:
+        if RUN_TASKS.get(run_id) is task:
+            RUN_TASKS.pop(run_id)
+
+    task.add_done_callback(_done)
+    return task
+
+
+def warm_model(scheduler: LLMScheduler, model: str) -> None:
+    if scheduler.residency is not None:
+        scheduler.residency.warm(model)
+
+
+def launch_run(
+    run_id: str,
+    req: RunRequest,
+    scheduler: LLMScheduler,
+    resume: bool = False,
+) -> asyncio.Task:
+    warm_model(scheduler, req.model)
+    task = track_run(
+        run_id,
+        run_pipeline(run_id, req, scheduler.for_run(run_id), resume=resume),
+    )
+    task.add_done_callback(lambda _: scheduler.release_run(run_id))
+    return task
+
+
+async def admit_run(run_id: str, req: RunRequest, scheduler: LLMScheduler) -> None:
+    if RUN_MODE != "queue":
+        scheduler.admit_run(run_id, req.priority)
+        return
+    pending = await get_job_queue().pending_count()
+    if pending >= scheduler.max_queued_runs:
+        logger.warning(
+            "run_rejected run_id=%s queued_jobs=%s max_queued_runs=%s",
+            run_id,
+            pending,
+            scheduler.max_queued_runs,
+        )
+        raise QueueFullError("Run queue is full; retry later")
+
+
+async def start_run(
+    run_id: str,
+    req: RunRequest,
+    scheduler: LLMScheduler,
+    resume: bool = False,
+) -> None:
+    if RUN_MODE != "queue":
+        launch_run(run_id, req, scheduler, resume=resume)
+        return
+    warm_model(scheduler, req.model)
+    await get_job_queue().enqueue(run_id, req.priority, resume=resume)
+    logger.info("run_enqueued run_id=%s resume=%s", run_id, resume)
+
+
+async def run_in_progress(run_id: str) -> bool:
+    if RUN_MODE != "queue":
+        return is_active(run_id)
+    return await get_job_queue().has_job(run_id)
+
+
+async def request_cancel(run_id: str) -> None:
+    if RUN_MODE == "queue":
+        outcome = await get_job_queue().request_cancel(run_id)
+        if outcome == "signaled":
+            logger.info("run_cancel_signaled run_id=%s", run_id)
+            return
+    await cancel_run(run_id)
+
+
+async def cancel_run(run_id: str) -> None:
+    # A canceled batch item is no longer owned by its batch, so it can be
+    # resumed on its own.
+    PENDING_RUNS.discard(run_id)
+    task = RUN_TASKS.get(run_id)
+    if task is not None and not task.done():
+        task.cancel()
+        await asyncio.wait([task])
+    run = await get_run(run_id)
+    if run is None or run.status in TERMINAL_STATUSES:
+        return
+    for name, step in run.steps.items():
+        if step.status == "running":
+            await update_step(run_id, name, status="pending")
+    await finish_run(run_id, status="canceled", error="Canceled by request")
+    logger.info("run_canceled run_id=%s", run_id)
+
+
+async def suspend_runs() -> None:
+    tasks = [task for task in RUN_TASKS.values() if not task.done()]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.wait(tasks)
+    logger.info("runs_suspended count=%s", len(tasks))
+
+
+async def resume_unfinished_runs(scheduler: LLMScheduler) -> None:
+    resumed = 0
+    for run_id in await list_unfinished_runs():
+        if is_active(run_id):
+            continue
+        req = await load_request(run_id)
+        if req is None:
+            await finish_run(
+                run_id,
+                status="failed",
+                error="Run was interrupted and cannot be resumed",
+            )
+            continue
+        try:
+            scheduler.admit_run(run_id, req.priority)
+        except QueueFullError:
+            logger.warning("run_resume_deferred run_id=%s", run_id)
+            continue
+        launch_run(run_id, req, scheduler, resume=True)
+        resumed += 1
+    logger.info("runs_recovered count=%s", resumed)
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app.services.config import parse_model_limits
+from app.services.metrics import GENERATE_COALESCED
+from app.services.model_residency import ModelResidency
+from app.services.ollama_client import GenerateStats
+from app.services.ollama_pool import OllamaPool
+from app.services.run_store import update_run
+
+logger = logging.getLogger("app.scheduler")
+
+# Per-call bookkeeping and latency budgets that do not change the answer.
+UNKEYED_ARGS = ("stats", "timeout_s", "hedge_after_s")
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+@dataclass(order=True)
+class Waiter:
+    sort_key: Tuple[int, int, int]
+    run_id: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+@dataclass
+class ModelQueue:
+    model: str
+    limit: int
+    in_flight: int = 0
+    waiters: List[Waiter] = field(default_factory=list)
+    positions: Dict[str, int] = field(default_factory=dict)
+    report_pending: bool = False
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        client: OllamaPool,
+        max_in_flight_per_model: int = 2,
+        model_limits: Optional[Dict[str, int]] = None,
+        max_queued_runs: int = 50,
+        coalesce: bool = True,
+    ) -> None:
+        self.client = client
+        self.coalesce = coalesce
+        self.residency: Optional[ModelResidency] = None
+        self.in_flight_calls: Dict[Tuple[Any, ...], asyncio.Future] = {}
+        self.max_in_flight_per_model = max_in_flight_per_model
+        self.model_limits = model_limits or {}
+        self.max_queued_runs = max_queued_runs
+        self._queues: Dict[str, ModelQueue] = {}
+        self._runs: Dict[str, Tuple[int, int]] = {}
+        self._parents: Dict[str, str] = {}
+        self._run_seq = itertools.count()
+        self._waiter_seq = itertools.count()
+
+    @classmethod
+    def from_env(cls, client: OllamaPool) -> "LLMScheduler":
+        return cls(
+            client,
+            max_in_flight_per_model=int(os.getenv("SCHED_MAX_IN_FLIGHT_PER_MODEL", "2")),
+            model_limits=parse_model_limits(os.getenv("SCHED_MODEL_LIMITS", "")),
+            max_queued_runs=int(os.getenv("SCHED_MAX_QUEUED_RUNS", "50")),
+            coalesce=os.getenv("SCHED_COALESCE_GENERATE", "1") == "1",
+        )
+
+    def admit_run(self, run_id: str, priority: int = 0) -> None:
+        if len(self._runs) >= self.max_queued_runs:
+            logger.warning(
+                "run_rejected run_id=%s active_runs=%s max_queued_runs=%s",
+                run_id,
+                len(self._runs),
+                self.max_queued_runs,
+            )
+            raise QueueFullError("Run queue is full; retry later")
+        self._runs[run_id] = (priority, next(self._run_seq))
+
+    def attach_run(self, run_id: str, parent_id: str) -> None:
+        self._parents[run_id] = parent_id
+
+    def release_run(self, run_id: str) -> None:
+        self._runs.pop(run_id, None)
+        self._parents.pop(run_id, None)
+
+    def for_run(self, run_id: str) -> "ScheduledClient":
+        return ScheduledClient(self, run_id)
+
+    def _queue(self, model: str) -> ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            limit = self.model_limits.get(model, self.max_in_flight_per_model)
+            queue = ModelQueue(model=model, limit=max(1, limit) * len(self.client.backends))
+            self._queues[model] = queue
+        return queue
+
+    def try_acquire(self, model: str) -> bool:
+        queue = self._queue(model)
+        if queue.in_flight < queue.limit and not queue.waiters:
+            queue.in_flight += 1
+            return True
+        return False
+
+    def hedge_slot(self, model: str) -> Optional[Callable[[], None]]:
+        # A hedge is one more in-flight call, so it only goes out when the
+        # model has a free slot that no queued call is waiting for.
+        if not self.try_acquire(model):
+            return None
+        return lambda: self.release(model)
+
+    async def acquire(self, run_id: str, model: str) -> None:
+        if self.try_acquire(model):
+            return
+        queue = self._queue(model)
+
+        owner = self._parents.get(run_id, run_id)
+        priority, run_seq = self._runs.get(owner, (0, next(self._run_seq)))
+        waiter = Waiter(
+            sort_key=(-priority, run_seq, next(self._waiter_seq)),
+            run_id=run_id,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(queue.waiters, waiter)
+        self._schedule_report(queue)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(model)
+            elif waiter in queue.waiters:
+                queue.waiters.remove(waiter)
+                heapq.heapify(queue.waiters)
+                self._schedule_report(queue)
+            raise
+
+    def release(self, model: str) -> None:
+        queue = self._queues[model]
+        while queue.waiters:
+            waiter = heapq.heappop(queue.waiters)
+            if waiter.future.done():
+                continue
+            waiter.future.set_result(None)
+            self._schedule_report(queue)
+            return
+        queue.in_flight -= 1
+
+    def _schedule_report(self, queue: ModelQueue) -> None:
+        if queue.report_pending:
+            return
+        queue.report_pending = True
+        asyncio.get_running_loop().create_task(self._report_positions(queue))
+
+    async def _report_positions(self, queue: ModelQueue) -> None:
+        queue.report_pending = False
+        positions: Dict[str, int] = {}
+        for index, waiter in enumerate(sorted(queue.waiters), start=1):
+            positions.setdefault(waiter.run_id, index)
+        changed = {
+            run_id: positions.get(run_id)
+            for run_id in set(queue.positions) | set(positions)
+            if queue.positions.get(run_id) != positions.get(run_id)
+        }
+        queue.positions = positions
+        for run_id, position in changed.items():
+            await update_run(run_id, queue_position=position)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "active_runs": len(self._runs),
+            "max_queued_runs": self.max_queued_runs,
+            "models": {
+                name: {
+                    "in_flight": queue.in_flight,
+                    "limit": queue.limit,
+                    "waiting": len(queue.waiters),
+                }
+                for name, queue in self._queues.items()
+            },
+        }
+
+
+class ScheduledClient:
+    def __init__(self, scheduler: LLMScheduler, run_id: str) -> None:
+        self.scheduler = scheduler
+        self.run_id = run_id
+
+    async def _acquire(self, model: str, stats: Optional[GenerateStats]) -> None:
+        start = time.monotonic()
+        if self.scheduler.residency is not None:
+            await self.scheduler.residency.ready(model)
+        await self.scheduler.acquire(self.run_id, model)
+        if stats is not None:
+            stats.queue_ms += (time.monotonic() - start) * 1000
+
+    async def _generate(self, model: str, prompt: str, **kwargs) -> str:
+        if kwargs.get("hedge_after_s") is not None:
+            kwargs["hedge_slot"] = functools.partial(self.scheduler.hedge_slot, model)
+        await self._acquire(model, kwargs.get("stats"))
+        try:
+            return await self.scheduler.client.generate(model=model, prompt=prompt, **kwargs)
+        finally:
+            self.scheduler.release(model)
+
+    async def generate(self, model: str, prompt: str, **kwargs) -> str:
+        if not self.scheduler.coalesce:
+            return await self._generate(model, prompt, **kwargs)
+        # Identical calls that are already in flight (same model, prompt and
+        # options) wait for that call instead of queueing a duplicate. If the
+        # owner of the call is cancelled, the waiters make their own call.
+        key = (
+            model,
+            prompt,
+            *sorted((k, repr(v)) for k, v in kwargs.items() if k not in UNKEYED_ARGS),
+        )
+        shared = self.scheduler.in_flight_calls.get(key)
+        if shared is not None:
+            try:
+                text = await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise
+            else:
+                stats = kwargs.get("stats")
+                if stats is not None:
+                    stats.coalesced += 1
+                GENERATE_COALESCED.inc(model=model)
+                logger.info("generate_coalesced run_id=%s model=%s", self.run_id, model)
+                return text
+            return await self.generate(model, prompt, **kwargs)
+
+        future = asyncio.get_running_loop().create_future()
+        self.scheduler.in_flight_calls[key] = future
+        try:
+            text = await self._generate(model, prompt, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()
+            raise
+        else:
+            future.set_result(text)
+            return text
+        finally:
+            if self.scheduler.in_flight_calls.get(key) is future:
+                del self.scheduler.in_flight_calls[key]
+
+    async def generate_stream(self, model: str, prompt: str, **kwargs) -> AsyncIterator[str]:
+        await self._acquire(model, kwargs.get("stats"))
+        try:
+            async for token in self.scheduler.client.generate_stream(
+                model=model,
+                prompt=prompt,
+                **kwargs,
+            ):
+                yield token
+        finally:
+            self.scheduler.release(model)
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("app.job_queue")
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+DEFAULT_QUEUE_PATH = ROOT_DIR / ".cache" / "jobs.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    run_id TEXT PRIMARY KEY,
+    priority INTEGER NOT NULL,
+    resume INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    worker_id TEXT,
+    enqueued_at REAL NOT NULL,
+    heartbeat_at REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority, enqueued_at);
+"""
+
+
+class JobQueue:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(path),
+            check_same_thread=False,
+            timeout=30.0,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        return cls(Path(os.getenv("JOB_QUEUE_PATH", str(DEFAULT_QUEUE_PATH))).expanduser())
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    async def enqueue(self, run_id: str, priority: int, resume: bool = False) -> None:
+        await asyncio.to_thread(self._enqueue, run_id, priority, resume)
+
+    async def claim(self, worker_id: str, limit: int) -> List[Tuple[str, bool]]:
+        return await asyncio.to_thread(self._claim, worker_id, limit)
+
+    async def heartbeat(self, worker_id: str) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET heartbeat_at = ? WHERE worker_id = ? AND status = 'claimed'",
+            (time.time(), worker_id),
+        )
+
+    async def complete(self, run_id: str) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM jobs WHERE run_id = ?", (run_id,))
+
+    async def requeue(self, run_id: str) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = 'queued', resume = 1, worker_id = NULL WHERE run_id = ?",
+            (run_id,),
+        )
+
+    async def reclaim_stale(self, lease_s: float) -> int:
+        return await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = 'queued', resume = 1, worker_id = NULL "
+            "WHERE status = 'claimed' AND heartbeat_at < ?",
+            (time.time() - lease_s,),
+        )
+
+    async def request_cancel(self, run_id: str) -> Optional[str]:
+        return await asyncio.to_thread(self._request_cancel, run_id)
+
+    async def cancel_requested(self, worker_id: str) -> List[str]:
+        return await asyncio.to_thread(self._cancel_requested, worker_id)
+
+    async def has_job(self, run_id: str) -> bool:
+        return await asyncio.to_thread(self._has_job, run_id)
+
+    async def pending_count(self) -> int:
+        return await asyncio.to_thread(self._pending_count)
+
+    def _execute(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def _enqueue(self, run_id: str, priority: int, resume: bool) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (run_id, priority, resume, status, enqueued_at) "
+                "VALUES (?, ?, ?, 'queued', ?)",
+                (run_id, priority, int(resume), time.time()),
+            )
+
+    def _claim(self, worker_id: str, limit: int) -> List[Tuple[str, bool]]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT run_id, resume FROM jobs WHERE status = 'queued' "
+                    "ORDER BY priority DESC, enqueued_at LIMIT ?",
+                    (limit,),
+                ).fetchall()
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = 'claimed', worker_id = ?, heartbeat_at = ? "
+                    "WHERE run_id = ?",
+                    [(worker_id, now, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(row[0], bool(row[1])) for row in rows]
+
+    def _request_cancel(self, run_id: str) -> Optional[str]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT status FROM jobs WHERE run_id = ?",
+                    (run_id,),
+                ).fetchone()
+                if row is None:
+                    outcome = None
+                elif row[0] == "queued":
+                    self._conn.execute("DELETE FROM jobs WHERE run_id = ?", (run_id,))
+                    outcome = "dequeued"
+                else:
+                    self._conn.execute(
+                        "UPDATE jobs SET cancel_requested = 1 WHERE run_id = ?",
+                        (run_id,),
+                    )
+                    outcome = "signaled"
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return outcome
+
+    def _cancel_requested(self, worker_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT run_id FROM jobs WHERE worker_id = ? AND cancel_requested = 1",
+                (worker_id,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _has_job(self, run_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+        return row is not None
+
+    def _pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+JOB_QUEUE: Optional[JobQueue] = None
+
+
+def open_job_queue() -> JobQueue:
+    global JOB_QUEUE
+    JOB_QUEUE = JobQueue.from_env()
+    logger.info("job_queue_opened path=%s", JOB_QUEUE.path)
+    return JOB_QUEUE
+
+
+def close_job_queue() -> None:
+    global JOB_QUEUE
+    if JOB_QUEUE is not None:
+        JOB_QUEUE.close()
+        JOB_QUEUE = None
+
+
+def get_job_queue() -> JobQueue:
+    if JOB_QUEUE is None:
+        raise RuntimeError("Job queue is not open")
+    return JOB_QUEUE
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from app.schemas.run import RunRequest, RunState
+from app.services.run_store import TERMINAL_STATUSES, RunRecord, RunStoreBackend
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+DEFAULT_RUNS_PATH = ROOT_DIR / ".cache" / "runs.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS runs_finished_at ON runs (finished_at);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status);
+CREATE TABLE IF NOT EXISTS run_requests (
+    run_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+
+class SqliteRunStore(RunStoreBackend):
+    name = "sqlite"
+    persistent = True
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> "SqliteRunStore":
+        return cls(Path(os.getenv("RUN_STORE_PATH", str(DEFAULT_RUNS_PATH))).expanduser())
+
+    async def load(self, run_id: str) -> Optional[RunState]:
+        data = await asyncio.to_thread(self._load, run_id)
+        if data is None:
+            return None
+        return RunState.model_validate_json(data)
+
+    async def save_many(self, records: List[RunRecord]) -> None:
+        await asyncio.to_thread(self._save_many, records)
+
+    async def purge(self, finished_before: float) -> int:
+        return await asyncio.to_thread(self._purge, finished_before)
+
+    async def save_request(self, run_id: str, request: RunRequest) -> None:
+        await asyncio.to_thread(self._save_request, run_id, request.model_dump_json())
+
+    async def load_request(self, run_id: str) -> Optional[RunRequest]:
+        data = await asyncio.to_thread(self._load_request, run_id)
+        if data is None:
+            return None
+        return RunRequest.model_validate_json(data)
+
+    async def list_unfinished(self) -> List[str]:
+        return await asyncio.to_thread(self._list_unfinished)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _load(self, run_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM runs WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _save_many(self, records: List[RunRecord]) -> None:
+        now = time.time()
+        rows = [
+            (
+                record.run_id,
+                record.status,
+                record.run.model_dump_json(),
+                now,
+                (record.finished_at or now) if record.status in TERMINAL_STATUSES else None,
+            )
+            for record in records
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO runs (run_id, status, data, updated_at, finished_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(run_id) DO UPDATE SET status = excluded.status, "
+                "data = excluded.data, updated_at = excluded.updated_at, "
+                "finished_at = excluded.finished_at",
+                rows,
+            )
+            self._conn.commit()
+
+    def _purge(self, finished_before: float) -> int:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM run_requests WHERE run_id IN (SELECT run_id FROM runs "
+                "WHERE finished_at IS NOT NULL AND finished_at < ?)",
+                (finished_before,),
+            )
+            count = self._conn.execute(
+                "DELETE FROM runs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (finished_before,),
+            ).rowcount
+            self._conn.commit()
+        return count
+
+    def _save_request(self, run_id: str, data: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO run_requests (run_id, data) VALUES (?, ?)",
+                (run_id, data),
+            )
+            self._conn.commit()
+
+    def _load_request(self, run_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM run_requests WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _list_unfinished(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT run_id FROM runs WHERE status IN ('queued', 'running') "
+                "ORDER BY updated_at"
+            ).fetchall()
+        return [row[0] for row in rows]
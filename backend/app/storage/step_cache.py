@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("app.step_cache")
+
+ROOT_DIR = Path(__file__).resolve().parents[3]
+DEFAULT_CACHE_PATH = ROOT_DIR / ".cache" / "step_cache.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+"""
+
+
+def make_cache_key(model: str, prompt: str, options: Dict[str, Any]) -> str:
+    material = json.dumps(
+        {"model": model, "prompt": prompt, "options": options},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class StepCache:
+    def __init__(
+        self,
+        path: Path,
+        max_entries: int = 5000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_s: float = 7 * 24 * 3600,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> "StepCache":
+        return cls(
+            path=Path(os.getenv("STEP_CACHE_PATH", str(DEFAULT_CACHE_PATH))).expanduser(),
+            max_entries=int(os.getenv("STEP_CACHE_MAX_ENTRIES", "5000")),
+            max_bytes=int(os.getenv("STEP_CACHE_MAX_MB", "256")) * 1024 * 1024,
+            ttl_s=float(os.getenv("STEP_CACHE_TTL_S", str(7 * 24 * 3600))),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await asyncio.to_thread(self._get, key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def put(self, key: str, model: str, value: str) -> None:
+        await asyncio.to_thread(self._put, key, model, value)
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_s:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self.evictions += 1
+                return None
+            self._conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                (now, key),
+            )
+            self._conn.commit()
+            return value
+
+    def _put(self, key: str, model: str, value: str) -> None:
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, model, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        expired = self._conn.execute(
+            "DELETE FROM entries WHERE created_at < ?",
+            (now - self.ttl_s,),
+        ).rowcount
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        victims = []
+        if count > self.max_entries or total > self.max_bytes:
+            for key, size in self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+            ):
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                victims.append((key,))
+                count -= 1
+                total -= size
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        if expired or victims:
+            self.evictions += expired + len(victims)
+            logger.info("step_cache_evicted expired=%s lru=%s", expired, len(victims))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": count,
+            "bytes": total,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl_s,
+        }
+
+
+STEP_CACHE: Optional[StepCache] = None
+
+
+def open_step_cache() -> Optional[StepCache]:
+    global STEP_CACHE
+    if os.getenv("STEP_CACHE_ENABLED", "1") != "1":
+        logger.info("step_cache_disabled")
+        return None
+    STEP_CACHE = StepCache.from_env()
+    logger.info("step_cache_opened path=%s", STEP_CACHE.path)
+    return STEP_CACHE
+
+
+def close_step_cache() -> None:
+    global STEP_CACHE
+    if STEP_CACHE is not None:
+        STEP_CACHE.close()
+        STEP_CACHE = None
+
+
+def get_step_cache() -> Optional[StepCache]:
+    return STEP_CACHE
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import Dict, Optional
+
+from app.services.metrics import serve_metrics
+from app.services.model_residency import ModelResidency
+from app.services.ollama_pool import OllamaPool
+from app.services.pipeline import finish_run
+from app.services.prompt_loader import load_prompts
+from app.services.run_store import close_run_store, forget, load_request, open_run_store
+from app.services.run_tasks import cancel_run, launch_run, suspend_runs
+from app.services.scheduler import LLMScheduler, QueueFullError
+from app.storage.job_queue import JobQueue, close_job_queue, open_job_queue
+from app.storage.step_cache import close_step_cache, open_step_cache
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logger = logging.getLogger("app.worker")
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+WORKER_POLL_INTERVAL_S = float(os.getenv("WORKER_POLL_INTERVAL_S", "0.5"))
+WORKER_LEASE_S = float(os.getenv("WORKER_LEASE_S", "30"))
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+
+async def start_job(
+    queue: JobQueue,
+    scheduler: LLMScheduler,
+    run_id: str,
+    resume: bool,
+) -> Optional[asyncio.Task]:
+    forget(run_id)
+    req = await load_request(run_id)
+    if req is None:
+        logger.error("job_request_missing run_id=%s", run_id)
+        await finish_run(run_id, status="failed", error="Run request was not saved")
+        await queue.complete(run_id)
+        return None
+    try:
+        scheduler.admit_run(run_id, req.priority)
+    except QueueFullError:
+        await queue.requeue(run_id)
+        return None
+    logger.info("job_claimed run_id=%s resume=%s", run_id, resume)
+    return launch_run(run_id, req, scheduler, resume=resume)
+
+
+async def serve(worker_id: str, stop: asyncio.Event, metrics_port: int = 0) -> None:
+    # Runs written to a process-local memory store could never be read by the
+    # API, so a misconfigured worker stops here instead.
+    if os.getenv("RUN_STORE_BACKEND") != "sqlite":
+        raise RuntimeError("Workers require RUN_STORE_BACKEND=sqlite")
+    load_prompts()
+    client = OllamaPool.from_env()
+    await client.start()
+    scheduler = LLMScheduler.from_env(client)
+    residency = ModelResidency.from_env(client)
+    residency.start()
+    scheduler.residency = residency
+    open_step_cache()
+    await open_run_store()
+    queue = open_job_queue()
+    metrics_server = await serve_metrics(metrics_port) if metrics_port else None
+    active: Dict[str, asyncio.Task] = {}
+    last_heartbeat = 0.0
+    logger.info(
+        "worker_started worker_id=%s concurrency=%s base_urls=%s",
+        worker_id,
+        WORKER_CONCURRENCY,
+        ",".join(client.base_urls),
+    )
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            if now - last_heartbeat > WORKER_LEASE_S / 3:
+                last_heartbeat = now
+                await queue.heartbeat(worker_id)
+                reclaimed = await queue.reclaim_stale(WORKER_LEASE_S)
+                if reclaimed:
+                    logger.warning("jobs_reclaimed count=%s", reclaimed)
+
+            for run_id in await queue.cancel_requested(worker_id):
+                if run_id in active:
+                    await cancel_run(run_id)
+
+            for run_id, task in list(active.items()):
+                if task.done():
+                    active.pop(run_id)
+                    await queue.complete(run_id)
+
+            free = WORKER_CONCURRENCY - len(active)
+            if free > 0:
+                for run_id, resume in await queue.claim(worker_id, free):
+                    task = await start_job(queue, scheduler, run_id, resume)
+                    if task is not None:
+                        active[run_id] = task
+
+            waiters = [asyncio.ensure_future(stop.wait()), *active.values()]
+            await asyncio.wait(
+                waiters,
+                timeout=WORKER_POLL_INTERVAL_S,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            waiters[0].cancel()
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        await suspend_runs()
+        await residency.aclose()
+        requeued = 0
+        for run_id, task in active.items():
+            if task.cancelled():
+                await queue.requeue(run_id)
+                requeued += 1
+            else:
+                await queue.complete(run_id)
+        await close_run_store()
+        close_job_queue()
+        close_step_cache()
+        await client.aclose()
+        logger.info("worker_stopped worker_id=%s requeued=%s", worker_id, requeued)
+
+
+def run_worker(index: int) -> None:
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+    async def main() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await serve(
+            worker_id,
+            stop,
+            WORKER_METRICS_PORT + index if WORKER_METRICS_PORT else 0,
+        )
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run pipeline jobs from the job queue.")
+    parser.add_argument("--processes", type=int, default=1)
+    args = parser.parse_args()
+    if args.processes <= 1:
+        run_worker(0)
+    else:
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(index,))
+            for index in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+
+        def forward(signum: int, _frame) -> None:
+            for process in processes:
+                if process.pid is not None:
+                    os.kill(process.pid, signum)
+
+        signal.signal(signal.SIGINT, forward)
+        signal.signal(signal.SIGTERM, forward)
+        for process in processes:
+            process.join()
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from typing import List
+
+import httpx
+
+from app.services.ollama_client import OllamaClient
+from bench.stub_ollama import StubServer
+
+
+async def call_per_request_client(base_url: str) -> None:
+    client = OllamaClient(base_url=base_url, http_client=httpx.AsyncClient())
+    try:
+        await client.generate(model="stub:latest", prompt="ping", format_json=True)
+    finally:
+        await client.aclose()
+
+
+async def run_mode(base_url: str, mode: str, total: int, concurrency: int) -> List[float]:
+    shared = OllamaClient(base_url=base_url, max_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one() -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            if mode == "shared":
+                await shared.generate(model="stub:latest", prompt="ping", format_json=True)
+            else:
+                await call_per_request_client(base_url)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    try:
+        await asyncio.gather(*(one() for _ in range(total)))
+    finally:
+        await shared.aclose()
+    return latencies
+
+
+def report(mode: str, latencies: List[float], wall_s: float) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(
+        f"{mode:>12}  requests={len(ordered)}  wall_s={wall_s:.2f}  "
+        f"rps={len(ordered) / wall_s:.1f}  p50_ms={statistics.median(ordered):.2f}  p95_ms={p95:.2f}"
+    )
+
+
+async def main(total: int, concurrency: int) -> None:
+    with StubServer() as server:
+        for mode in ("per-request", "shared"):
+            await run_mode(server.base_url, mode, concurrency, concurrency)
+            start = time.perf_counter()
+            latencies = await run_mode(server.base_url, mode, total, concurrency)
+            report(mode, latencies, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-request vs pooled OllamaClient benchmark.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    logging.getLogger("app.ollama").setLevel(logging.WARNING)
+    asyncio.run(main(args.requests, args.concurrency))
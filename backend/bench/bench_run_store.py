@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from app.schemas.run import RunState, StepState
+from app.services import run_store
+from app.services.run_store import MemoryRunStore, RunRecord
+
+STEP_NAMES = ("step1", "step2", "step3", "step4", "step5", "step6")
+
+
+class SlowBackend(MemoryRunStore):
+    name = "slow-memory"
+
+    def __init__(self, load_latency_s: float) -> None:
+        self.load_latency_s = load_latency_s
+        self.records: Dict[str, RunState] = {}
+
+    async def load(self, run_id: str) -> Optional[RunState]:
+        await asyncio.sleep(self.load_latency_s)
+        return self.records.get(run_id)
+
+    async def save_many(self, records: List[RunRecord]) -> None:
+        for record in records:
+            self.records[record.run_id] = record.run
+
+
+def with_global_lock(func, lock: asyncio.Lock):
+    async def wrapper(*args, **kwargs):
+        async with lock:
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+async def simulate_run(tokens: int, update_latencies: List[float]) -> str:
+    run_id = str(uuid4())
+    await run_store.add_run(
+        RunState(run_id=run_id, steps={name: StepState() for name in STEP_NAMES})
+    )
+    await run_store.update_run(run_id, status="running", current_step=1)
+    for name in STEP_NAMES:
+        start = time.perf_counter()
+        await run_store.update_step(run_id, name, status="running")
+        update_latencies.append((time.perf_counter() - start) * 1000)
+        text = ""
+        for _ in range(tokens):
+            text += "token "
+            start = time.perf_counter()
+            await run_store.update_step(run_id, name, output_text=text)
+            update_latencies.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0)
+        await run_store.update_step(run_id, name, status="done", output_json={"ok": True})
+    await run_store.update_run(run_id, status="done", current_step=None)
+    return run_id
+
+
+async def poll(run_ids: List[str], stop: asyncio.Event, poll_latencies: List[float]) -> None:
+    while not stop.is_set():
+        if run_ids:
+            start = time.perf_counter()
+            run = await run_store.get_run(random.choice(run_ids))
+            if run is not None:
+                run.model_dump_json()
+            poll_latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.001)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def main(mode: str, runs: int, pollers: int, tokens: int, load_latency_s: float) -> None:
+    run_store.HOT_SIZE = 10
+    await run_store.open_run_store(SlowBackend(load_latency_s))
+    if mode == "global-lock":
+        lock = asyncio.Lock()
+        for name in ("add_run", "get_run", "update_run", "update_step"):
+            setattr(run_store, name, with_global_lock(getattr(run_store, name), lock))
+
+    update_latencies: List[float] = []
+    poll_latencies: List[float] = []
+    known_ids: List[str] = []
+    stop = asyncio.Event()
+
+    async def tracked_run() -> None:
+        known_ids.append(await simulate_run(tokens, update_latencies))
+
+    warmup = [asyncio.create_task(tracked_run()) for _ in range(min(20, runs))]
+    await asyncio.gather(*warmup)
+
+    pollers_tasks = [
+        asyncio.create_task(poll(known_ids, stop, poll_latencies)) for _ in range(pollers)
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(*(tracked_run() for _ in range(runs)))
+    wall_s = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*pollers_tasks)
+    await run_store.close_run_store()
+
+    print(
+        f"{mode:>12}  runs={runs} pollers={pollers} wall_s={wall_s:.2f}  "
+        f"update_p50_ms={statistics.median(update_latencies):.3f} "
+        f"update_p99_ms={percentile(update_latencies, 0.99):.3f}  "
+        f"polls={len(poll_latencies)} poll_p50_ms={statistics.median(poll_latencies):.3f} "
+        f"poll_p99_ms={percentile(poll_latencies, 0.99):.3f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run store contention benchmark.")
+    parser.add_argument("--mode", choices=("per-run", "global-lock"), default="per-run")
+    parser.add_argument("--runs", type=int, default=300)
+    parser.add_argument("--pollers", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--load-latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    logging.getLogger("app.run_store").setLevel(logging.WARNING)
+    asyncio.run(
+        main(args.mode, args.runs, args.pollers, args.tokens, args.load_latency_ms / 1000)
+    )
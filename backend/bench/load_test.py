@@ -0,0 +1,370 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.services.prompt_loader import PROMPT_PLACEHOLDERS
+from bench.stub_ollama import StubConfig, StubServer, free_port
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_PROFILE = Path(__file__).resolve().with_name("load_profile.json")
+TERMINAL_STATUSES = ("done", "failed", "canceled")
+# How a run fails when the stub's broken JSON comes back for a step and for its
+# JSON-nudge regeneration; json_failure_rate makes this expected.
+INJECTED_FAILURE = "Invalid JSON returned by model"
+SCENARIO_DEFAULTS: Dict[str, Any] = {
+    "rate": 5.0,
+    "duration_s": 20.0,
+    "poll_interval_s": 0.2,
+    "timeout_s": 60.0,
+    "judge_strictness": 3,
+    "max_retries": 2,
+    "candidates": 1,
+    "latency_ms": 20.0,
+    "token_rate": 0.0,
+    "json_failure_rate": 0.0,
+    "judge_scores": "5",
+    "answer_words": 40,
+    "seed": 0,
+    "server_env": {"SCHED_MAX_IN_FLIGHT_PER_MODEL": "16"},
+}
+
+
+@dataclass
+class RunResult:
+    status: str
+    latency_ms: Optional[float] = None
+    error: Optional[str] = None
+    steps: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def write_prompts(path: Path) -> None:
+    for filename, placeholders in PROMPT_PLACEHOLDERS.items():
+        body = "\n".join(f"{name}: {{{name}}}" for name in sorted(placeholders))
+        (path / filename).write_text(f"{filename}\n{body}\n", encoding="utf-8")
+
+
+class ProcessSampler:
+    # Reads /proc directly so the harness needs no extra dependency; on
+    # platforms without it, CPU and memory are reported as unavailable.
+    def __init__(self, pid: int, interval_s: float = 0.5) -> None:
+        self.pid = pid
+        self.interval_s = interval_s
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.cpu_samples: List[float] = []
+        self.rss_mb: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            fields = Path(f"/proc/{self.pid}/stat").read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss(self) -> Optional[float]:
+        try:
+            for line in Path(f"/proc/{self.pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+        return None
+
+    async def _loop(self) -> None:
+        previous = self.cpu_seconds()
+        previous_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval_s)
+            current = self.cpu_seconds()
+            now = time.monotonic()
+            if current is not None and previous is not None:
+                self.cpu_samples.append((current - previous) / (now - previous_at) * 100)
+            previous, previous_at = current, now
+            rss = self.rss()
+            if rss is not None:
+                self.rss_mb.append(rss)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def start_api(port: int, ollama_url: str, prompts_dir: Path, extra_env: Dict[str, str]) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OLLAMA_BASE_URL": ollama_url,
+        "OLLAMA_BASE_URLS": "",
+        "PROMPTS_DIR": str(prompts_dir),
+        "LOG_LEVEL": "WARNING",
+        "STEP_CACHE_ENABLED": "0",
+        "SCHED_MAX_QUEUED_RUNS": "10000",
+        **extra_env,
+    }
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited with code {process.returncode}")
+        try:
+            if (await client.get("/healthz")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("API server did not become ready")
+
+
+async def drive_run(
+    client: httpx.AsyncClient,
+    index: int,
+    scenario: Dict[str, Any],
+    poll_latencies: List[float],
+) -> RunResult:
+    payload = {
+        "question": f"Load test question {index}: describe a project you led.",
+        "jd_text": "Senior backend engineer. Python, asyncio, distributed systems.",
+        "resume_text": "Eight years building Python services and data pipelines.",
+        "custom_prompt_text": "Keep it under 150 words.",
+        "model": "stub:latest",
+        "judge_strictness": scenario["judge_strictness"],
+        "max_retries": scenario["max_retries"],
+        "candidates": scenario["candidates"],
+    }
+    start = time.monotonic()
+    try:
+        response = await client.post("/api/run", json=payload)
+    except httpx.HTTPError:
+        return RunResult(status="error")
+    if response.status_code == 429:
+        return RunResult(status="rejected")
+    if response.status_code != 200:
+        return RunResult(status="error")
+    run_id = response.json()["run_id"]
+
+    while time.monotonic() - start < scenario["timeout_s"]:
+        await asyncio.sleep(scenario["poll_interval_s"])
+        poll_start = time.monotonic()
+        try:
+            response = await client.get(
+                f"/api/run/{run_id}",
+                params={"fields": "status,error,steps", "include_history": "false"},
+            )
+        except httpx.HTTPError:
+            continue
+        poll_latencies.append((time.monotonic() - poll_start) * 1000)
+        run = response.json()
+        if run["status"] in TERMINAL_STATUSES:
+            return RunResult(
+                status=run["status"],
+                latency_ms=(time.monotonic() - start) * 1000,
+                error=run.get("error"),
+                steps={
+                    name: step["metrics"]
+                    for name, step in run["steps"].items()
+                    if step.get("metrics")
+                },
+            )
+    return RunResult(status="timeout")
+
+
+def summarize(
+    results: List[RunResult],
+    wall_s: float,
+    poll_latencies: List[float],
+    sampler: ProcessSampler,
+    stub_requests: int,
+    stub_loads: int = 0,
+) -> Dict[str, Any]:
+    latencies = [result.latency_ms for result in results if result.status == "done"]
+    counts: Dict[str, int] = {}
+    injected = 0
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+        if result.status == "failed" and (result.error or "").startswith(INJECTED_FAILURE):
+            injected += 1
+    steps: Dict[str, Dict[str, float]] = {}
+    for name in sorted({name for result in results for name in result.steps}):
+        durations = [r.steps[name]["duration_ms"] for r in results if name in r.steps]
+        queued = [r.steps[name]["queue_ms"] for r in results if name in r.steps]
+        steps[name] = {
+            "p50_ms": round(percentile(durations, 0.5), 2),
+            "p95_ms": round(percentile(durations, 0.95), 2),
+            "queue_p95_ms": round(percentile(queued, 0.95), 2),
+        }
+    return {
+        "submitted": len(results),
+        "statuses": counts,
+        "error_rate": round(1 - counts.get("done", 0) / max(1, len(results)), 4),
+        "injected_failures": injected,
+        "unexpected_error_rate": round(
+            1 - (counts.get("done", 0) + injected) / max(1, len(results)), 4
+        ),
+        "throughput_rps": round(counts.get("done", 0) / wall_s, 3),
+        "p50_ms": round(percentile(latencies, 0.5), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "poll_p50_ms": round(percentile(poll_latencies, 0.5), 2),
+        "poll_p99_ms": round(percentile(poll_latencies, 0.99), 2),
+        "steps": steps,
+        "cpu_avg_pct": round(statistics.mean(sampler.cpu_samples), 1) if sampler.cpu_samples else None,
+        "cpu_max_pct": round(max(sampler.cpu_samples), 1) if sampler.cpu_samples else None,
+        "rss_max_mb": round(max(sampler.rss_mb), 1) if sampler.rss_mb else None,
+        "ollama_calls": stub_requests,
+        "ollama_loads": stub_loads,
+    }
+
+
+def check_thresholds(summary: Dict[str, Any], thresholds: Dict[str, float]) -> List[str]:
+    failures = []
+    for key, limit in thresholds.items():
+        name = key[len("max_"):] if key.startswith("max_") else key[len("min_"):]
+        value = summary.get(name)
+        if value is None:
+            continue
+        if key.startswith("max_") and value > limit:
+            failures.append(f"{name}={value} exceeds {limit}")
+        if key.startswith("min_") and value < limit:
+            failures.append(f"{name}={value} is below {limit}")
+    return failures
+
+
+async def main(scenario: Dict[str, Any], thresholds: Dict[str, float]) -> int:
+    stub_config = StubConfig(
+        latency_s=scenario["latency_ms"] / 1000,
+        token_rate=scenario["token_rate"],
+        json_failure_rate=scenario["json_failure_rate"],
+        judge_scores=tuple(float(score) for score in str(scenario["judge_scores"]).split(",")),
+        answer_words=scenario["answer_words"],
+        seed=scenario["seed"],
+    )
+    port = free_port()
+    with StubServer(config=stub_config) as stub, tempfile.TemporaryDirectory() as prompts_dir:
+        write_prompts(Path(prompts_dir))
+        process = start_api(port, stub.base_url, Path(prompts_dir), scenario["server_env"])
+        limits = httpx.Limits(max_connections=1000, max_keepalive_connections=200)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}",
+            limits=limits,
+            timeout=30,
+        ) as client:
+            try:
+                await wait_ready(client, process)
+                sampler = ProcessSampler(process.pid)
+                sampler.start()
+                poll_latencies: List[float] = []
+                total = max(1, int(scenario["rate"] * scenario["duration_s"]))
+                start = time.monotonic()
+                tasks = []
+                for index in range(total):
+                    delay = start + index / scenario["rate"] - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    tasks.append(
+                        asyncio.create_task(drive_run(client, index, scenario, poll_latencies))
+                    )
+                results = await asyncio.gather(*tasks)
+                wall_s = time.monotonic() - start
+                await sampler.stop()
+                summary = summarize(
+                    results,
+                    wall_s,
+                    poll_latencies,
+                    sampler,
+                    stub.requests,
+                    stub.loads,
+                )
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    print(json.dumps({"scenario": scenario, "summary": summary}, indent=2))
+    failures = check_thresholds(summary, thresholds)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end load test against a fake Ollama.")
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        default=DEFAULT_PROFILE,
+        help=f"scenario and thresholds file (default: {DEFAULT_PROFILE.name})",
+    )
+    parser.add_argument("--no-check", action="store_true", help="report without thresholds")
+    for name, default in SCENARIO_DEFAULTS.items():
+        if name == "server_env":
+            continue
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=None)
+    parser.add_argument(
+        "--server-env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="extra environment for the API server",
+    )
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    profile: Dict[str, Any] = json.loads(args.profile.read_text(encoding="utf-8"))
+    scenario = {**SCENARIO_DEFAULTS, **profile.get("scenario", {})}
+    for name in SCENARIO_DEFAULTS:
+        value = getattr(args, name)
+        if name != "server_env" and value is not None:
+            scenario[name] = value
+    scenario["server_env"] = {
+        **scenario["server_env"],
+        **dict(item.split("=", 1) for item in args.server_env),
+    }
+    thresholds = {} if args.no_check else profile.get("thresholds", {})
+    sys.exit(asyncio.run(main(scenario, thresholds)))
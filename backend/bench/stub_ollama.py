@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+STUB_LATENCY_S = float(os.getenv("STUB_LATENCY_S", "0.005"))
+BROKEN_JSON = '```json\n{"answer": "stub answer", "score": '
+
+
+@dataclass
+class StubConfig:
+    latency_s: float = STUB_LATENCY_S
+    token_rate: float = float(os.getenv("STUB_TOKEN_RATE", "0"))
+    json_failure_rate: float = float(os.getenv("STUB_JSON_FAILURE_RATE", "0"))
+    judge_scores: Tuple[float, ...] = tuple(
+        float(score) for score in os.getenv("STUB_JUDGE_SCORES", "5").split(",")
+    )
+    answer_words: int = int(os.getenv("STUB_ANSWER_WORDS", "2"))
+    models: Tuple[str, ...] = tuple(os.getenv("STUB_MODELS", "stub:latest").split(","))
+    seed: int = int(os.getenv("STUB_SEED", "0"))
+
+
+@dataclass
+class StubState:
+    config: StubConfig = field(default_factory=StubConfig)
+    last_prompt: Dict[str, str] = field(default_factory=dict)
+    seen: Dict[str, int] = field(default_factory=dict)
+    loaded: Dict[str, float] = field(default_factory=dict)
+    requests: int = 0
+    loads: int = 0
+
+
+app = FastAPI(title="Stub Ollama")
+STATE = StubState()
+
+
+def configure(config: StubConfig) -> None:
+    STATE.config = config
+    STATE.last_prompt.clear()
+    STATE.seen.clear()
+    STATE.loaded.clear()
+    STATE.requests = 0
+    STATE.loads = 0
+
+
+def request_rng(model: str, prompt: str) -> random.Random:
+    # Seeded by the prompt and how often it has been seen, so a replayed
+    # workload gets the same failures and scores regardless of arrival order.
+    key = f"{model}\0{prompt}"
+    count = STATE.seen.get(key, 0)
+    STATE.seen[key] = count + 1
+    return random.Random(f"{STATE.config.seed}:{count}:{key}")
+
+
+def response_text(payload: Dict[str, Any], rng: random.Random) -> str:
+    config = STATE.config
+    answer = " ".join(["stub"] * max(1, config.answer_words))
+    if not payload.get("format"):
+        return answer
+    if rng.random() < config.json_failure_rate:
+        return BROKEN_JSON
+    return json.dumps(
+        {
+            "answer": answer,
+            "evidence_map": {},
+            "score": rng.choice(config.judge_scores),
+            "reasons": [],
+            "fixes": [],
+        }
+    )
+
+
+def split_tokens(text: str) -> List[str]:
+    return [text[index : index + 4] for index in range(0, len(text), 4)] or [""]
+
+
+def eval_stats(model: str, prompt: str, text: str) -> Dict[str, Any]:
+    previous = STATE.last_prompt.get(model, "")
+    STATE.last_prompt[model] = prompt
+    shared = len(os.path.commonprefix([previous, prompt]))
+    prompt_eval_count = max(1, (len(prompt) - shared) // 4)
+    eval_count = len(split_tokens(text))
+    token_s = 1 / STATE.config.token_rate if STATE.config.token_rate else 0.001
+    return {
+        "prompt_eval_count": prompt_eval_count,
+        "prompt_eval_duration": prompt_eval_count * 200_000,
+        "eval_count": eval_count,
+        "eval_duration": int(eval_count * token_s * 1e9),
+        "load_duration": 0,
+        "total_duration": int((STATE.config.latency_s + eval_count * token_s) * 1e9),
+    }
+
+
+@app.post("/api/generate")
+async def generate(payload: Dict[str, Any]):
+    model = payload.get("model")
+    prompt = payload.get("prompt", "")
+    STATE.loaded[model] = time.time()
+    if not prompt:
+        # Like Ollama, a request without a prompt only loads the model.
+        STATE.loads += 1
+        return {
+            "model": model,
+            "response": "",
+            "done": True,
+            "done_reason": "load",
+            "load_duration": 0,
+        }
+    STATE.requests += 1
+    config = STATE.config
+    await asyncio.sleep(config.latency_s)
+    text = response_text(payload, request_rng(model, prompt))
+    stats = eval_stats(model, prompt, text)
+    tokens = split_tokens(text)
+    token_s = 1 / config.token_rate if config.token_rate else 0.0
+    if not payload.get("stream", True):
+        await asyncio.sleep(token_s * len(tokens))
+        return {"model": model, "response": text, "done": True, **stats}
+
+    async def chunks():
+        for token in tokens:
+            if token_s:
+                await asyncio.sleep(token_s)
+            yield json.dumps({"model": model, "response": token, "done": False}) + "\n"
+        yield json.dumps({"model": model, "response": "", "done": True, **stats}) + "\n"
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+@app.get("/api/tags")
+async def tags() -> Dict[str, Any]:
+    return {
+        "models": [
+            {"name": name, "size": 0, "details": {"family": "stub"}}
+            for name in STATE.config.models
+        ]
+    }
+
+
+@app.get("/api/ps")
+async def running() -> Dict[str, Any]:
+    return {
+        "models": [
+            {
+                "name": name,
+                "size_vram": 0,
+                "expires_at": (
+                    datetime.fromtimestamp(loaded_at, timezone.utc) + timedelta(minutes=5)
+                ).isoformat(),
+            }
+            for name, loaded_at in STATE.loaded.items()
+        ]
+    }
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class StubServer:
+    def __init__(self, port: int | None = None, config: Optional[StubConfig] = None) -> None:
+        self.port = port or free_port()
+        configure(config or StubConfig())
+        server_config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(server_config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def requests(self) -> int:
+        return STATE.requests
+
+    @property
+    def loads(self) -> int:
+        return STATE.loads
+
+    def __enter__(self) -> "StubServer":
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Stub Ollama server did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deterministic fake Ollama server.")
+    parser.add_argument("--port", type=int, default=int(os.getenv("STUB_PORT", "11435")))
+    parser.add_argument("--latency-ms", type=float, default=STUB_LATENCY_S * 1000)
+    parser.add_argument("--token-rate", type=float, default=StubConfig.token_rate)
+    parser.add_argument("--json-failure-rate", type=float, default=StubConfig.json_failure_rate)
+    parser.add_argument("--judge-scores", default=",".join(map(str, StubConfig.judge_scores)))
+    parser.add_argument("--answer-words", type=int, default=StubConfig.answer_words)
+    parser.add_argument("--models", default=",".join(StubConfig.models))
+    parser.add_argument("--seed", type=int, default=StubConfig.seed)
+    args = parser.parse_args()
+    configure(
+        StubConfig(
+            latency_s=args.latency_ms / 1000,
+            token_rate=args.token_rate,
+            json_failure_rate=args.json_failure_rate,
+            judge_scores=tuple(float(score) for score in args.judge_scores.split(",")),
+            answer_words=args.answer_words,
+            models=tuple(args.models.split(",")),
+            seed=args.seed,
+        )
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+from app.schemas.run import BatchRequest
+from app.services import batch, run_tasks
+from app.services.pipeline import finish_run
+from app.services.run_store import get_run
+from app.services.scheduler import LLMScheduler
+
+
+@pytest.fixture
+def pipeline_calls(monkeypatch) -> Dict[str, object]:
+    state: Dict[str, object] = {"calls": [], "gate": None}
+
+    async def fake_shared_analysis(record, req, scheduler):
+        return {}
+
+    async def fake_pipeline(run_id, req, client, shared_steps=None, resume=False):
+        calls: List[str] = state["calls"]
+        calls.append(run_id)
+        gate = state["gate"]
+        if gate is not None:
+            await gate.wait()
+        await finish_run(run_id, status="done")
+
+    monkeypatch.setattr(batch, "run_shared_analysis", fake_shared_analysis)
+    monkeypatch.setattr(batch, "run_pipeline", fake_pipeline)
+    monkeypatch.setattr(run_tasks, "run_pipeline", fake_pipeline)
+    return state
+
+
+def batch_request(questions: int) -> BatchRequest:
+    return BatchRequest(
+        questions=[f"Question {index}" for index in range(questions)],
+        jd_text="Backend engineer.",
+        resume_text="Python services.",
+        model="stub:latest",
+        concurrency=1,
+    )
+
+
+async def start_blocked_batch(state: Dict[str, object], questions: int):
+    state["gate"] = asyncio.Event()
+    scheduler = LLMScheduler(client=None)
+    record = await batch.create_batch(batch_request(questions), scheduler)
+    while not state["calls"]:
+        await asyncio.sleep(0)
+    return record, scheduler
+
+
+def test_canceled_queued_item_does_not_run(pipeline_calls):
+    async def scenario():
+        record, _ = await start_blocked_batch(pipeline_calls, 3)
+        queued = record.run_ids[1]
+        assert await run_tasks.run_in_progress(queued)
+        await run_tasks.request_cancel(queued)
+        pipeline_calls["gate"].set()
+        await record.task
+        statuses = [(await get_run(run_id)).status for run_id in record.run_ids]
+        assert statuses == ["done", "canceled", "done"]
+        assert queued not in pipeline_calls["calls"]
+
+    asyncio.run(scenario())
+
+
+def test_queued_item_is_not_resumed_twice(pipeline_calls):
+    async def scenario():
+        record, scheduler = await start_blocked_batch(pipeline_calls, 2)
+        queued = record.run_ids[1]
+        # What POST /run/{id}/resume checks before starting a pipeline.
+        assert await run_tasks.run_in_progress(queued)
+
+        await run_tasks.request_cancel(queued)
+        assert not await run_tasks.run_in_progress(queued)
+        request = batch.item_request(batch_request(2), "Question 1")
+        scheduler.admit_run(queued, request.priority)
+        resumed = run_tasks.launch_run(queued, request, scheduler, resume=True)
+        pipeline_calls["gate"].set()
+        await asyncio.gather(record.task, resumed)
+        assert pipeline_calls["calls"].count(queued) == 1
+        assert (await get_run(queued)).status == "done"
+
+    asyncio.run(scenario())
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import pytest
+
+from app.services.json_repair import JsonRepairError, parse_json
+from app.services.pipeline import ANSWER_SCHEMA
+
+
+def test_null_answer_is_a_schema_error():
+    with pytest.raises(JsonRepairError, match=r"\$\.answer must be a string"):
+        parse_json('{"answer": null}', ANSWER_SCHEMA)
+
+
+def test_number_answer_is_spelled_out():
+    assert parse_json('{"answer": 42}', ANSWER_SCHEMA) == ({"answer": "42"}, True)
+
+
+@pytest.mark.parametrize("evidence_map", ['{"Led a team": "Resume line"}', '["Resume line"]', "null"])
+def test_evidence_map_shapes(evidence_map):
+    output, repaired = parse_json(f'{{"answer": "a", "evidence_map": {evidence_map}}}', ANSWER_SCHEMA)
+    assert output["answer"] == "a"
+    assert not repaired
+
+
+def test_evidence_map_string_is_a_schema_error():
+    with pytest.raises(JsonRepairError, match="object or array or null"):
+        parse_json('{"answer": "a", "evidence_map": "Resume line"}', ANSWER_SCHEMA)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import httpx
+
+from app.services.ollama_client import GenerateStats, OllamaClient
+from app.services.scheduler import LLMScheduler
+
+
+class SlowOllama:
+    def __init__(self, delay_s: float) -> None:
+        self.delay_s = delay_s
+        self.in_flight = 0
+        self.peak = 0
+        self.requests = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay_s)
+        finally:
+            self.in_flight -= 1
+        body = json.loads(request.content)
+        return httpx.Response(200, json={"model": body["model"], "response": "ok", "done": True})
+
+
+class SingleBackend:
+    def __init__(self, client: OllamaClient) -> None:
+        self.client = client
+        self.backends = [client]
+
+    async def generate(self, model: str, prompt: str, **kwargs) -> str:
+        return await self.client.generate(model=model, prompt=prompt, **kwargs)
+
+
+def run_calls(limit: int, calls: int):
+    ollama = SlowOllama(delay_s=0.05)
+    stats = [GenerateStats() for _ in range(calls)]
+
+    async def scenario():
+        http = httpx.AsyncClient(transport=httpx.MockTransport(ollama))
+        client = OllamaClient(base_url="http://ollama", http_client=http)
+        scheduler = LLMScheduler(SingleBackend(client), max_in_flight_per_model=limit)
+        await asyncio.gather(
+            *(
+                scheduler.for_run(f"run-{index}").generate(
+                    model="stub",
+                    prompt=f"prompt {index}",
+                    stats=stats[index],
+                    hedge_after_s=0.01,
+                )
+                for index in range(calls)
+            )
+        )
+        await http.aclose()
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    return ollama, stats, scheduler
+
+
+def test_hedge_is_skipped_when_the_model_is_at_its_limit():
+    ollama, stats, scheduler = run_calls(limit=2, calls=2)
+    assert ollama.peak <= 2
+    assert ollama.requests == 2
+    assert sum(item.hedged for item in stats) == 0
+    assert scheduler.stats()["models"]["stub"]["in_flight"] == 0
+
+
+def test_hedge_takes_a_free_slot():
+    ollama, stats, scheduler = run_calls(limit=2, calls=1)
+    assert ollama.peak == 2
+    assert stats[0].hedged == 1
+    assert scheduler.stats()["models"]["stub"]["in_flight"] == 0
+
+
+def test_request_time_is_measured_by_the_client():
+    _, stats, _ = run_calls(limit=1, calls=1)
+    # The fake server reports no total_duration; the client still measures
+    # the wall-clock time the request took.
+    assert stats[0].total_ms == 0
+    assert stats[0].request_ms >= 50
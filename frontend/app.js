@@ -2,11 +2,14 @@ const form = document.getElementById("run-form");
 const modelsList = document.getElementById("models");
 const modelsStatus = document.getElementById("models-status");
 const refreshBtn = document.getElementById("refresh-models");
+const modelInput = document.getElementById("model");
 
 const strictnessInput = document.getElementById("strictness");
 const strictnessValue = document.getElementById("strictness-value");
 const retriesInput = document.getElementById("retries");
 const retriesValue = document.getElementById("retries-value");
+const candidatesInput = document.getElementById("candidates");
+const candidatesValue = document.getElementById("candidates-value");
 
 const runStatus = document.getElementById("run-status");
 const runId = document.getElementById("run-id");
@@ -16,7 +19,12 @@ const stepsEl = document.getElementById("steps");
 const finalOutput = document.getElementById("final-output");
 const judgeReport = document.getElementById("judge-report");
 
+const STEP_ORDER = ["step1", "step2", "step3", "step4", "step5", "step6"];
+const TERMINAL_STATUSES = ["done", "failed", "canceled"];
+
 let pollingHandle = null;
+let eventSource = null;
+let currentRun = null;
 
 function setSliderValue(input, output) {
   output.textContent = input.value;
@@ -24,6 +32,7 @@ function setSliderValue(input, output) {
 
 setSliderValue(strictnessInput, strictnessValue);
 setSliderValue(retriesInput, retriesValue);
+setSliderValue(candidatesInput, candidatesValue);
 
 strictnessInput.addEventListener("input", () =>
   setSliderValue(strictnessInput, strictnessValue)
@@ -31,105 +40,153 @@ strictnessInput.addEventListener("input", () =>
 retriesInput.addEventListener("input", () =>
   setSliderValue(retriesInput, retriesValue)
 );
+candidatesInput.addEventListener("input", () =>
+  setSliderValue(candidatesInput, candidatesValue)
+);
+
+function formatSize(bytes) {
+  if (!bytes) {
+    return "";
+  }
+  return `${(bytes / 1024 ** 3).toFixed(1)} GB`;
+}
+
+function modelLabel(info) {
+  const loaded = info.load_state === "loaded" ? "loaded" : info.load_state === "loading" ? "loading" : "";
+  return [info.family, info.parameter_size, info.quantization_level, formatSize(info.size), loaded]
+    .filter(Boolean)
+    .join(" · ");
+}
+
+async function warmModel(model) {
+  if (!model) {
+    return;
+  }
+  try {
+    await fetch("/api/models/warm", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ model }),
+    });
+  } catch (err) {
+    // Warming is best effort; the run loads the model anyway.
+  }
+}
 
-async function loadModels() {
+async function loadModels(refresh = false) {
   modelsStatus.textContent = "Loading models...";
   modelsStatus.dataset.state = "loading";
   modelsList.innerHTML = "";
   try {
-    const res = await fetch("/api/models");
+    const res = await fetch(refresh ? "/api/models?refresh=true" : "/api/models");
     const data = await res.json();
     if (!res.ok) {
       throw new Error(data.error || "Failed to load models");
     }
-    if (data.error) {
-      throw new Error(data.error);
-    }
     const models = Array.isArray(data.models) ? data.models : [];
-    if (models.length) {
-      models.forEach((model) => {
-        const option = document.createElement("option");
-        option.value = model;
-        modelsList.appendChild(option);
-      });
+    if (data.error && !models.length) {
+      throw new Error(data.error);
     }
+    const details = new Map((data.details || []).map((info) => [info.name, info]));
+    models.forEach((model) => {
+      const option = document.createElement("option");
+      option.value = model;
+      const label = details.has(model) ? modelLabel(details.get(model)) : "";
+      if (label) {
+        option.label = label;
+      }
+      modelsList.appendChild(option);
+    });
     modelsStatus.textContent = models.length
-      ? `${models.length} model(s) available`
+      ? `${models.length} model(s) available${data.stale ? " (refreshing)" : ""}`
       : "No models returned. Check Ollama.";
   } catch (err) {
     modelsStatus.textContent = `Model list error: ${err.message}`;
   }
 }
 
-refreshBtn.addEventListener("click", loadModels);
-window.addEventListener("load", loadModels);
+refreshBtn.addEventListener("click", () => loadModels(true));
+modelInput.addEventListener("change", () => warmModel(modelInput.value.trim()));
+window.addEventListener("load", () => loadModels());
 
 function clearPolling() {
   if (pollingHandle) {
     clearTimeout(pollingHandle);
     pollingHandle = null;
   }
+  if (eventSource) {
+    eventSource.close();
+    eventSource = null;
+  }
 }
 
 function updateRunMeta(run) {
   runId.textContent = run.run_id || "--";
   runState.textContent = run.status || "--";
   runAttempt.textContent = run.attempt ?? "--";
+  const queued = run.queue_position
+    ? ` (queue position ${run.queue_position})`
+    : "";
   runStatus.textContent = run.error
     ? `Run failed: ${run.error}`
     : run.status
-    ? `Run status: ${run.status}`
+    ? `Run status: ${run.status}${queued}`
     : "Waiting for a run.";
 }
 
-function renderSteps(run) {
-  const order = ["step1", "step2", "step3", "step4", "step5", "step6"];
-  stepsEl.innerHTML = "";
-  order.forEach((key) => {
-    const step = run.steps?.[key];
-    const status = step?.status || "pending";
+function createStepElement(key) {
+  const wrapper = document.createElement("div");
+  wrapper.dataset.step = key;
 
-    const wrapper = document.createElement("div");
-    wrapper.className = `step step--${status}`;
+  const header = document.createElement("div");
+  header.className = "step__header";
 
-    const header = document.createElement("div");
-    header.className = "step__header";
+  const name = document.createElement("div");
+  name.className = "step__name";
+  name.textContent = key.toUpperCase();
 
-    const name = document.createElement("div");
-    name.className = "step__name";
-    name.textContent = key.toUpperCase();
+  const pill = document.createElement("div");
+  pill.className = "pill";
 
-    const pill = document.createElement("div");
-    pill.className = "pill";
-    pill.textContent = status;
+  header.appendChild(name);
+  header.appendChild(pill);
 
-    header.appendChild(name);
-    header.appendChild(pill);
+  const details = document.createElement("details");
+  const summary = document.createElement("summary");
+  summary.textContent = "Details";
+  details.appendChild(summary);
 
-    const details = document.createElement("details");
-    const summary = document.createElement("summary");
-    summary.textContent = "Details";
-    details.appendChild(summary);
-
-    const body = document.createElement("pre");
-    body.className = "output";
-
-    if (step?.error) {
-      body.textContent = step.error;
-    } else if (step?.output_text) {
-      body.textContent = step.output_text;
-    } else if (step?.output_json) {
-      body.textContent = JSON.stringify(step.output_json, null, 2);
-    } else {
-      body.textContent = "No output yet.";
-    }
+  const body = document.createElement("pre");
+  body.className = "output";
+  details.appendChild(body);
 
-    details.appendChild(body);
+  wrapper.appendChild(header);
+  wrapper.appendChild(details);
+  stepsEl.appendChild(wrapper);
+  return wrapper;
+}
 
-    wrapper.appendChild(header);
-    wrapper.appendChild(details);
-    stepsEl.appendChild(wrapper);
-  });
+function renderStep(key, step) {
+  const wrapper =
+    stepsEl.querySelector(`[data-step="${key}"]`) || createStepElement(key);
+  const status = step?.status || "pending";
+  wrapper.className = `step step--${status}`;
+  wrapper.querySelector(".pill").textContent = status;
+
+  const body = wrapper.querySelector(".output");
+  if (step?.error) {
+    body.textContent = step.error;
+  } else if (step?.output_text) {
+    body.textContent = step.output_text;
+  } else if (step?.output_json) {
+    body.textContent = JSON.stringify(step.output_json, null, 2);
+  } else {
+    body.textContent = "No output yet.";
+  }
+}
+
+function renderSteps(run) {
+  STEP_ORDER.forEach((key) => renderStep(key, run.steps?.[key]));
 }
 
 function renderJudgeReport(report) {
@@ -194,17 +251,79 @@ function renderJudgeReport(report) {
 function renderRun(run) {
   updateRunMeta(run);
   renderSteps(run);
-  finalOutput.textContent = run.final_output || "--";
+  renderFinalOutput(run);
   renderJudgeReport(run.judge_report);
 }
 
+function renderFinalOutput(run) {
+  const streaming = run.steps?.step5?.status === "running";
+  finalOutput.textContent =
+    run.final_output || (streaming && run.steps.step5.output_text) || "--";
+}
+
+function applyRunEvent(event) {
+  if (event.type === "snapshot") {
+    currentRun = event.run;
+    stepsEl.innerHTML = "";
+    renderRun(currentRun);
+    return;
+  }
+  if (!currentRun) {
+    return;
+  }
+  if (event.type === "run") {
+    Object.assign(currentRun, event.changes);
+    updateRunMeta(currentRun);
+    renderFinalOutput(currentRun);
+    if ("judge_report" in event.changes) {
+      renderJudgeReport(currentRun.judge_report);
+    }
+  } else if (event.type === "step") {
+    const step = currentRun.steps[event.step] || {};
+    Object.assign(step, event.changes);
+    Object.entries(event.append || {}).forEach(([key, delta]) => {
+      step[key] = (step[key] || "") + delta;
+    });
+    currentRun.steps[event.step] = step;
+    renderStep(event.step, step);
+    renderFinalOutput(currentRun);
+  }
+}
+
+function watchRun(runIdValue) {
+  if (!window.EventSource) {
+    pollRun(runIdValue);
+    return;
+  }
+  currentRun = null;
+  let finished = false;
+  eventSource = new EventSource(`/api/run/${runIdValue}/events`);
+  ["snapshot", "run", "step"].forEach((type) =>
+    eventSource.addEventListener(type, (message) =>
+      applyRunEvent(JSON.parse(message.data))
+    )
+  );
+  eventSource.addEventListener("end", () => {
+    finished = true;
+    clearPolling();
+  });
+  eventSource.onerror = () => {
+    if (finished) {
+      return;
+    }
+    clearPolling();
+    runStatus.textContent = "Live updates lost. Falling back to polling...";
+    pollRun(runIdValue);
+  };
+}
+
 async function pollRun(runIdValue) {
   try {
-    const res = await fetch(`/api/run/${runIdValue}`);
+    const res = await fetch(`/api/run/${runIdValue}?include_history=false`);
     const data = await res.json();
     renderRun(data);
 
-    if (["queued", "running"].includes(data.status)) {
+    if (!TERMINAL_STATUSES.includes(data.status)) {
       pollingHandle = setTimeout(() => pollRun(runIdValue), 1200);
     } else {
       clearPolling();
@@ -237,6 +356,7 @@ form.addEventListener("submit", async (event) => {
     model,
     judge_strictness: Number(strictnessInput.value),
     max_retries: Number(retriesInput.value),
+    candidates: Number(candidatesInput.value),
   };
 
   if (customPromptText) {
@@ -257,9 +377,9 @@ form.addEventListener("submit", async (event) => {
         : data?.error || "Failed to start run";
       throw new Error(message);
     }
-    runStatus.textContent = "Run created. Polling status...";
+    runStatus.textContent = "Run created. Waiting for updates...";
     runId.textContent = data.run_id || "--";
-    pollRun(data.run_id);
+    watchRun(data.run_id);
   } catch (err) {
     runStatus.textContent = `Run failed: ${err.message}`;
   }